@@ -1,3 +1,11 @@
 from django.contrib import admin
 
-# Register your models here.
+from api.models import TransferTask
+
+
+@admin.register(TransferTask)
+class TransferTaskAdmin(admin.ModelAdmin):
+    list_display = ("task_id", "user", "status", "submitted_at", "last_polled_at", "next_poll_at")
+    list_filter = ("status",)
+    search_fields = ("task_id", "user__username", "subject")
+    readonly_fields = ("data",)
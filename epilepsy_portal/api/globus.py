@@ -0,0 +1,306 @@
+"""
+HTTP access to the Globus Transfer API for the proxy views.
+
+All calls share one pooled requests.Session per process, so repeated calls
+reuse the TCP/TLS connection to the transfer API instead of handshaking each
+time. Every call has connect/read timeouts, and idempotent GETs are retried
+with exponential backoff on connection errors and 429/5xx responses.
+
+Settings (all optional):
+    GLOBUS_TRANSFER_BASE_URL   default https://transfer.api.globusonline.org/v0.10
+    GLOBUS_HTTP_TIMEOUT        (connect, read) seconds, default (3.05, 30)
+    GLOBUS_HTTP_POOL_SIZE      connections kept per host, default 20
+    GLOBUS_HTTP_RETRIES        default 3
+    GLOBUS_HTTP_BACKOFF        backoff factor in seconds, default 0.3
+    GLOBUS_CACHE_ALIAS         cache used for transfer API results, default "default"
+    GLOBUS_CACHE_TTL           seconds to keep endpoint_search / ls results, default 30
+    GLOBUS_ENDPOINT_CACHE_TTL  seconds to keep endpoint details, default 300
+    GLOBUS_TOKEN_CACHE_TTL     seconds to keep a user's resolved transfer token, default 300
+    GLOBUS_LS_CONCURRENCY      parallel requests per batch listing, default 8
+    GLOBUS_LS_BATCH_MAX        most paths accepted by one batch listing, default 100
+
+Successful GET results are cached per user and per token (a new token never
+sees results fetched with the old one). invalidate_user_cache() drops all of
+a user's entries at once by bumping a per-user generation number that is part
+of every key, e.g. after a transfer changes what a listing would return.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ReadTimeoutError
+from urllib3.util.retry import Retry
+
+DEFAULT_TRANSFER_BASE_URL = "https://transfer.api.globusonline.org/v0.10"
+TRANSFER_SCOPE = "urn:globus:auth:scope:transfer.api.globus.org:all"
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_transfer_base_url():
+    return getattr(settings, "GLOBUS_TRANSFER_BASE_URL", DEFAULT_TRANSFER_BASE_URL).rstrip("/")
+
+
+def get_timeout():
+    return tuple(getattr(settings, "GLOBUS_HTTP_TIMEOUT", (3.05, 30)))
+
+
+def build_session(pool_size=None, retries=None, backoff=None):
+    """A requests.Session with a sized connection pool and GET retries."""
+    pool_size = pool_size or getattr(settings, "GLOBUS_HTTP_POOL_SIZE", 20)
+    retries = getattr(settings, "GLOBUS_HTTP_RETRIES", 3) if retries is None else retries
+    backoff = getattr(settings, "GLOBUS_HTTP_BACKOFF", 0.3) if backoff is None else backoff
+
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=frozenset({"GET", "HEAD", "OPTIONS"}),
+        respect_retry_after_header=True,
+        # hand the last 5xx back to the caller instead of raising, the views
+        # pass the transfer API's error body through to the client
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept": "application/json"})
+    return session
+
+
+def get_session():
+    """The per-process pooled session (created on first use)."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = build_session()
+    return _session
+
+
+def reset_session():
+    """Drop the pooled session, e.g. after settings change or a fork."""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def transfer_get(path, headers, params=None, session=None):
+    """GET <transfer base url>/<path> on the pooled session."""
+    session = session or get_session()
+    return session.get(
+        f"{get_transfer_base_url()}/{path.lstrip('/')}",
+        headers=headers,
+        params=params,
+        timeout=get_timeout(),
+    )
+
+
+def is_timeout(error):
+    """True for timeouts, including read timeouts that exhausted the retries
+    (requests reports those as ConnectionError wrapping urllib3's error)."""
+    if isinstance(error, requests.Timeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, ReadTimeoutError)
+
+
+class TransferAPIBadResponse(ValueError):
+    """The transfer API (or a proxy in front of it) answered with a body that is not JSON."""
+
+    def __init__(self, status_code, text):
+        super().__init__(f"HTTP {status_code} with a non-JSON body: {text}")
+        self.status_code = status_code
+        self.text = text
+
+
+def get_cache():
+    return caches[getattr(settings, "GLOBUS_CACHE_ALIAS", "default")]
+
+
+def _generation_key(user_id):
+    return f"globus:gen:{user_id}"
+
+
+def _user_generation(cache, user_id):
+    generation = cache.get(_generation_key(user_id))
+    if generation is None:
+        generation = 0
+        cache.add(_generation_key(user_id), generation, None)
+    return generation
+
+
+def invalidate_user_cache(user_id):
+    """Forget every cached transfer API result for this user."""
+    cache = get_cache()
+    try:
+        cache.incr(_generation_key(user_id))
+    except ValueError:
+        cache.set(_generation_key(user_id), 1, None)
+
+
+def _cache_key(user_id, generation, headers, path, params):
+    token = headers.get("Authorization", "")
+    request_id = json.dumps([token, path, sorted((params or {}).items())], default=str)
+    digest = hashlib.sha256(request_id.encode("utf-8")).hexdigest()
+    return f"globus:get:{user_id}:{generation}:{digest}"
+
+
+def cached_transfer_get(user_id, path, headers, params=None, ttl=None, refresh=False):
+    """
+    transfer_get() with a per-user, per-token TTL cache.
+
+    Returns (status_code, payload, from_cache). Only 2xx results are cached,
+    errors are always fetched again. refresh=True skips the cache lookup but
+    stores the fresh result. A non-JSON body raises TransferAPIBadResponse.
+    """
+    ttl = getattr(settings, "GLOBUS_CACHE_TTL", 30) if ttl is None else ttl
+    cache = get_cache()
+    key = _cache_key(user_id, _user_generation(cache, user_id), headers, path, params)
+
+    if not refresh:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached[0], cached[1], True
+
+    response = transfer_get(path, headers, params=params)
+    try:
+        payload = response.json()
+    except ValueError:
+        raise TransferAPIBadResponse(response.status_code, response.text[:500])
+    if response.ok and ttl:
+        cache.set(key, (response.status_code, payload), ttl)
+    return response.status_code, payload, False
+
+
+def _token_key(user_id):
+    return f"globus:token:{user_id}"
+
+
+def _find_transfer_token(extra_data):
+    """The transfer-scope token from a Globus login: (auth header, token, expires_at)."""
+    transfer = next(
+        (token for token in extra_data.get("other_tokens") or [] if token.get("scope") == TRANSFER_SCOPE),
+        None,
+    )
+    if transfer is None:
+        return None
+
+    expires_at = None
+    if transfer.get("expires_in") and extra_data.get("auth_time"):
+        expires_at = extra_data["auth_time"] + int(transfer["expires_in"])
+
+    token_type = extra_data["token_type"]
+    transfer_token = transfer["access_token"]
+    return {"Authorization": f"{token_type} {transfer_token}"}, transfer_token, expires_at
+
+
+def resolve_transfer_token(user):
+    """
+    (transfer auth header, transfer token) for a user logged in with Globus,
+    or None if they have no transfer token.
+
+    The result is cached per user until the token expires (at most
+    GLOBUS_TOKEN_CACHE_TTL seconds), so the API path does not read
+    social_auth on every call. Saving the user's social_auth row (login or
+    token refresh) drops the cached value, see api.signals.
+    """
+    cache = get_cache()
+    cached = cache.get(_token_key(user.pk))
+    if cached is not None:
+        header, token, expires_at = cached
+        if expires_at is None or expires_at > time.time():
+            return header, token
+
+    social = user.social_auth.get(user=user)
+    resolved = _find_transfer_token(social.extra_data)
+    if resolved is None:
+        return None
+
+    header, token, expires_at = resolved
+    ttl = getattr(settings, "GLOBUS_TOKEN_CACHE_TTL", 300)
+    if expires_at is not None:
+        ttl = min(ttl, int(expires_at - time.time()))
+    if ttl > 0:
+        cache.set(_token_key(user.pk), resolved, ttl)
+    return header, token
+
+
+def transfer_token_expired(user):
+    """
+    True if the user's stored transfer token is missing or past its expiry.
+    Reads social_auth directly, resolve_transfer_token may still hand out an
+    expired token when it is not cached.
+    """
+    social = user.social_auth.get(user=user)
+    resolved = _find_transfer_token(social.extra_data)
+    if resolved is None:
+        return True
+    expires_at = resolved[2]
+    return expires_at is not None and expires_at <= time.time()
+
+
+def forget_transfer_token(user_id):
+    get_cache().delete(_token_key(user_id))
+
+
+def ls_many(user_id, endpoint_id, paths, headers, refresh=False, max_workers=None):
+    """
+    List several directories of one endpoint concurrently (bounded by
+    GLOBUS_LS_CONCURRENCY). Each path goes through cached_transfer_get.
+
+    Returns one entry per path, in input order:
+        {"path", "status_code", "cached", "data"}   on success
+        {"path", "status_code", "error"}            otherwise
+    A path that fails (error response, timeout, unreachable API) does not
+    affect the others.
+    """
+    max_workers = max_workers or getattr(settings, "GLOBUS_LS_CONCURRENCY", 8)
+
+    def list_one(path):
+        params = {"show_hidden": 0, "path": path}
+        try:
+            status_code, payload, from_cache = cached_transfer_get(
+                user_id, f"endpoint/{endpoint_id}/ls", headers, params=params, refresh=refresh
+            )
+        except TransferAPIBadResponse as error:
+            return {
+                "path": path,
+                "status_code": error.status_code if error.status_code >= 400 else 502,
+                "error": {"code": "TransferAPIBadResponse", "message": error.text},
+            }
+        except requests.RequestException as error:
+            timeout = is_timeout(error)
+            return {
+                "path": path,
+                "status_code": 504 if timeout else 502,
+                "error": {
+                    "code": "TransferAPITimeout" if timeout else "TransferAPIUnavailable",
+                    "message": str(error),
+                },
+            }
+        if 200 <= status_code < 300:
+            return {"path": path, "status_code": status_code, "cached": from_cache, "data": payload}
+        return {"path": path, "status_code": status_code, "error": payload}
+
+    if len(paths) <= 1:
+        return [list_one(path) for path in paths]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as executor:
+        return list(executor.map(list_one, paths))
@@ -0,0 +1,119 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+import requests
+
+from api.globus import build_session, ls_many, transfer_get
+from api.transfer_stub import TransferStubServer
+
+AUTH_HEADER = {"Authorization": "Bearer benchmark-token"}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare per-call requests.get with the pooled transfer session against a "
+        "local stand-in of the Globus Transfer API"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="calls per client (default 200)")
+        parser.add_argument(
+            "--connect-delay",
+            type=float,
+            default=0.03,
+            help="seconds the stand-in sleeps per new connection, standing in for TCP+TLS setup (default 0.03)",
+        )
+        parser.add_argument("--latency", type=float, default=0.0, help="seconds of server work per request")
+        parser.add_argument(
+            "--batch-paths",
+            type=int,
+            default=24,
+            help="directories for the serial ls vs ls_batch comparison, 0 to skip (default 24)",
+        )
+        parser.add_argument(
+            "--batch-latency",
+            type=float,
+            default=0.05,
+            help="server latency during the ls_batch comparison (default 0.05)",
+        )
+
+    def _run(self, label, server, call, count):
+        before = dict(server.stats)
+        timings = []
+        for index in range(count):
+            start = time.perf_counter()
+            response = call(index)
+            response.raise_for_status()
+            response.json()
+            timings.append(time.perf_counter() - start)
+        connections = server.stats["connections"] - before["connections"]
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(
+            f"  {label:<26} mean {statistics.mean(timings) * 1000:7.2f} ms  "
+            f"p50 {statistics.median(timings) * 1000:7.2f} ms  p95 {p95 * 1000:7.2f} ms  "
+            f"connections {connections}"
+        )
+        return statistics.mean(timings)
+
+    def handle(self, *args, **options):
+        count = options["requests"]
+        server = TransferStubServer(connect_delay=options["connect_delay"], latency=options["latency"]).start()
+        base_url = server.base_url
+        paths = ["endpoint/ep-1/ls", "endpoint/ep-1", "endpoint_search"]
+        try:
+            self.stdout.write(
+                f"Stand-in transfer API at {base_url} (connect delay {options['connect_delay'] * 1000:.0f} ms, "
+                f"latency {options['latency'] * 1000:.0f} ms), {count} calls each:"
+            )
+
+            def per_call(index):
+                # what the views did before: a new connection for every call, no timeout
+                return requests.get(f"{base_url}/{paths[index % len(paths)]}?path=/~/p{index}/", headers=AUTH_HEADER)
+
+            session = build_session()
+
+            def pooled(index):
+                return transfer_get(
+                    paths[index % len(paths)], AUTH_HEADER, params={"path": f"/~/p{index}/"}, session=session
+                )
+
+            old = self._run("requests.get per call", server, per_call, count)
+            with override_settings(GLOBUS_TRANSFER_BASE_URL=base_url):
+                new = self._run("pooled session", server, pooled, count)
+            session.close()
+
+            self.stdout.write(self.style.SUCCESS(
+                f"mean per call: {old * 1000:.2f} ms -> {new * 1000:.2f} ms ({old / new if new else 0:.1f}x)"
+            ))
+
+            if options["batch_paths"]:
+                with override_settings(GLOBUS_TRANSFER_BASE_URL=base_url):
+                    self._compare_batch(server, options["batch_paths"], options["batch_latency"])
+        finally:
+            server.stop()
+
+    def _compare_batch(self, server, count, latency):
+        server.latency = latency
+        paths = [f"/~/dataset/sub-{index:03d}/" for index in range(count)]
+        paths[-1] = "/~/missing/"
+        self.stdout.write(f"Listing {count} directories, {latency * 1000:.0f} ms server latency:")
+
+        start = time.perf_counter()
+        for path in paths:
+            transfer_get("endpoint/ep-1/ls", AUTH_HEADER, params={"show_hidden": 0, "path": path}).json()
+        serial = time.perf_counter() - start
+        self.stdout.write(f"  {'one ls call per path':<26} {serial * 1000:8.1f} ms")
+
+        start = time.perf_counter()
+        results = ls_many("benchmark", "ep-1", paths, AUTH_HEADER, refresh=True)
+        batch = time.perf_counter() - start
+        errors = sum(1 for result in results if "error" in result)
+        self.stdout.write(f"  {'ls_batch':<26} {batch * 1000:8.1f} ms  ({errors} per-path error)")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{count} listings: {serial * 1000:.0f} ms -> {batch * 1000:.0f} ms ({serial / batch if batch else 0:.1f}x)"
+        ))
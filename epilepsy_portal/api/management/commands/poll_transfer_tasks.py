@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api.transfer_tasks import poll_due_tasks
+
+
+class Command(BaseCommand):
+    help = "Refresh the status of active Globus transfer tasks in the background"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="poll due tasks once and exit")
+        parser.add_argument("--sleep", type=float, default=2.0, help="seconds between polling rounds (default 2)")
+        parser.add_argument("--limit", type=int, default=1000, help="most tasks per round (default 1000)")
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            start = time.perf_counter()
+            stats = poll_due_tasks(limit=options["limit"])
+            if stats["tasks"] or options["once"]:
+                self.stdout.write(
+                    f"{stats['tasks']} due task(s), {stats['requests']} request(s), "
+                    f"{stats['changed']} changed, {stats['errors']} error(s), {stats['given_up']} given up "
+                    f"in {time.perf_counter() - start:.2f}s"
+                )
+            if options["once"]:
+                return
+            time.sleep(options["sleep"])
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransferTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.CharField(max_length=64, unique=True)),
+                ('subject', models.CharField(blank=True, max_length=512)),
+                ('source_endpoint', models.CharField(blank=True, max_length=64)),
+                ('destination_endpoint', models.CharField(blank=True, max_length=64)),
+                ('status', models.CharField(choices=[('ACTIVE', 'Active'), ('INACTIVE', 'Inactive'), ('SUCCEEDED', 'Succeeded'), ('FAILED', 'Failed')], default='ACTIVE', max_length=16)),
+                ('data', models.JSONField(blank=True, default=dict)),
+                ('submitted_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('last_polled_at', models.DateTimeField(blank=True, null=True)),
+                ('next_poll_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+                ('idle_polls', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transfer_tasks', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-submitted_at'],
+                'indexes': [models.Index(fields=['status', 'next_poll_at'], name='api_transfe_status_1db5f4_idx')],
+            },
+        ),
+    ]
@@ -1,3 +1,58 @@
+from django.conf import settings
 from django.db import models
 
-# Create your models here.
+
+class TransferTask(models.Model):
+    """
+    A Globus transfer submitted through the portal, with its last known
+    status. Pages read the status from here; manage.py poll_transfer_tasks
+    refreshes active tasks in the background.
+    """
+
+    ACTIVE = "ACTIVE"
+    INACTIVE = "INACTIVE"
+    SUCCEEDED = "SUCCEEDED"
+    FAILED = "FAILED"
+    # the poller gave up (token expired or too many failed polls); the task
+    # itself may still be running, the next page view with a fresh login
+    # fetches it again
+    UNKNOWN = "UNKNOWN"
+    STATUS_CHOICES = [
+        (ACTIVE, "Active"),
+        (INACTIVE, "Inactive"),
+        (SUCCEEDED, "Succeeded"),
+        (FAILED, "Failed"),
+        (UNKNOWN, "Unknown"),
+    ]
+    # statuses the poller keeps checking
+    POLLED_STATUSES = (ACTIVE, INACTIVE)
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="transfer_tasks")
+    task_id = models.CharField(max_length=64, unique=True)
+    # search subject the transfer was started from (TransferUtils), if any
+    subject = models.CharField(max_length=512, blank=True)
+    source_endpoint = models.CharField(max_length=64, blank=True)
+    destination_endpoint = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=ACTIVE)
+    # the task document last returned by the transfer API
+    data = models.JSONField(default=dict, blank=True)
+
+    submitted_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    last_polled_at = models.DateTimeField(null=True, blank=True)
+    next_poll_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    # consecutive polls without a status change (or with an error), drives the backoff
+    idle_polls = models.PositiveIntegerField(default=0)
+    # consecutive polls that failed, the poller stops at TRANSFER_POLL_MAX_ERRORS
+    poll_errors = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["-submitted_at"]
+        indexes = [models.Index(fields=["status", "next_poll_at"])]
+
+    def __str__(self):
+        return f"{self.task_id} ({self.status})"
+
+    @property
+    def is_polled(self):
+        return self.status in self.POLLED_STATUSES
@@ -4,6 +4,8 @@ from rest_framework import serializers
 
 from social_django.models import UserSocialAuth
 
+from epilepsy.models import Patient
+
 
 class UserSocialAuthSerializer(serializers.ModelSerializer):
     class Meta:
@@ -17,4 +19,24 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = get_user_model()
         exclude = ["password"]
-        depth = 1
\ No newline at end of file
+        depth = 1
+
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """
+    ModelSerializer that takes an optional `fields` argument
+    controlling which fields should be rendered (sparse fieldsets).
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop("fields", None)
+        super().__init__(*args, **kwargs)
+
+        if fields:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+
+class PatientSerializer(DynamicFieldsModelSerializer):
+    class Meta:
+        model = Patient
+        fields = "__all__"
@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from social_django.models import UserSocialAuth
+
+from api.globus import forget_transfer_token
+
+
+@receiver(post_save, sender=UserSocialAuth)
+@receiver(post_delete, sender=UserSocialAuth)
+def drop_cached_transfer_token(sender, instance, **kwargs):
+    # a login or token refresh rewrites extra_data, the cached token is stale
+    forget_transfer_token(instance.user_id)
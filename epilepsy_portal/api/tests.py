@@ -1,3 +1,572 @@
-from django.test import TestCase
+import datetime
+import io
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import call_command
+from django.contrib.auth.models import AnonymousUser
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+
+import requests
+from social_django.models import UserSocialAuth
+
+from api import globus
+from api.models import TransferTask
+from api.transfer_tasks import next_poll_delay, poll_due_tasks, record_task
+from api.transfer_stub import TransferStubServer
+from epilepsy.models import Patient, UserProfile, UserRole
+from epilepsy_portal import search_cache
+from epilepsy_portal.mixins import CachedSearchMixin
+
+
+def create_user(role=None, username="reader"):
+    user = get_user_model().objects.create(username=username)
+    if role:
+        UserProfile.objects.create(user=user, role=role)
+    return user
+
+
+def create_globus_user(username="globus-user", token="token", auth_time=None, expires_in=3600):
+    """A user logged in with Globus, holding a transfer token that expires expires_in after auth_time."""
+    user = create_user(username=username)
+    UserSocialAuth.objects.create(user=user, provider="globus", uid=username, extra_data={
+        "token_type": "Bearer",
+        "auth_time": int(time.time()) if auth_time is None else auth_time,
+        "other_tokens": [{"scope": globus.TRANSFER_SCOPE, "access_token": token, "expires_in": expires_in}],
+    })
+    return user
+
+
+def create_patient(**fields):
+    values = {
+        "name": "Patient",
+        "gender": "M",
+        "birthday": datetime.date(1990, 1, 1),
+        "handedness": "R",
+        "admission_date": datetime.date(2024, 1, 1),
+    }
+    values.update(fields)
+    return Patient.objects.create(**values)
+
+
+class TransferStubTestCase(TestCase):
+    """Points the transfer API at a local TransferStubServer, one per test class."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = TransferStubServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        super().setUp()
+        settings_override = override_settings(
+            GLOBUS_TRANSFER_BASE_URL=self.server.base_url,
+            GLOBUS_HTTP_RETRIES=0,
+            GLOBUS_HTTP_BACKOFF=0,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        globus.reset_session()
+        self.addCleanup(globus.reset_session)
+        caches["default"].clear()
+        self.server.stats.update(connections=0, requests=0)
+
+    def settings_session(self, **overrides):
+        """Rebuild the pooled session under different settings."""
+        settings_override = override_settings(**overrides)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        globus.reset_session()
+
+
+class PatientApiTests(TestCase):
+    """Read-only /api/patients/: sparse fieldsets, cursor paging, ETags."""
+
+    def setUp(self):
+        self.client.force_login(create_user(UserRole.GUEST))
+        self.patients = [create_patient(name=f"P{i}", bed_number=f"B{i}") for i in range(3)]
+
+    def test_sparse_fields(self):
+        response = self.client.get("/api/patients/", {"fields": "name,gender"})
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual([row["name"] for row in results], ["P0", "P1", "P2"])
+        self.assertEqual(set(results[0]), {"id", "name", "gender"})
+
+    def test_sparse_detail_loads_patient_once(self):
+        url = f"/api/patients/{self.patients[0].pk}/"
+        # session + user + profile lookups, then the patient row itself
+        with self.assertNumQueries(4):
+            response = self.client.get(url, {"fields": "name"})
+        self.assertEqual(response.json(), {"id": self.patients[0].pk, "name": "P0"})
+
+    def test_unknown_field_is_400(self):
+        response = self.client.get("/api/patients/", {"fields": "name,password"})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("password", response.json()["fields"][0])
+
+    def test_cursor_paging(self):
+        first = self.client.get("/api/patients/", {"fields": "name", "page_size": 2}).json()
+        self.assertEqual([row["name"] for row in first["results"]], ["P0", "P1"])
+
+        second = self.client.get(first["next"]).json()
+        self.assertEqual([row["name"] for row in second["results"]], ["P2"])
+        self.assertIsNone(second["next"])
+
+    def test_list_etag_and_not_modified(self):
+        response = self.client.get("/api/patients/", {"fields": "name"})
+        etag = response["ETag"]
+
+        response = self.client.get("/api/patients/", {"fields": "name"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.patients[1].bed_number = "B9"
+        self.patients[1].save()
+        response = self.client.get("/api/patients/", {"fields": "name"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_detail_not_modified(self):
+        url = f"/api/patients/{self.patients[0].pk}/"
+        etag = self.client.get(url)["ETag"]
+
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_list_filters(self):
+        response = self.client.get("/api/patients/", {"fields": "name", "q": "P1"})
+        self.assertEqual([row["name"] for row in response.json()["results"]], ["P1"])
+
+    def test_requires_patient_role(self):
+        self.client.force_login(create_user(username="nobody"))
+        self.assertEqual(self.client.get("/api/patients/").status_code, 403)
+
+
+class TransferSessionTests(TransferStubTestCase):
+    """One pooled keep-alive session per process, with timeouts and GET retries."""
+
+    headers = {"Authorization": "Bearer token"}
+
+    def test_session_is_shared_until_reset(self):
+        session = globus.get_session()
+        self.assertIs(globus.get_session(), session)
+
+        globus.reset_session()
+        self.assertIsNot(globus.get_session(), session)
+
+    def test_calls_reuse_one_connection(self):
+        for _ in range(5):
+            self.assertEqual(globus.transfer_get("endpoint/abc", self.headers).status_code, 200)
+
+        self.assertEqual(self.server.stats, {"connections": 1, "requests": 5})
+
+    def test_5xx_get_is_retried_then_returned(self):
+        self.settings_session(GLOBUS_HTTP_RETRIES=2)
+
+        response = globus.transfer_get("endpoint/abc/ls", self.headers, params={"path": "/proxy-error/"})
+
+        self.assertEqual(response.status_code, 502)
+        self.assertEqual(self.server.stats["requests"], 3)
+
+    def test_read_timeout(self):
+        self.settings_session(GLOBUS_HTTP_TIMEOUT=(1, 0.05))
+        self.server.latency = 0.3
+        self.addCleanup(setattr, self.server, "latency", 0.0)
+
+        with self.assertRaises(requests.RequestException) as ctx:
+            globus.transfer_get("endpoint/abc", self.headers)
+        self.assertTrue(globus.is_timeout(ctx.exception))
+
+
+class TransferCacheTests(TransferStubTestCase):
+    """Successful GETs are cached per user and token; errors never are."""
+
+    headers = {"Authorization": "Bearer token"}
+
+    def get(self, path="endpoint/abc", user_id=1, headers=None, **kwargs):
+        return globus.cached_transfer_get(user_id, path, headers or self.headers, **kwargs)
+
+    def test_second_call_is_served_from_cache(self):
+        self.assertEqual(self.get()[2], False)
+        status_code, payload, from_cache = self.get()
+
+        self.assertEqual((status_code, from_cache), (200, True))
+        self.assertEqual(payload["id"], "abc")
+        self.assertEqual(self.server.stats["requests"], 1)
+
+    def test_cache_is_per_user_and_token(self):
+        self.get()
+        self.assertFalse(self.get(user_id=2)[2])
+        self.assertFalse(self.get(headers={"Authorization": "Bearer other"})[2])
+        self.assertEqual(self.server.stats["requests"], 3)
+
+    def test_refresh_and_invalidate(self):
+        self.get()
+        self.assertFalse(self.get(refresh=True)[2])
+        self.assertTrue(self.get()[2])
+
+        globus.invalidate_user_cache(1)
+        self.assertFalse(self.get()[2])
+        self.assertTrue(self.get()[2])
+
+    def test_errors_are_not_cached(self):
+        for _ in range(2):
+            status_code, _, from_cache = self.get("endpoint/abc/ls", params={"path": "/missing/"})
+            self.assertEqual((status_code, from_cache), (404, False))
+        self.assertEqual(self.server.stats["requests"], 2)
+
+    def test_endpoint_view_reports_cache_hits(self):
+        self.client.force_login(create_globus_user())
+
+        first = self.client.get("/api/endpoints/abc/")
+        second = self.client.get("/api/endpoints/abc/")
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual((first["X-Cache"], second["X-Cache"]), ("MISS", "HIT"))
+        self.assertEqual(second.json()["display_name"], "Stand-in endpoint")
+        self.assertEqual(self.client.get("/api/endpoints/abc/", {"refresh": "1"})["X-Cache"], "MISS")
+
+
+class TransferTokenCacheTests(TestCase):
+    """resolve_transfer_token reads social_auth once per user until the token expires or changes."""
+
+    def setUp(self):
+        caches["default"].clear()
+        self.user = create_globus_user(token="first")
+
+    def test_token_is_cached(self):
+        self.assertEqual(globus.resolve_transfer_token(self.user), ({"Authorization": "Bearer first"}, "first"))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(globus.resolve_transfer_token(self.user)[1], "first")
+
+    def test_new_login_drops_cached_token(self):
+        globus.resolve_transfer_token(self.user)
+
+        social = self.user.social_auth.get()
+        social.extra_data["other_tokens"][0]["access_token"] = "second"
+        social.save()
+
+        self.assertEqual(globus.resolve_transfer_token(self.user)[1], "second")
+
+    def test_expired_cache_entry_is_not_used(self):
+        globus.resolve_transfer_token(self.user)
+        cached = caches["default"].get(globus._token_key(self.user.pk))
+        caches["default"].set(globus._token_key(self.user.pk), (*cached[:2], time.time() - 1))
+
+        with self.assertNumQueries(1):
+            globus.resolve_transfer_token(self.user)
+
+    def test_user_without_transfer_token(self):
+        user = create_user(username="plain")
+        UserSocialAuth.objects.create(user=user, provider="globus", uid="plain", extra_data={"token_type": "Bearer"})
+
+        self.assertIsNone(globus.resolve_transfer_token(user))
+        self.client.force_login(user)
+        response = self.client.get("/api/endpoints/abc/")
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response["Location"], "/login/globus")
+
+
+class TransferBatchListingTests(TransferStubTestCase):
+    """ls_batch lists many paths concurrently and reports errors per path."""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(create_globus_user())
+        self.url = "/api/endpoints/abc/ls_batch/"
+
+    def test_results_in_request_order_with_per_path_errors(self):
+        paths = ["/a/", "/missing/", "/proxy-error/", "/b/", "/a/"]
+        response = self.client.post(self.url, {"paths": paths}, content_type="application/json")
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body["errors"], 2)
+        results = body["results"]
+        self.assertEqual([r["path"] for r in results], ["/a/", "/missing/", "/proxy-error/", "/b/"])
+        self.assertEqual([r["status_code"] for r in results], [200, 404, 502, 200])
+        self.assertEqual(results[0]["data"]["path"], "/a/")
+        self.assertEqual(results[1]["error"]["code"], "ClientError.NotFound")
+        self.assertEqual(results[2]["error"]["code"], "TransferAPIBadResponse")
+        self.assertIn("502 Bad Gateway", results[2]["error"]["message"])
+
+    def test_get_with_repeated_path_parameter(self):
+        response = self.client.get(self.url, {"path": ["/a/", "/b/"]})
+
+        self.assertEqual([r["path"] for r in response.json()["results"]], ["/a/", "/b/"])
+        # second time round both listings come from the cache
+        response = self.client.get(self.url, {"path": ["/a/", "/b/"]})
+        self.assertEqual([r["cached"] for r in response.json()["results"]], [True, True])
+
+    def test_invalid_paths_are_400(self):
+        for payload in ({}, {"paths": []}, {"paths": "/a/"}, {"paths": ["/a/", ""]}):
+            response = self.client.post(self.url, payload, content_type="application/json")
+            self.assertEqual(response.status_code, 400, payload)
+
+        with override_settings(GLOBUS_LS_BATCH_MAX=2):
+            response = self.client.post(self.url, {"paths": ["/a/", "/b/", "/c/"]}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+
+    def test_single_listing_of_non_json_error_is_502(self):
+        response = self.client.get("/api/endpoints/abc/ls/", {"path": "/proxy-error/"})
+        self.assertEqual(response.status_code, 502)
+
+
+class FakeSearchView:
+    """Stands in for SearchView: counts upstream searches and can be slowed down or made to fail."""
+
+    calls = 0
+    delay = 0
+    error = None
+
+    def __init__(self, user, query="seeg", filters=()):
+        self.request = RequestFactory().get("/search/")
+        self.request.user = user
+        self.query = query
+        self.filters = list(filters)
+        self.offset = 0
+        self.sort = []
+        self.results_per_page = 10
+
+    def get_context_data(self, index):
+        FakeSearchView.calls += 1
+        time.sleep(self.delay)
+        if self.error:
+            return {"error": self.error}
+        return {"search": {"count": 1, "query": self.query}}
+
+
+class CachedSearch(CachedSearchMixin, FakeSearchView):
+    pass
+
+
+class SearchCacheTests(TestCase):
+    """Search pages are cached per index, query and visibility; identical concurrent searches are coalesced."""
+
+    def setUp(self):
+        caches["default"].clear()
+        FakeSearchView.calls = 0
+        self.addCleanup(setattr, FakeSearchView, "delay", 0)
+        self.addCleanup(setattr, FakeSearchView, "error", None)
+        groups = mock.patch.object(search_cache, "get_user_groups", side_effect=RuntimeError("no groups scope"))
+        self.get_user_groups = groups.start()
+        self.addCleanup(groups.stop)
+
+    def search(self, user=None, **kwargs):
+        view = CachedSearch(user or AnonymousUser(), **kwargs)
+        return view.get_context_data("epilepsy"), view.search_cache_status
+
+    def test_repeated_search_is_served_from_cache(self):
+        self.assertEqual(self.search()[1], "miss")
+        context, status = self.search()
+
+        self.assertEqual(status, "hit")
+        self.assertEqual(context["search"]["query"], "seeg")
+        self.assertEqual(FakeSearchView.calls, 1)
+
+    def test_key_covers_query_and_filters(self):
+        self.search()
+        self.search(query="eeg")
+        self.search(filters=[{"field_name": "gender", "values": ["F"]}])
+        self.assertEqual(FakeSearchView.calls, 3)
+
+    def test_errors_are_not_cached(self):
+        FakeSearchView.error = "Search unavailable"
+        self.search()
+        self.search()
+        self.assertEqual(FakeSearchView.calls, 2)
+
+    @override_settings(SEARCH_CACHE_TTL=0)
+    def test_ttl_zero_disables_cache(self):
+        self.search()
+        self.search()
+        self.assertEqual(FakeSearchView.calls, 2)
+
+    def test_visibility_without_groups_is_per_user(self):
+        first, second = create_user(username="a"), create_user(username="b")
+
+        self.assertEqual(search_cache.get_visibility_key(AnonymousUser()), "public")
+        self.assertEqual(search_cache.get_visibility_key(first), f"user:{first.pk}")
+        self.search(first)
+        self.assertEqual(self.search(second)[1], "miss")
+        self.assertEqual(self.search(first)[1], "hit")
+
+    def test_users_with_same_groups_share_results(self):
+        self.get_user_groups.side_effect = None
+        self.get_user_groups.return_value = [{"id": "g2"}, {"id": "g1"}]
+        first, second = create_user(username="a"), create_user(username="b")
+
+        self.search(first)
+        self.assertEqual(self.search(second)[1], "hit")
+        # the group set itself is cached too
+        self.assertEqual(self.get_user_groups.call_count, 2)
+        search_cache.get_visibility_key(first)
+        self.assertEqual(self.get_user_groups.call_count, 2)
+
+    def test_concurrent_identical_searches_share_one_call(self):
+        FakeSearchView.delay = 0.2
+        statuses = []
+
+        def search():
+            statuses.append(self.search()[1])
+
+        threads = [threading.Thread(target=search) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(FakeSearchView.calls, 1)
+        self.assertEqual(sorted(statuses), ["coalesced"] * 3 + ["miss"])
+
+
+class SingleFlightTests(TestCase):
+    def test_waiter_gets_leader_error(self):
+        flight = search_cache.SingleFlight()
+        started = threading.Event()
+        errors = []
+
+        def leader():
+            started.set()
+            time.sleep(0.1)
+            raise ValueError("upstream down")
+
+        def run(func):
+            try:
+                flight.do("k", func)
+            except ValueError as error:
+                errors.append(error)
+
+        first = threading.Thread(target=run, args=(leader,))
+        first.start()
+        started.wait()
+        second = threading.Thread(target=run, args=(lambda: "unused",))
+        second.start()
+        first.join()
+        second.join()
+
+        self.assertEqual([str(error) for error in errors], ["upstream down"] * 2)
+        self.assertEqual(flight._calls, {})
+
+    def test_waiter_times_out_and_runs_itself(self):
+        flight = search_cache.SingleFlight()
+        release = threading.Event()
+        leader = threading.Thread(target=flight.do, args=("k", release.wait))
+        leader.start()
+        time.sleep(0.05)
+
+        self.assertEqual(flight.do("k", lambda: "own", timeout=0.05), ("own", False))
+        release.set()
+        leader.join()
+
+
+class TransferTaskPollerTests(TransferStubTestCase):
+    """poll_due_tasks batches task_list calls per user, backs off idle tasks and gives up on dead ones."""
+
+    def setUp(self):
+        super().setUp()
+        self.server.tasks.clear()
+        self.user = create_globus_user()
+
+    def add_task(self, task_id, user=None, **fields):
+        return record_task(user or self.user, task_id, **fields)
+
+    def make_due(self):
+        TransferTask.objects.update(next_poll_at=timezone.now())
+
+    def test_next_poll_delay_doubles_up_to_ceiling(self):
+        with override_settings(TRANSFER_POLL_INTERVAL=10, TRANSFER_POLL_MAX_INTERVAL=60):
+            delays = [next_poll_delay(idle).total_seconds() for idle in range(5)]
+        self.assertEqual(delays, [10, 20, 40, 60, 60])
+
+    @override_settings(TRANSFER_POLL_BATCH_SIZE=2)
+    def test_due_tasks_are_fetched_in_batches(self):
+        for i in range(3):
+            self.server.tasks[f"t{i}"] = {"status": "ACTIVE", "bytes_transferred": 0}
+            self.add_task(f"t{i}")
+
+        stats = poll_due_tasks()
+
+        self.assertEqual((stats["tasks"], stats["requests"], stats["changed"]), (3, 2, 3))
+        task = TransferTask.objects.get(task_id="t0")
+        self.assertEqual(task.data["bytes_transferred"], 0)
+        self.assertGreater(task.next_poll_at, timezone.now())
+        # nothing is due until the backoff runs out
+        self.assertEqual(poll_due_tasks()["tasks"], 0)
+
+    def test_unchanged_task_backs_off_and_change_resets(self):
+        self.server.tasks["t1"] = {"status": "ACTIVE", "bytes_transferred": 0}
+        self.add_task("t1")
+        poll_due_tasks()
+        self.make_due()
+        poll_due_tasks()
+        self.assertEqual(TransferTask.objects.get().idle_polls, 1)
+
+        self.server.tasks["t1"] = {"status": "SUCCEEDED", "bytes_transferred": 10}
+        self.make_due()
+        stats = poll_due_tasks()
+
+        task = TransferTask.objects.get()
+        self.assertEqual(stats["changed"], 1)
+        self.assertEqual((task.status, task.idle_polls), (TransferTask.SUCCEEDED, 0))
+        self.assertIsNone(task.next_poll_at)
+
+    @override_settings(TRANSFER_POLL_MAX_ERRORS=2)
+    def test_gives_up_after_repeated_errors(self):
+        # the task is not visible to this token: every poll is an error
+        self.add_task("gone")
+
+        self.assertEqual(poll_due_tasks()["errors"], 1)
+        task = TransferTask.objects.get()
+        self.assertEqual((task.status, task.poll_errors), (TransferTask.ACTIVE, 1))
+
+        self.make_due()
+        self.assertEqual(poll_due_tasks()["given_up"], 1)
+        task.refresh_from_db()
+        self.assertEqual(task.status, TransferTask.UNKNOWN)
+        self.assertIsNone(task.next_poll_at)
+
+    def test_successful_poll_resets_errors(self):
+        self.add_task("late")
+        poll_due_tasks()
+        self.server.tasks["late"] = {"status": "ACTIVE"}
+        self.make_due()
+        poll_due_tasks()
+        self.assertEqual(TransferTask.objects.get().poll_errors, 0)
+
+    def test_expired_token_gives_up_without_a_request(self):
+        user = create_globus_user("expired", auth_time=int(time.time()) - 7200, expires_in=3600)
+        self.server.tasks["t1"] = {"status": "ACTIVE"}
+        self.add_task("t1", user=user)
+
+        stats = poll_due_tasks()
+
+        self.assertEqual((stats["requests"], stats["given_up"]), (0, 1))
+        self.assertEqual(self.server.stats["requests"], 0)
+        self.assertEqual(TransferTask.objects.get().status, TransferTask.UNKNOWN)
+
+    def test_tasks_view_and_command(self):
+        self.server.tasks["t1"] = {"status": "SUCCEEDED"}
+        self.add_task("t1")
+        self.add_task("t2", status=TransferTask.ACTIVE)
+        out = io.StringIO()
+
+        call_command("poll_transfer_tasks", "--once", stdout=out)
+
+        self.assertIn("2 due task(s), 1 request(s), 1 changed, 1 error(s)", out.getvalue())
+        self.client.force_login(self.user)
+        statuses = {task["task_id"]: task["status"] for task in self.client.get("/api/endpoints/tasks/").json()}
+        self.assertEqual(statuses, {"t1": "SUCCEEDED", "t2": "ACTIVE"})
+        active = self.client.get("/api/endpoints/tasks/", {"active": "1"}).json()
+        self.assertEqual([task["task_id"] for task in active], ["t2"])
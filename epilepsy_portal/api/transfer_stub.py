@@ -0,0 +1,173 @@
+"""
+A small local stand-in for the parts of the Globus Transfer API the portal uses
+(endpoint_search, endpoint/<id>, endpoint/<id>/ls, task_list), plus the
+Globus Search ingest call (POST /v1/index/<id>/ingest). It is only used by
+the benchmark commands and for manual testing against a local URL, e.g.
+
+    GLOBUS_TRANSFER_BASE_URL = "http://127.0.0.1:8765/v0.10"
+    SEARCH_API_BASE_URL = "http://127.0.0.1:8765"
+
+The server speaks HTTP/1.1 keep-alive. `connect_delay` is slept once per new
+connection to stand in for the TCP + TLS handshake to the real API, and
+`latency` once per request for the server-side work.
+"""
+
+import json
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+def _listing(path):
+    """Three sub-directories (two levels deep) and five files per directory."""
+    path = path if path.endswith("/") else f"{path}/"
+    depth = sum(1 for part in path.split("/") if part.startswith("dir"))
+    entries = []
+    for index in range(3 if depth < 2 else 0):
+        entries.append({
+            "DATA_TYPE": "file",
+            "name": f"dir{index}",
+            "type": "dir",
+            "size": 4096,
+            "last_modified": "2024-01-01 00:00:00+00:00",
+        })
+    for index in range(5):
+        entries.append({
+            "DATA_TYPE": "file",
+            "name": f"file{index}.edf",
+            "type": "file",
+            "size": 1024 * 1024 * (index + 1),
+            "last_modified": "2024-01-01 00:00:00+00:00",
+        })
+    return {"DATA_TYPE": "file_list", "path": path, "DATA": entries}
+
+
+class TransferStubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        # headers and body go out as separate writes; without this, Nagle plus
+        # delayed ACKs adds ~40 ms to every request on a kept-alive connection
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.stats["connections"] += 1
+        if self.server.connect_delay:
+            time.sleep(self.server.connect_delay)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_html(self, status, html):
+        # what a reverse proxy in front of the API answers with, not JSON
+        body = html.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.server.stats["requests"] += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if "Authorization" not in self.headers:
+            return self._send(401, {"code": "AuthenticationFailed", "message": "No Authorization header"})
+
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        parts = [part for part in url.path.split("/") if part][1:]  # drop the API version
+
+        if parts == ["endpoint_search"]:
+            text = query.get("filter_fulltext", [""])[0]
+            return self._send(200, {
+                "DATA_TYPE": "endpoint_list",
+                "DATA": [
+                    {"DATA_TYPE": "endpoint", "id": f"endpoint-{index}", "display_name": f"{text} {index}"}
+                    for index in range(10)
+                ],
+            })
+        if parts == ["task_list"]:
+            task_filter = query.get("filter", [""])[0]
+            task_ids = task_filter[len("task_id:"):].split(",") if task_filter.startswith("task_id:") else []
+            return self._send(200, {
+                "DATA_TYPE": "task_list",
+                "DATA": [
+                    {"DATA_TYPE": "task", "task_id": task_id, **self.server.tasks[task_id]}
+                    for task_id in task_ids
+                    if task_id in self.server.tasks
+                ],
+            })
+        if len(parts) == 2 and parts[0] == "endpoint":
+            return self._send(200, {"DATA_TYPE": "endpoint", "id": parts[1], "display_name": "Stand-in endpoint"})
+        if len(parts) == 3 and parts[0] == "endpoint" and parts[2] == "ls":
+            path = query.get("path", ["/~/"])[0]
+            if "missing" in path:
+                return self._send(404, {"code": "ClientError.NotFound", "message": f"Directory '{path}' not found"})
+            if "proxy-error" in path:
+                return self._send_html(502, "<html><body><h1>502 Bad Gateway</h1></body></html>")
+            return self._send(200, _listing(path))
+        return self._send(404, {"code": "NotFound", "message": self.path})
+
+    def do_POST(self):
+        self.server.stats["requests"] += 1
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if "Authorization" not in self.headers:
+            return self._send(401, {"code": "AuthenticationFailed", "message": "No Authorization header"})
+
+        parts = [part for part in urlsplit(self.path).path.split("/") if part]
+        if len(parts) == 4 and parts[:2] == ["v1", "index"] and parts[3] == "ingest":
+            if self.server.fail_ingests > 0:
+                self.server.fail_ingests -= 1
+                return self._send(503, {"code": "ServiceUnavailable", "message": "try again"})
+            gmeta = body.get("ingest_data", {}).get("gmeta", [])
+            self.server.ingested.setdefault(parts[2], []).extend(gmeta)
+            return self._send(200, {"acknowledged": True, "task_id": f"ingest-{len(self.server.ingested[parts[2]])}"})
+        return self._send(404, {"code": "NotFound", "message": self.path})
+
+
+class TransferStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address=("127.0.0.1", 0), connect_delay=0.0, latency=0.0):
+        super().__init__(address, TransferStubHandler)
+        self.connect_delay = connect_delay
+        self.latency = latency
+        self.stats = {"connections": 0, "requests": 0}
+        # task_id -> task fields returned by task_list, e.g. {"status": "ACTIVE"}
+        self.tasks = {}
+        # index id -> gmeta entries received by ingest; fail_ingests answers the next N ingests with 503
+        self.ingested = {}
+        self.fail_ingests = 0
+        self._thread = None
+
+    def handle_error(self, request, client_address):
+        # a client that timed out and hung up is expected, not worth a traceback
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v0.10"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
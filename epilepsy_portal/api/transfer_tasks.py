@@ -0,0 +1,136 @@
+"""
+Background status refresh for TransferTask rows.
+
+Active tasks are polled with exponential backoff: a task is checked again
+TRANSFER_POLL_INTERVAL seconds after it changed, doubling each time nothing
+changed, up to TRANSFER_POLL_MAX_INTERVAL. Due tasks are grouped per user and
+fetched with one task_list call per TRANSFER_POLL_BATCH_SIZE tasks instead of
+one get_task call per task.
+
+The poller gives up on a task, marking it UNKNOWN and no longer due, after
+TRANSFER_POLL_MAX_ERRORS failed polls in a row or as soon as the owner's
+transfer token has expired; polling with a dead token would only keep
+reporting the last status it saw.
+
+Settings (all optional):
+    TRANSFER_POLL_INTERVAL      default 10 seconds
+    TRANSFER_POLL_MAX_INTERVAL  default 600 seconds
+    TRANSFER_POLL_BATCH_SIZE    task ids per task_list call, default 50
+    TRANSFER_POLL_MAX_ERRORS    default 10
+"""
+
+import datetime
+import logging
+from itertools import groupby
+
+from django.conf import settings
+from django.utils import timezone
+
+import requests
+
+from api.globus import resolve_transfer_token, transfer_get, transfer_token_expired
+from api.models import TransferTask
+
+log = logging.getLogger(__name__)
+
+POLL_FIELDS = ["status", "data", "last_polled_at", "next_poll_at", "idle_polls", "poll_errors", "updated_at"]
+
+
+def next_poll_delay(idle_polls):
+    base = getattr(settings, "TRANSFER_POLL_INTERVAL", 10)
+    ceiling = getattr(settings, "TRANSFER_POLL_MAX_INTERVAL", 600)
+    return datetime.timedelta(seconds=min(base * 2 ** min(idle_polls, 16), ceiling))
+
+
+def record_task(user, task_id, **fields):
+    """Create (or update) the row for a submitted task and make it due now."""
+    fields.setdefault("next_poll_at", timezone.now())
+    task, _ = TransferTask.objects.update_or_create(task_id=task_id, defaults={"user": user, **fields})
+    return task
+
+
+def apply_task_document(task, document, now=None):
+    """Store a task document from the transfer API and schedule the next poll."""
+    now = now or timezone.now()
+    changed = document != task.data
+    task.data = document
+    task.status = document.get("status", task.status)
+    task.last_polled_at = now
+    task.idle_polls = 0 if changed else task.idle_polls + 1
+    task.poll_errors = 0
+    task.next_poll_at = now + next_poll_delay(task.idle_polls) if task.is_polled else None
+    task.updated_at = now
+    return changed
+
+
+def give_up_task(task, now=None):
+    """Stop polling a task whose status can no longer be fetched."""
+    now = now or timezone.now()
+    task.status = TransferTask.UNKNOWN
+    task.next_poll_at = None
+    task.updated_at = now
+
+
+def _fetch_documents(auth_header, task_ids):
+    response = transfer_get(
+        "task_list",
+        auth_header,
+        params={"filter": "task_id:" + ",".join(task_ids), "limit": len(task_ids)},
+    )
+    response.raise_for_status()
+    return {document["task_id"]: document for document in response.json().get("DATA", [])}
+
+
+def poll_due_tasks(limit=1000):
+    """
+    Refresh every polled task whose next_poll_at has passed. Returns stats:
+    tasks, requests, changed, errors, given_up.
+    """
+    now = timezone.now()
+    batch_size = getattr(settings, "TRANSFER_POLL_BATCH_SIZE", 50)
+    max_errors = getattr(settings, "TRANSFER_POLL_MAX_ERRORS", 10)
+    due = list(
+        TransferTask.objects
+        .filter(status__in=TransferTask.POLLED_STATUSES, next_poll_at__lte=now)
+        .select_related("user")
+        .order_by("user_id", "next_poll_at")[:limit]
+    )
+    stats = {"tasks": len(due), "requests": 0, "changed": 0, "errors": 0, "given_up": 0}
+
+    for _, user_tasks in groupby(due, key=lambda task: task.user_id):
+        user_tasks = list(user_tasks)
+        user = user_tasks[0].user
+        try:
+            resolved = resolve_transfer_token(user)
+            expired = resolved is None or transfer_token_expired(user)
+        except Exception as error:
+            log.warning(f"No transfer token for user {user.pk}: {error}")
+            resolved, expired = None, True
+
+        for start in range(0, len(user_tasks), batch_size):
+            batch = user_tasks[start:start + batch_size]
+            documents = None
+            if not expired:
+                stats["requests"] += 1
+                try:
+                    documents = _fetch_documents(resolved[0], [task.task_id for task in batch])
+                except (requests.RequestException, ValueError) as error:
+                    log.warning(f"Polling {len(batch)} transfer tasks for user {user.pk} failed: {error}")
+
+            for task in batch:
+                document = documents.get(task.task_id) if documents is not None else None
+                if document is None:
+                    # error, or the task is not visible with this token: back off
+                    stats["errors"] += 1
+                    task.idle_polls += 1
+                    task.poll_errors += 1
+                    task.last_polled_at = now
+                    task.next_poll_at = now + next_poll_delay(task.idle_polls)
+                    if expired or task.poll_errors >= max_errors:
+                        stats["given_up"] += 1
+                        give_up_task(task, now)
+                elif apply_task_document(task, document, now):
+                    stats["changed"] += 1
+            TransferTask.objects.bulk_update(batch, POLL_FIELDS)
+
+    return stats
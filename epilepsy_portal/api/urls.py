@@ -1,6 +1,7 @@
 from rest_framework.routers import DefaultRouter
 
-from api.views import EndpointSearchView
+from api.views import EndpointSearchView, PatientViewSet
 
 router = DefaultRouter()
-router.register(r'endpoints', EndpointSearchView, basename="endpoints")
\ No newline at end of file
+router.register(r'endpoints', EndpointSearchView, basename="endpoints")
+router.register(r'patients', PatientViewSet, basename="patients")
\ No newline at end of file
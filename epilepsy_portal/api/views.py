@@ -1,15 +1,35 @@
-from api.serializers import UserSerializer
+from api.globus import (
+    TransferAPIBadResponse,
+    cached_transfer_get,
+    invalidate_user_cache,
+    is_timeout,
+    ls_many,
+    resolve_transfer_token,
+)
+from api.models import TransferTask
+from api.serializers import PatientSerializer, UserSerializer
+from api.transfer_tasks import record_task
 
 from django.conf import settings
+from django.db.models import Count, Max
 from django.shortcuts import redirect
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.views.decorators.gzip import gzip_page
 
 from functools import wraps
+import hashlib
 
 from rest_framework import viewsets
 from rest_framework.decorators import action, api_view
-from rest_framework.exceptions import NotAuthenticated
+from rest_framework.exceptions import APIException, NotAuthenticated, ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.permissions import BasePermission, IsAuthenticated
 from rest_framework.response import Response
 
+from epilepsy.models import Patient, UserRole
+from epilepsy.views import PatientListView
+
 import globus_sdk
 import requests
 
@@ -18,23 +38,19 @@ def globus_authentication(function):
     @wraps(function)
     def wrapper(view_func, request, *args, **kwargs):
         if request.user.is_authenticated:
-            user = request.user.social_auth.get(user=request.user)
-            transfer = next(
-                (
-                    token
-                    for token in user.extra_data["other_tokens"]
-                    if token["scope"]
-                    == "urn:globus:auth:scope:transfer.api.globus.org:all"
-                ),
-                None,
-            )
-
-            token_type = user.extra_data["token_type"]
-            transfer_token = transfer["access_token"]
-            transfer_auth_header = {"Authorization": f"{token_type} {transfer_token}"}
+            resolved = resolve_transfer_token(request.user)
+            if resolved is None:
+                return redirect("/login/globus")
+            transfer_auth_header, transfer_token = resolved
 
-            request.session["transfer_auth_header"] = transfer_auth_header
-            request.session["transfer_token"] = transfer_token
+            # only touch the session when the token changed, so a cached token
+            # does not cost a session save on every call
+            if (
+                request.session.get("transfer_token") != transfer_token
+                or request.session.get("transfer_auth_header") != transfer_auth_header
+            ):
+                request.session["transfer_auth_header"] = transfer_auth_header
+                request.session["transfer_token"] = transfer_token
         else:
             return redirect("/login/globus")
 
@@ -74,53 +90,102 @@ def authorize(request):
     return redirect("/login/globus/")
 
 
+class TransferAPIUnavailable(APIException):
+    status_code = 502
+    default_detail = "The Globus Transfer API could not be reached."
+    default_code = "transfer_api_unavailable"
+
+
+class TransferAPITimeout(TransferAPIUnavailable):
+    status_code = 504
+    default_detail = "The Globus Transfer API did not respond in time."
+    default_code = "transfer_api_timeout"
+
+
 class EndpointSearchView(viewsets.ViewSet):
-    TRANSFER_BASE_URL = "https://transfer.api.globusonline.org/v0.10"
+    """
+    Proxy for the Globus Transfer API. Results are cached per user and token
+    for a short time (see api.globus); pass ?refresh=1 to bypass the cache.
+    A submitted transfer drops the user's cached results.
+    """
+
+    def _transfer_get(self, request, path, params=None, ttl=None):
+        refresh = request.query_params.get("refresh") in ("1", "true")
+        try:
+            status_code, payload, from_cache = cached_transfer_get(
+                request.user.pk,
+                path,
+                request.session["transfer_auth_header"],
+                params=params,
+                ttl=ttl,
+                refresh=refresh,
+            )
+        except TransferAPIBadResponse:
+            raise TransferAPIUnavailable()
+        except requests.RequestException as error:
+            raise TransferAPITimeout() if is_timeout(error) else TransferAPIUnavailable()
+        return status_code, payload, {"X-Cache": "HIT" if from_cache else "MISS"}
+
+    def _proxy_response(self, status_code, payload, headers):
+        if 200 <= status_code < 300:
+            return Response(payload, status_code, headers=headers)
+        return Response({"status_code": status_code, **payload}, status_code, headers=headers)
 
     @globus_authentication
     def list(self, request, *args, **kwargs):
         filter_fulltext = request.query_params.get("filter_fulltext", "my-endpoints")
-        search_url = f"{self.TRANSFER_BASE_URL}/endpoint_search?filter_fulltext={filter_fulltext}"
-        response = requests.get(
-            search_url,
-            headers=request.session["transfer_auth_header"],
+        status_code, payload, headers = self._transfer_get(
+            request, "endpoint_search", {"filter_fulltext": filter_fulltext}
         )
-        return Response(response.json()["DATA"])
+        return Response(payload["DATA"], headers=headers)
 
     @globus_authentication
     def retrieve(self, request, pk=settings.PORTAL_ENDPOINT_ID, *args, **kwargs):
-        endpoint_url = f"{self.TRANSFER_BASE_URL}/endpoint/{pk}"
-        response = requests.get(
-            endpoint_url,
-            headers=request.session["transfer_auth_header"],
-        )
-
-        if response.ok:
-            return Response(response.json(), response.status_code)
-        return Response(
-            {"status_code": response.status_code, **response.json()},
-            response.status_code,
-        )
+        return self._proxy_response(*self._transfer_get(
+            request, f"endpoint/{pk}", ttl=getattr(settings, "GLOBUS_ENDPOINT_CACHE_TTL", 300)
+        ))
 
     @action(detail=True)
     @globus_authentication
     def ls(self, request, pk=settings.PORTAL_ENDPOINT_ID, *args, **kwargs):
-        endpoint_url = f"{self.TRANSFER_BASE_URL}/endpoint/{pk}/ls?show_hidden=0"
+        params = {"show_hidden": 0}
         path = request.query_params.get("path", None)
         if path:
-            endpoint_url = f"{endpoint_url}&path={path}"
+            params["path"] = path
 
-        response = requests.get(
-            endpoint_url,
-            headers=request.session["transfer_auth_header"],
-        )
+        return self._proxy_response(*self._transfer_get(request, f"endpoint/{pk}/ls", params))
+
+    @action(detail=True, methods=["GET", "POST"])
+    @globus_authentication
+    def ls_batch(self, request, pk=settings.PORTAL_ENDPOINT_ID, *args, **kwargs):
+        """
+        List many directories in one call: POST {"paths": [...]} or GET
+        ?path=a&path=b. Paths are fetched concurrently and returned in request
+        order, each with its own status_code and either data or error.
+        """
+        if request.method == "POST":
+            paths = request.data.get("paths")
+        else:
+            paths = request.query_params.getlist("path")
+        if not isinstance(paths, list) or not paths or not all(isinstance(path, str) and path for path in paths):
+            raise ValidationError({"paths": ["Provide a non-empty list of paths."]})
+
+        limit = getattr(settings, "GLOBUS_LS_BATCH_MAX", 100)
+        if len(paths) > limit:
+            raise ValidationError({"paths": [f"At most {limit} paths per request."]})
 
-        if response.ok:
-            return Response(response.json(), response.status_code)
-        return Response(
-            {"status_code": response.status_code, **response.json()},
-            response.status_code,
+        results = ls_many(
+            request.user.pk,
+            pk,
+            list(dict.fromkeys(paths)),
+            request.session["transfer_auth_header"],
+            refresh=request.query_params.get("refresh") in ("1", "true"),
         )
+        return Response({
+            "endpoint_id": pk,
+            "results": results,
+            "errors": sum(1 for result in results if "error" in result),
+        })
 
     @action(detail=False, methods=["POST"])
     @globus_authentication
@@ -151,6 +216,16 @@ class EndpointSearchView(viewsets.ViewSet):
         except Exception as error:
             print(error)
             return Response({"code": "Denied"})
+
+        # listings of the destination (and endpoint activity) are now stale
+        invalidate_user_cache(request.user.pk)
+        # the poller (manage.py poll_transfer_tasks) keeps its status current
+        record_task(
+            request.user,
+            transfer_result["task_id"],
+            source_endpoint=transfer_request_payload["source_endpoint"],
+            destination_endpoint=transfer_request_payload["destination_endpoint"],
+        )
         
         print(transfer_result)
         transfer_response = {
@@ -165,3 +240,111 @@ class EndpointSearchView(viewsets.ViewSet):
         }
         transfer_response["task_link"] = task_link
         return Response(transfer_response)
+
+    @action(detail=False)
+    def tasks(self, request, *args, **kwargs):
+        """The user's recent transfers with their last polled status (no remote call)."""
+        if not request.user.is_authenticated:
+            raise NotAuthenticated()
+        tasks = TransferTask.objects.filter(user=request.user)
+        if request.query_params.get("active") in ("1", "true"):
+            tasks = tasks.filter(status__in=TransferTask.POLLED_STATUSES)
+        return Response([
+            {
+                "task_id": task.task_id,
+                "status": task.status,
+                "source_endpoint": task.source_endpoint,
+                "destination_endpoint": task.destination_endpoint,
+                "submitted_at": task.submitted_at,
+                "last_polled_at": task.last_polled_at,
+                "data": task.data,
+            }
+            for task in tasks[:50]
+        ])
+
+
+class HasPatientAccess(BasePermission):
+    """Patient data is readable by the same roles that can browse the patient list."""
+
+    message = "You do not have permission to read patient data."
+
+    def has_permission(self, request, view):
+        profile = getattr(request.user, "profile", None)
+        return bool(profile and profile.role in (UserRole.ADMIN, UserRole.STAFF, UserRole.GUEST))
+
+
+class PatientCursorPagination(CursorPagination):
+    ordering = "id"
+    page_size = getattr(settings, "PATIENT_API_PAGE_SIZE", 100)
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+
+@method_decorator(gzip_page, name="dispatch")
+class PatientViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Read-only patient API.
+
+    - ?fields=id,name,gender  sparse fieldsets (only these columns are loaded and rendered)
+    - the same filter parameters as the patient list page (q, age_min, aura, ...)
+    - cursor pagination ordered by id (?cursor=..., ?page_size=)
+    - ETag / If-None-Match, gzip when the client accepts it
+    """
+
+    serializer_class = PatientSerializer
+    permission_classes = [IsAuthenticated, HasPatientAccess]
+    pagination_class = PatientCursorPagination
+
+    FIELD_NAMES = [field.name for field in Patient._meta.concrete_fields]
+
+    def get_requested_fields(self):
+        if not hasattr(self, "_requested_fields"):
+            raw = self.request.query_params.get("fields", "")
+            fields = [name.strip() for name in raw.split(",") if name.strip()]
+            unknown = sorted(set(fields) - set(self.FIELD_NAMES))
+            if unknown:
+                raise ValidationError({"fields": [f"Unknown field(s): {', '.join(unknown)}"]})
+            if fields and "id" not in fields:
+                fields.insert(0, "id")
+            self._requested_fields = fields
+        return self._requested_fields
+
+    def get_queryset(self):
+        queryset = PatientListView().filter_queryset(Patient.objects.all(), self.request.query_params)
+        fields = self.get_requested_fields()
+        if fields:
+            # updated_at is needed for the ETag even when not requested (avoids a deferred load)
+            queryset = queryset.only("updated_at", *fields)
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault("fields", self.get_requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    def _etag(self, *parts):
+        key = "|".join(str(part) for part in (self.request.get_full_path(), *parts))
+        return f'"{hashlib.md5(key.encode("utf-8")).hexdigest()}"'
+
+    def list(self, request, *args, **kwargs):
+        # Any save bumps updated_at and deletes change the count, so this one
+        # aggregate query is enough to answer If-None-Match without serializing.
+        stats = self.get_queryset().aggregate(count=Count("id"), last_id=Max("id"), last_updated=Max("updated_at"))
+        etag = self._etag(stats["count"], stats["last_id"], stats["last_updated"])
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        response = super().list(request, *args, **kwargs)
+        response["ETag"] = etag
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag = self._etag(instance.pk, instance.updated_at)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        response = Response(self.get_serializer(instance).data)
+        response["ETag"] = etag
+        return response
@@ -1,11 +1,90 @@
-from django.contrib import admin
+import csv
+
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import render
+from django.urls import path
+
+from .forms import PatientImportForm
 from .models import Patient, UserProfile, PatientDataset
+from .views_helper import (
+    PatientImportInterrupted,
+    guess_patient_import_format,
+    import_patients,
+    iter_patient_import_rows,
+)
+
+# 导入结果页最多展示多少条逐行错误
+IMPORT_ERRORS_SHOWN = 200
 
 
 @admin.register(Patient)
 class PatientAdmin(admin.ModelAdmin):
-    list_display = ("name", "gender", "bed_number", "admission_date")
+    list_display = ("name", "gender", "bed_number", "admission_date", "file_count", "file_bytes")
     search_fields = ("name", "bed_number", "department")
+    change_list_template = "admin/epilepsy/patient/change_list.html"
+
+    def get_urls(self):
+        urls = [
+            path(
+                "import/",
+                self.admin_site.admin_view(self.import_view),
+                name="epilepsy_patient_import",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def import_view(self, request):
+        """批量导入患者（CSV / NDJSON），与 manage.py import_patients 使用同一套校验和批量写入。"""
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+
+        stats = None
+        if request.method == "POST":
+            form = PatientImportForm(request.POST, request.FILES)
+            if form.is_valid():
+                uploaded = form.cleaned_data["file"]
+                try:
+                    stats = import_patients(
+                        iter_patient_import_rows(
+                            uploaded,
+                            guess_patient_import_format(uploaded.name),
+                            filename=uploaded.name,
+                        ),
+                        batch_size=form.cleaned_data["batch_size"],
+                        dry_run=form.cleaned_data["dry_run"],
+                    )
+                except PatientImportInterrupted as e:
+                    if not e.created or form.cleaned_data["dry_run"]:
+                        messages.error(request, f"无法读取导入文件：{e}")
+                    else:
+                        messages.error(
+                            request,
+                            f"读取到第 {e.rows} 行时出错：{e}。出错前已写入 {e.created} 行，"
+                            f"这些行不会回滚，修正文件后请只导入剩余部分。",
+                        )
+                except (OSError, csv.Error, ValueError) as e:
+                    messages.error(request, f"无法读取导入文件：{e}")
+                else:
+                    action = "校验通过" if form.cleaned_data["dry_run"] else "导入"
+                    level = messages.WARNING if stats["failed"] else messages.SUCCESS
+                    messages.add_message(
+                        request, level,
+                        f"共 {stats['rows']} 行，{action} {stats['created']}，失败 {stats['failed']}，"
+                        f"用时 {stats['seconds']:.1f}s",
+                    )
+        else:
+            form = PatientImportForm()
+
+        context = {
+            **self.admin_site.each_context(request),
+            "opts": self.model._meta,
+            "title": "批量导入患者",
+            "form": form,
+            "stats": stats,
+            "errors_shown": stats["errors"][:IMPORT_ERRORS_SHOWN] if stats else [],
+        }
+        return render(request, "admin/epilepsy/patient/import.html", context)
 
 
 @admin.register(UserProfile)
@@ -16,5 +95,5 @@ class UserProfileAdmin(admin.ModelAdmin):
 
 @admin.register(PatientDataset)
 class PatientDatasetAdmin(admin.ModelAdmin):
-    list_display = ("patient", "name", "globus_endpoint_id", "is_active")
+    list_display = ("patient", "name", "globus_endpoint_id", "is_active", "indexed_files", "indexed_at")
     search_fields = ("patient__name", "name")
@@ -0,0 +1,179 @@
+# epilepsy/dataset_index.py
+
+"""
+PatientDataset 的本地文件索引（PatientDatasetEntry）：
+从 Globus Endpoint 递归列出 dataset.globus_path，把路径 / 大小 / 修改时间（/ 校验码）存进数据库，
+数据页面和搜索直接查本地索引，不再实时 ls。
+
+增量同步：
+- 每层目录并发 ls（GLOBUS_LS_CONCURRENCY）
+- 已索引过、且修改时间 / 大小没变的子目录不再 ls 自己（目录的 mtime 只在其直接子项增删改名时变化，
+  直接子项沿用已有索引），但仍然往下 ls 它的子目录：更深层的变化不会体现在这个目录的 mtime 上；
+  文件被原地改写不会体现在目录 mtime 上，没变化的目录下的这类改动需要 --full 全量同步
+- 只写有变化的行；某个目录 ls 失败时整个 dataset 本次不写库，保留上一次的索引
+
+命令行同步没有用户登录态，默认用门户自己的 Globus 应用（SOCIAL_AUTH_GLOBUS_KEY / SECRET）
+走 client credentials 取 transfer token；也可以用 settings.GLOBUS_SYNC_TRANSFER_TOKEN 指定。
+应用身份需要对这些 Endpoint 有读权限。
+"""
+
+import posixpath
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+import requests
+
+from api.globus import TRANSFER_SCOPE, transfer_get
+
+from .models import PatientDatasetEntry
+
+ENTRY_WRITE_BATCH_SIZE = 1000
+ENTRY_SEARCH_LIMIT = 500
+
+
+class DatasetIndexError(Exception):
+    pass
+
+
+def get_sync_auth_header():
+    """命令行同步用的 transfer 授权头。"""
+    token = getattr(settings, "GLOBUS_SYNC_TRANSFER_TOKEN", "")
+    if not token:
+        import globus_sdk
+
+        client = globus_sdk.ConfidentialAppAuthClient(
+            settings.SOCIAL_AUTH_GLOBUS_KEY, settings.SOCIAL_AUTH_GLOBUS_SECRET
+        )
+        tokens = client.oauth2_client_credentials_tokens(requested_scopes=TRANSFER_SCOPE)
+        token = tokens.by_resource_server["transfer.api.globus.org"]["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _join(root, rel):
+    return posixpath.join(root, rel) + "/" if rel else root
+
+
+def _list_dir(endpoint_id, path, auth_header):
+    try:
+        response = transfer_get(
+            f"endpoint/{endpoint_id}/ls", auth_header, params={"path": path, "show_hidden": 0}
+        )
+    except requests.RequestException as e:
+        raise DatasetIndexError(f"{path}：{e}")
+    if not response.ok:
+        try:
+            message = response.json().get("message", "")
+        except ValueError:
+            message = response.text[:200]
+        raise DatasetIndexError(f"{path}：HTTP {response.status_code} {message}")
+    return response.json().get("DATA", [])
+
+
+def sync_dataset_index(dataset, auth_header, full=False, max_workers=None):
+    """
+    同步一个 dataset 的文件索引，返回统计：
+    dirs_listed / dirs_skipped / created / updated / deleted / files / bytes
+    """
+    root = dataset.globus_path.rstrip("/") + "/"
+    max_workers = max_workers or getattr(settings, "GLOBUS_LS_CONCURRENCY", 8)
+
+    existing = {entry.path: entry for entry in dataset.entries.all()}
+    children = defaultdict(list)
+    for path in existing:
+        children[posixpath.dirname(path)].append(path)
+
+    seen = set()
+    to_create, to_update = [], []
+    stats = {"dirs_listed": 0, "dirs_skipped": 0, "created": 0, "updated": 0, "deleted": 0}
+
+    def keep_children(path):
+        """沿用没变化目录的直接子项，返回其中的子目录（仍需往下列）。"""
+        child_dirs = []
+        for child in children.get(path, ()):
+            seen.add(child)
+            if existing[child].is_dir:
+                child_dirs.append(child)
+        return child_dirs
+
+    def list_one(rel):
+        return rel, _list_dir(dataset.globus_endpoint_id, _join(root, rel), auth_header)
+
+    frontier = [""]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while frontier:
+            next_frontier = []
+            for rel, items in executor.map(list_one, frontier):
+                stats["dirs_listed"] += 1
+                for item in items:
+                    path = posixpath.join(rel, item["name"]) if rel else item["name"]
+                    is_dir = item.get("type") == "dir"
+                    values = {
+                        "is_dir": is_dir,
+                        "size_bytes": 0 if is_dir else int(item.get("size") or 0),
+                        "modified_at": parse_datetime(item.get("last_modified") or ""),
+                        "checksum": item.get("checksum") or "",
+                    }
+                    seen.add(path)
+
+                    entry = existing.get(path)
+                    if entry is None:
+                        to_create.append(PatientDatasetEntry(
+                            dataset=dataset, path=path, name=item["name"], **values
+                        ))
+                        if is_dir:
+                            next_frontier.append(path)
+                        continue
+
+                    changed = any(getattr(entry, k) != v for k, v in values.items())
+                    if changed:
+                        for k, v in values.items():
+                            setattr(entry, k, v)
+                        to_update.append(entry)
+                    if is_dir:
+                        if full or changed:
+                            next_frontier.append(path)
+                        else:
+                            stats["dirs_skipped"] += 1
+                            next_frontier.extend(keep_children(path))
+            frontier = next_frontier
+
+    stale_ids = [entry.pk for path, entry in existing.items() if path not in seen]
+    with transaction.atomic():
+        PatientDatasetEntry.objects.bulk_create(to_create, batch_size=ENTRY_WRITE_BATCH_SIZE)
+        PatientDatasetEntry.objects.bulk_update(
+            to_update, ["is_dir", "size_bytes", "modified_at", "checksum"], batch_size=ENTRY_WRITE_BATCH_SIZE
+        )
+        for i in range(0, len(stale_ids), ENTRY_WRITE_BATCH_SIZE):
+            PatientDatasetEntry.objects.filter(pk__in=stale_ids[i:i + ENTRY_WRITE_BATCH_SIZE]).delete()
+
+        totals = dataset.entries.filter(is_dir=False).aggregate(files=Count("id"), bytes=Sum("size_bytes"))
+        dataset.indexed_files = totals["files"]
+        dataset.indexed_bytes = totals["bytes"] or 0
+        dataset.indexed_at = timezone.now()
+        dataset.save(update_fields=["indexed_files", "indexed_bytes", "indexed_at"])
+
+    stats.update(
+        created=len(to_create),
+        updated=len(to_update),
+        deleted=len(stale_ids),
+        files=dataset.indexed_files,
+        bytes=dataset.indexed_bytes,
+    )
+    return stats
+
+
+def search_dataset_entries(datasets, q, limit=ENTRY_SEARCH_LIMIT):
+    """在本地索引里按文件名 / 路径搜索（只返回文件）。"""
+    return (
+        PatientDatasetEntry.objects
+        .filter(dataset__in=datasets, is_dir=False)
+        .filter(Q(name__icontains=q) | Q(path__icontains=q))
+        .select_related("dataset")
+        .order_by("dataset_id", "path")[:limit]
+    )
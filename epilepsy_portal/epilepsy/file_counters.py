@@ -0,0 +1,123 @@
+# epilepsy/file_counters.py
+
+"""
+Patient 上冗余的文件统计：{mri,pet,eeg,seeg}_file_count / _file_bytes，以及合计 file_count / file_bytes。
+
+- MRI / PET / EEG / SEEG 文件行新建、删除时由 signals 调用 adjust_file_counters，
+  一条 UPDATE 里用 F() 加减，并发上传 / 删除不会互相覆盖
+- 不发信号的写法（bulk_create、queryset.update(size_bytes=...)）以及历史数据，
+  用 reconcile_file_counters（manage.py reconcile_file_counters）按文件表重算
+- 计数变化不改 updated_at；患者对象缓存在这里一并清掉
+- Patient.save() 整行保存时跳过这些列，编辑患者不会把旧计数写回去
+- 页面按计数跳过查询前先过一遍 repair_zero_file_counters：计数为 0 却有文件行的患者
+  （不发信号的写法留下的）当场重算，之后就不再多查
+"""
+
+from collections import defaultdict
+
+from django.db.models import Count, F, Sum
+
+from .models import FILE_COUNTER_FIELDS, Patient
+from .views_helper import PATIENT_FILE_MODELS, invalidate_patient_object_cache
+
+COUNTER_WRITE_BATCH_SIZE = 1000
+
+
+def get_counter_fields(file_type):
+    return f"{file_type}_file_count", f"{file_type}_file_bytes"
+
+# 文件模型 -> file_type
+FILE_MODEL_TYPES = {model_cls: file_type for file_type, model_cls in PATIENT_FILE_MODELS.items()}
+
+
+def adjust_file_counters(file_type, patient_id, count, size_bytes):
+    """count 为 +1 / -1，size_bytes 同号。"""
+    count_field, bytes_field = get_counter_fields(file_type)
+    Patient.objects.filter(pk=patient_id).update(**{
+        count_field: F(count_field) + count,
+        bytes_field: F(bytes_field) + size_bytes,
+        "file_count": F("file_count") + count,
+        "file_bytes": F("file_bytes") + size_bytes,
+    })
+    invalidate_patient_object_cache(patient_id)
+
+
+def compute_file_counters(patient_ids=None):
+    """按文件表聚合：{patient_id: {字段: 值}}，没有文件的患者不出现。"""
+    totals = defaultdict(lambda: dict.fromkeys(FILE_COUNTER_FIELDS, 0))
+    for file_type, model_cls in PATIENT_FILE_MODELS.items():
+        count_field, bytes_field = get_counter_fields(file_type)
+        qs = model_cls.objects.all()
+        if patient_ids is not None:
+            qs = qs.filter(patient_id__in=patient_ids)
+        rows = qs.values("patient_id").annotate(n=Count("id"), size=Sum("size_bytes")).order_by()
+        for row in rows:
+            values = totals[row["patient_id"]]
+            values[count_field] = row["n"]
+            values[bytes_field] = row["size"] or 0
+            values["file_count"] += row["n"]
+            values["file_bytes"] += row["size"] or 0
+    return totals
+
+
+def reconcile_file_counters(patient_ids=None, dry_run=False):
+    """
+    把患者的文件统计改成按文件表重算的值，返回统计 checked / fixed（dry_run 时 fixed 为有偏差的患者数）。
+    """
+    expected = compute_file_counters(patient_ids)
+    zero = dict.fromkeys(FILE_COUNTER_FIELDS, 0)
+
+    qs = Patient.objects.only("id", *FILE_COUNTER_FIELDS).order_by("id")
+    if patient_ids is not None:
+        qs = qs.filter(pk__in=patient_ids)
+
+    stats = {"checked": 0, "fixed": 0}
+    batch = []
+
+    def flush():
+        if not dry_run:
+            Patient.objects.bulk_update(batch, FILE_COUNTER_FIELDS)
+            for patient in batch:
+                invalidate_patient_object_cache(patient.pk)
+        batch.clear()
+
+    for patient in qs.iterator(chunk_size=COUNTER_WRITE_BATCH_SIZE):
+        stats["checked"] += 1
+        values = expected.get(patient.pk, zero)
+        if all(getattr(patient, name) == value for name, value in values.items()):
+            continue
+        for name, value in values.items():
+            setattr(patient, name, value)
+        batch.append(patient)
+        stats["fixed"] += 1
+        if len(batch) >= COUNTER_WRITE_BATCH_SIZE:
+            flush()
+    if batch:
+        flush()
+    return stats
+
+
+def repair_zero_file_counters(patients):
+    """
+    patients 中 file_count 为 0 的，用 exists 式查询（每种文件一条）确认是否真的没有文件；
+    有文件的当场 reconcile，并把新计数写回传入的实例。返回被修正的患者 id 集合。
+    """
+    zero_ids = [patient.pk for patient in patients if not patient.file_count]
+    if not zero_ids:
+        return set()
+
+    found = set()
+    for model_cls in PATIENT_FILE_MODELS.values():
+        found.update(
+            model_cls.objects.filter(patient_id__in=zero_ids).values_list("patient_id", flat=True).distinct()
+        )
+    if not found:
+        return found
+
+    reconcile_file_counters(found)
+    fresh = {row["id"]: row for row in Patient.objects.filter(pk__in=found).values("id", *FILE_COUNTER_FIELDS)}
+    for patient in patients:
+        if patient.pk in fresh:
+            for name in FILE_COUNTER_FIELDS:
+                setattr(patient, name, fresh[patient.pk][name])
+    return found
@@ -952,3 +952,11 @@ class SEEGFileForm(forms.ModelForm):
             "hash_code": "哈希码",
             "sha256_code": "SHA256 校验码",
         }
+
+
+class PatientImportForm(forms.Form):
+    """后台“批量导入患者”上传表单。"""
+
+    file = forms.FileField(label="导入文件", help_text="CSV（首行为表头）或 NDJSON（每行一个 JSON），可为 .gz")
+    batch_size = forms.IntegerField(label="每批写入行数", min_value=1, initial=1000)
+    dry_run = forms.BooleanField(label="只校验，不写入", required=False)
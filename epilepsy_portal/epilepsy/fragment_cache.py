@@ -0,0 +1,128 @@
+# epilepsy/fragment_cache.py
+
+"""
+HTML 片段缓存（settings.CACHES["fragments"]）使用的缓存后端：
+在 Django 自带的 LocMem / FileBased 后端上加命中率统计。
+
+- 每次 get 按片段名记一次命中 / 未命中：
+  * {% cache %} 模板标签的 key 形如 template.cache.<片段名>.<hash>
+  * 其余 key 取前两段，如 epilepsy:patient-detail
+- 计数在进程内累加，定期（及进程退出时）写到 OPTIONS["STATS_DIR"] 下每个进程一个 json 文件，
+  由 manage.py fragment_cache_stats 汇总（LocMem 是进程内缓存，统计必须落盘才能跨进程看到）
+"""
+
+import os
+import json
+import time
+import atexit
+import socket
+import tempfile
+import threading
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+
+DEFAULT_STATS_DIR = os.path.join(tempfile.gettempdir(), "epilepsy-fragment-cache-stats")
+
+# 进程内计数：{(alias 的统计目录, 片段名): [hits, misses]}；多个线程各有自己的 cache 实例，计数放在模块级
+_MISSING = object()
+_counts = {}
+_lock = threading.Lock()
+_last_flush = {"at": time.monotonic()}
+
+FLUSH_INTERVAL_SECONDS = 30
+
+
+def fragment_name(key):
+    if key.startswith("template.cache."):
+        return key[len("template.cache."):].rsplit(".", 1)[0]
+    return ":".join(key.split(":")[:2])
+
+
+def _stats_file(stats_dir):
+    return os.path.join(stats_dir, f"{socket.gethostname()}-{os.getpid()}.json")
+
+
+def flush_stats():
+    """把本进程的累计计数写到各统计目录（原子替换）。"""
+    with _lock:
+        by_dir = {}
+        for (stats_dir, name), (hits, misses) in _counts.items():
+            by_dir.setdefault(stats_dir, {})[name] = [hits, misses]
+        _last_flush["at"] = time.monotonic()
+
+    for stats_dir, data in by_dir.items():
+        try:
+            os.makedirs(stats_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=stats_dir, suffix=".tmp")
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, _stats_file(stats_dir))
+        except OSError:
+            pass
+
+
+atexit.register(flush_stats)
+
+
+def read_stats(stats_dir):
+    """汇总统计目录下所有进程的计数：{片段名: [hits, misses]}。"""
+    totals = {}
+    if not os.path.isdir(stats_dir):
+        return totals
+    for fn in os.listdir(stats_dir):
+        if not fn.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(stats_dir, fn)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for name, (hits, misses) in data.items():
+            total = totals.setdefault(name, [0, 0])
+            total[0] += hits
+            total[1] += misses
+    return totals
+
+
+def reset_stats(stats_dir):
+    """清空统计：删除所有进程的统计文件，并把本进程计数归零。"""
+    with _lock:
+        for key in [k for k in _counts if k[0] == stats_dir]:
+            del _counts[key]
+    if not os.path.isdir(stats_dir):
+        return
+    for fn in os.listdir(stats_dir):
+        if fn.endswith(".json"):
+            try:
+                os.remove(os.path.join(stats_dir, fn))
+            except OSError:
+                pass
+
+
+class FragmentStatsMixin:
+    def __init__(self, location, params):
+        super().__init__(location, params)
+        self.stats_dir = params.get("OPTIONS", {}).get("STATS_DIR") or DEFAULT_STATS_DIR
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        hit = value is not _MISSING
+
+        counter_key = (self.stats_dir, fragment_name(key))
+        with _lock:
+            counts = _counts.setdefault(counter_key, [0, 0])
+            counts[0 if hit else 1] += 1
+            due = time.monotonic() - _last_flush["at"] >= FLUSH_INTERVAL_SECONDS
+        if due:
+            flush_stats()
+
+        return value if hit else default
+
+
+class FragmentLocMemCache(FragmentStatsMixin, LocMemCache):
+    pass
+
+
+class FragmentFileBasedCache(FragmentStatsMixin, FileBasedCache):
+    pass
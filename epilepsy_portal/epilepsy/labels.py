@@ -0,0 +1,154 @@
+# epilepsy/labels.py
+
+"""
+患者字段 code -> 中文 的统一翻译。
+
+详情页 / 导出（CSV、Word、PDF、列式）/ 模板过滤器都走这里：
+- 首次使用时根据 Patient 字段元数据编译一次：每个字段一张 {code: label} 字典
+- 多选字段（逗号分隔存储）在 MULTI_CHOICE_MAP 中声明，翻译时先拆分再逐个查表
+- 提供按行批量翻译的接口，配合 values() / values_list() 使用，不需要实例化模型
+"""
+
+import ast
+import json
+from functools import lru_cache
+
+from .models import Patient
+
+# 这些字段是“逗号分隔存储”的多选 code，模型字段上没有 choices，需要手动声明对应的选项
+MULTI_CHOICE_MAP = {
+    "past_medical_history": dict(Patient.PAST_MEDICAL_HISTORY_CHOICES),
+    "other_medical_history": dict(Patient.OTHER_MEDICAL_HISTORY_CHOICES),
+    "eeg_interictal_state": dict(Patient.EEG_INTERICTAL_STATE_CHOICES),
+    "eeg_interictal_location": dict(Patient.EEG_INTERICTAL_LOCATION_CHOICES),
+    "eeg_interictal_morph": dict(Patient.EEG_INTERICTAL_MORPH_CHOICES),
+    "eeg_interictal_amount": dict(Patient.EEG_INTERICTAL_AMOUNT_CHOICES),
+    "eeg_interictal_pattern": dict(Patient.EEG_INTERICTAL_PATTERN_CHOICES),
+    "eeg_interictal_eye_relation": dict(Patient.EEG_INTERICTAL_EYE_RELATED_CHOICES),
+    "eeg_ictal_state": dict(Patient.EEG_INTERICTAL_STATE_CHOICES),
+    "eeg_ictal_location": dict(Patient.EEG_INTERICTAL_LOCATION_CHOICES),
+    "eeg_onset_pattern": dict(Patient.EEG_ONSET_PATTERN_CHOICES),
+    "seeg_ictal_morph": dict(Patient.EEG_INTERICTAL_MORPH_CHOICES),
+    "seeg_ictal_amount": dict(Patient.EEG_INTERICTAL_AMOUNT_CHOICES),
+    "seeg_ictal_pattern": dict(Patient.EEG_INTERICTAL_PATTERN_CHOICES),
+    "seeg_ictal_onset_pattern": dict(Patient.SEEG_ICTAL_ONSET_PATTERN_CHOICES),
+}
+
+# 多选翻译结果的连接符（与原 get_display_value 保持一致）
+MULTI_LABEL_SEPARATOR = "，"
+
+
+def split_codes(value):
+    """
+    把多选值拆成 code 列表：
+    - list / tuple / set：逐个转成 str
+    - 'A,B'：逗号分隔（最常见，只做一次 split）
+    - '["A","B"]' / "['A','B']"：只有以 [ 开头时才尝试 JSON / Python 字面量解析
+    """
+    if value is None or value == "":
+        return []
+    if isinstance(value, (list, tuple, set)):
+        return [str(v) for v in value if v not in (None, "")]
+
+    s = str(value).strip()
+    if s.startswith("["):
+        for parse in (json.loads, ast.literal_eval):
+            try:
+                parsed = parse(s)
+            except (ValueError, SyntaxError):
+                continue
+            if isinstance(parsed, list):
+                return [str(v) for v in parsed if v not in (None, "")]
+    if "," not in s:
+        return [s] if s else []
+    return [v.strip() for v in s.split(",") if v.strip()]
+
+
+class LabelTranslator:
+    """
+    预编译的 code -> label 翻译器，按字段名查表。
+    没有 choices 的字段不翻译，原样返回。
+    """
+
+    def __init__(self, model=Patient, multi_choice_map=MULTI_CHOICE_MAP):
+        self.model = model
+        self.multi_fields = frozenset(multi_choice_map)
+        self.tables = {}
+        for field in model._meta.concrete_fields:
+            if field.name in multi_choice_map:
+                self.tables[field.name] = dict(multi_choice_map[field.name])
+            elif field.choices:
+                self.tables[field.name] = dict(field.flatchoices)
+
+    def table(self, field_name):
+        """字段的 {code: label}；没有 choices 时返回 None。"""
+        return self.tables.get(field_name)
+
+    def labels(self, field_name, value):
+        """多选 / 单选统一返回 label 列表（未知 code 原样保留）。"""
+        mapping = self.tables.get(field_name)
+        codes = split_codes(value)
+        if mapping is None:
+            return codes
+        return [mapping.get(code, code) for code in codes]
+
+    def label(self, field_name, value):
+        """
+        单个字段的显示值：
+        - 空值 -> ''
+        - 多选字段 / list 值：逐个翻译后用 '，' 连接
+        - 单选字段：查表，未知 code 原样返回
+        - 没有 choices 的字段：原样返回
+        """
+        if value is None or value == "" or value == [] or value == {}:
+            return ""
+        mapping = self.tables.get(field_name)
+        if mapping is None:
+            return value
+        if field_name in self.multi_fields or isinstance(value, (list, tuple, set)):
+            return MULTI_LABEL_SEPARATOR.join(mapping.get(code, code) for code in split_codes(value))
+        return mapping.get(value, value)
+
+    def translate_row(self, row):
+        """翻译 values() 返回的一行 dict，返回新 dict。"""
+        label = self.label
+        return {name: label(name, value) for name, value in row.items()}
+
+    def row_translator(self, field_names):
+        """
+        为 values_list(*field_names) 的行生成翻译函数：每列的查表方式提前确定，
+        逐行调用时只剩字典查找。返回 callable(row_tuple) -> list。
+        """
+        steps = []
+        for name in field_names:
+            mapping = self.tables.get(name)
+            if mapping is None:
+                steps.append(None)
+            elif name in self.multi_fields:
+                steps.append((mapping, True))
+            else:
+                steps.append((mapping, False))
+
+        def translate(row):
+            out = []
+            for step, value in zip(steps, row):
+                if step is None or value is None or value == "":
+                    out.append(value)
+                    continue
+                mapping, is_multi = step
+                if is_multi:
+                    # 与 label() 同样用 split_codes 拆分（单个 code 的 '["A"]' 也要解析）
+                    out.append(MULTI_LABEL_SEPARATOR.join(
+                        mapping.get(code, code) for code in split_codes(value)
+                    ))
+                else:
+                    out.append(mapping.get(value, value))
+            return out
+
+        return translate
+
+
+@lru_cache(maxsize=None)
+def get_label_translator():
+    """进程内只编译一次的 Patient 翻译器。"""
+    return LabelTranslator()
@@ -0,0 +1,39 @@
+# epilepsy/management/commands/backfill_file_metadata.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from epilepsy.file_counters import reconcile_file_counters
+from epilepsy.views_helper import PATIENT_FILE_MODELS, backfill_patient_file_metadata
+
+
+class Command(BaseCommand):
+    help = "并发 stat 已有的 MRI / PET / EEG / SEEG 文件，回填 size_bytes（及空的 file_ext / media_type），并重算患者文件统计"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--type", choices=sorted(PATIENT_FILE_MODELS), action="append", default=[], help="只处理这些文件类型（可重复）"
+        )
+        parser.add_argument("--all", action="store_true", help="重新 stat 全部记录（默认只处理 size_bytes 为 0 的）")
+        parser.add_argument("--workers", type=int, default=None, help="并发 stat 数（默认 FILE_METADATA_WORKERS）")
+
+    def handle(self, *args, **options):
+        patient_ids = set()
+        for file_type in options["type"] or PATIENT_FILE_MODELS:
+            start = time.perf_counter()
+            stats = backfill_patient_file_metadata(
+                PATIENT_FILE_MODELS[file_type], all_rows=options["all"], max_workers=options["workers"]
+            )
+            patient_ids |= stats["patient_ids"]
+            self.stdout.write(
+                f"{file_type}：检查 {stats['checked']} 条，更新 {stats['updated']} 条，"
+                f"文件缺失 {stats['missing']} 条，用时 {time.perf_counter() - start:.1f}s"
+            )
+            if stats["missing"]:
+                self.stderr.write(f"{file_type}：{stats['missing']} 条记录找不到物理文件，size_bytes 保持不变")
+
+        if patient_ids:
+            stats = reconcile_file_counters(patient_ids=sorted(patient_ids))
+            self.stdout.write(f"重算 {stats['checked']} 个患者的文件统计，修正 {stats['fixed']} 个")
+        self.stdout.write(self.style.SUCCESS("回填完成"))
@@ -0,0 +1,115 @@
+# epilepsy/management/commands/benchmark_label_translation.py
+
+import ast
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from epilepsy.json import FIELDS_FOR_EXPORT
+from epilepsy.labels import MULTI_CHOICE_MAP, get_label_translator
+from epilepsy.models import Patient
+from epilepsy.templatetags.choice_display import display_multi
+from epilepsy.views_helper import get_display_value
+
+
+def _legacy_get_display_value(obj, field_name):
+    """
+    改造前的逐次翻译方式（每次调用都 get_field + dict(choices)），仅作为基准对比。
+    """
+    value = getattr(obj, field_name, "")
+    if value in (None, "", [], {}):
+        return ""
+    method_name = f"get_{field_name}_display"
+    if hasattr(obj, method_name):
+        return getattr(obj, method_name)()
+    mapping = MULTI_CHOICE_MAP.get(field_name)
+    if mapping is None:
+        field = obj._meta.get_field(field_name)
+        mapping = dict(field.flatchoices) if field.choices else None
+    if mapping:
+        codes = [v.strip() for v in str(value).split(",") if v.strip()]
+        return "，".join(mapping.get(code, code) for code in codes)
+    return value
+
+
+def _legacy_display_multi(value, choices):
+    """改造前的 display_multi：每次 json.loads -> ast.literal_eval -> dict(choices)。"""
+    if value in (None, "", [], ()):
+        return "-"
+    vals = None
+    s = str(value).strip()
+    try:
+        parsed = json.loads(s)
+        if isinstance(parsed, list):
+            vals = parsed
+    except Exception:
+        pass
+    if vals is None:
+        try:
+            parsed = ast.literal_eval(s)
+            if isinstance(parsed, list):
+                vals = parsed
+        except Exception:
+            pass
+    if vals is None:
+        vals = [v.strip() for v in s.split(",") if v.strip()]
+    mapping = dict(choices)
+    labels = [mapping.get(v, v) for v in vals]
+    return "、".join(labels) if labels else "-"
+
+
+class Command(BaseCommand):
+    help = "对比 code -> 中文 翻译的旧实现与预编译翻译器（labels.py）的耗时"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=2000, help="翻译多少行（不足时循环使用已有患者）")
+        parser.add_argument("--repeat", type=int, default=3, help="每项重复次数，取最快一次")
+
+    def _time(self, func, repeat):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        return best
+
+    def handle(self, *args, **options):
+        rows, repeat = options["rows"], options["repeat"]
+        field_names = [name for name, _ in FIELDS_FOR_EXPORT]
+
+        patients = list(Patient.objects.all()[:rows])
+        if not patients:
+            raise CommandError("数据库中没有患者，无法测试")
+        patients = (patients * (rows // len(patients) + 1))[:rows]
+        value_rows = list(Patient.objects.values_list(*field_names)[:rows])
+        value_rows = (value_rows * (rows // len(value_rows) + 1))[:rows]
+        multi_values = [
+            (getattr(p, name), list(MULTI_CHOICE_MAP[name].items()), name)
+            for p in patients for name in MULTI_CHOICE_MAP
+        ]
+
+        translator = get_label_translator()
+        translate_row = translator.row_translator(field_names)
+        cells = rows * len(field_names)
+
+        results = [
+            ("get_display_value（旧）", cells,
+             lambda: [_legacy_get_display_value(p, f) for p in patients for f in field_names]),
+            ("get_display_value（新）", cells,
+             lambda: [get_display_value(p, f) for p in patients for f in field_names]),
+            ("row_translator（values_list 整行）", cells,
+             lambda: [translate_row(r) for r in value_rows]),
+            ("display_multi（旧）", len(multi_values),
+             lambda: [_legacy_display_multi(v, c) for v, c, _ in multi_values]),
+            ("display_multi（新）", len(multi_values),
+             lambda: [display_multi(v, name) for v, _, name in multi_values]),
+        ]
+
+        self.stdout.write(f"{rows} 行 × {len(field_names)} 列，重复 {repeat} 次取最快：")
+        for label, count, func in results:
+            seconds = self._time(func, repeat)
+            self.stdout.write(
+                f"  {label:<36} {seconds * 1000:9.1f} ms  {count / seconds / 1e6 if seconds else 0:6.2f} M 次/秒"
+            )
@@ -0,0 +1,184 @@
+# epilepsy/management/commands/benchmark_patient_detail.py
+
+import time
+import datetime
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models
+from django.template import Template, Context
+from django.template.loader import get_template
+
+from epilepsy.forms import PatientForm
+from epilepsy.labels import get_label_translator
+from epilepsy.models import Patient
+from epilepsy.views_helper import (
+    PATIENT_DETAIL_SECTIONS,
+    build_patient_detail,
+)
+
+SECTION_TEMPLATE_NAME = "epilepsy/patient_detail_section.html"
+
+# 改造前每个字段在模板里的写法（由 generate_patient_detail_partial.py 生成），仅作为基准对比
+_LEGACY_FIELD_BLOCK = """      <div class="col-md-6 mb-3">
+        <div class="border rounded p-2 h-100">
+          <div class="text-muted small mb-1">
+            {% if form.NAME %}{{ form.NAME.label }}{% else %}NAME{% endif %}
+          </div>
+          <div>
+            {% if form.NAME %}
+              {% with bf=form.NAME val=form.NAME.value %}
+                {% if bf.field.choices %}
+                  {% if val %}
+                    {% if bf.field.widget.allow_multiple_selected %}
+                      {% for v,l in bf.field.choices %}
+                        {% if v in val %}<span class="badge badge-secondary mr-1">{{ l }}</span>{% endif %}
+                      {% endfor %}
+                    {% else %}
+                      {% for v,l in bf.field.choices %}
+                        {% if v == val %}{{ l }}{% endif %}
+                      {% endfor %}
+                    {% endif %}
+                  {% else %}-{% endif %}
+                {% else %}
+                  {{ val|default:"-"|linebreaksbr }}
+                {% endif %}
+              {% endwith %}
+            {% else %}
+              -
+            {% endif %}
+          </div>
+        </div>
+      </div>
+"""
+
+_LEGACY_SECTION = """    <div class="card mb-3">
+      <div class="card-header" id="heading{key}">
+        <h5 class="mb-0">
+          <button class="btn btn-link btn-block text-left{collapsed}" type="button"
+                  data-toggle="collapse" data-target="#collapse{key}"
+                  aria-expanded="{expanded}" aria-controls="collapse{key}">
+            {title}
+          </button>
+        </h5>
+      </div>
+
+      <div id="collapse{key}" class="collapse{show}"
+           aria-labelledby="heading{key}" data-parent="#patientAccordion">
+        <div class="card-body">
+    <div class="row">
+{fields}    </div>
+        </div>
+      </div>
+    </div>
+
+"""
+
+
+def _legacy_template_source():
+    """按改造前的写法（逐字段 PatientForm 模板）拼出全部分区，得到改造前的模板。"""
+    sections = []
+    for index, (_slug, key, title, field_names) in enumerate(PATIENT_DETAIL_SECTIONS):
+        expanded = index == 0
+        sections.append(_LEGACY_SECTION.format(
+            key=key,
+            title=title,
+            collapsed="" if expanded else " collapsed",
+            expanded="true" if expanded else "false",
+            show=" show" if expanded else "",
+            fields="".join(_LEGACY_FIELD_BLOCK.replace("NAME", name) for name in field_names),
+        ))
+    return "".join(sections)
+
+
+def _fully_populated_patient():
+    """构造一个（不入库的）所有字段都有值的患者：单选取第一个选项，多选全选，文本带换行。"""
+    translator = get_label_translator()
+    patient = Patient(pk=0)
+    for field in Patient._meta.concrete_fields:
+        if field.primary_key or isinstance(field, models.DateTimeField):
+            continue
+        table = translator.table(field.name)
+        if table:
+            codes = [code for code in table if code]
+            value = ",".join(codes) if field.name in translator.multi_fields else codes[0]
+        elif field.choices:
+            value = next(code for code, _ in field.flatchoices if code)
+        elif isinstance(field, models.DateField):
+            value = datetime.date(2020, 1, 1)
+        elif isinstance(field, models.DecimalField):
+            value = Decimal("12.50")
+        elif isinstance(field, models.URLField):
+            value = "https://example.org/data"
+        elif isinstance(field, models.TextField):
+            value = "第一行描述\n第二行描述"
+        else:
+            value = "示例文本"[: field.max_length or None]
+        setattr(patient, field.name, value)
+    return patient
+
+
+class Command(BaseCommand):
+    help = "对比详情页改造前（PatientForm + 逐字段模板）与改造后（只读视图模型）的渲染耗时"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pk", type=int, default=None, help="使用已有患者；默认构造一个所有字段都有值的患者")
+        parser.add_argument("--repeat", type=int, default=200, help="每种方式渲染多少次")
+
+    def _time(self, func, repeat):
+        func()  # 预热：模板编译、翻译表编译都不计入
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return (time.perf_counter() - start) / repeat
+
+    def handle(self, *args, **options):
+        repeat = options["repeat"]
+        if options["pk"] is not None:
+            try:
+                patient = Patient.objects.get(pk=options["pk"])
+            except Patient.DoesNotExist:
+                raise CommandError(f"患者 #{options['pk']} 不存在")
+        else:
+            patient = _fully_populated_patient()
+
+        # 只比较全部字段分区（不含画廊、不走片段缓存）
+        legacy_template = Template(_legacy_template_source())
+        section_template = get_template(SECTION_TEMPLATE_NAME)
+
+        def legacy_build():
+            return PatientForm(instance=patient)
+
+        def detail_build():
+            return build_patient_detail(patient)
+
+        def legacy_render():
+            return legacy_template.render(Context({"patient": patient, "form": legacy_build()}))
+
+        def detail_render():
+            return "".join(section_template.render({"section": section}) for section in detail_build())
+
+        legacy_html, detail_html = legacy_render(), detail_render()
+        fields = sum(len(names) for *_, names in PATIENT_DETAIL_SECTIONS)
+        self.stdout.write(
+            f"患者 #{patient.pk}，{len(PATIENT_DETAIL_SECTIONS)} 个分区 / {fields} 个字段，"
+            f"每种方式 {repeat} 次取平均："
+        )
+
+        results = [
+            ("构造 PatientForm（旧）", legacy_build),
+            ("build_patient_detail（新）", detail_build),
+            ("构造 + 渲染（旧）", legacy_render),
+            ("构造 + 渲染（新）", detail_render),
+        ]
+        timings = {}
+        for label, func in results:
+            seconds = self._time(func, repeat)
+            timings[label] = seconds
+            self.stdout.write(f"  {label:<28} {seconds * 1000:8.2f} ms")
+
+        old, new = timings["构造 + 渲染（旧）"], timings["构造 + 渲染（新）"]
+        self.stdout.write(self.style.SUCCESS(
+            f"详情页字段部分：{old * 1000:.2f} ms -> {new * 1000:.2f} ms（{old / new if new else 0:.1f}x），"
+            f"HTML {len(legacy_html) // 1024} KB -> {len(detail_html) // 1024} KB"
+        ))
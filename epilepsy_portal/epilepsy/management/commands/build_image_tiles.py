@@ -0,0 +1,62 @@
+# epilepsy/management/commands/build_image_tiles.py
+
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from epilepsy.views_helper import (
+    PATIENT_FILE_MODELS,
+    PREVIEW_IMAGE_EXTS,
+    build_patient_file_tiles,
+    get_patient_file_tile_paths,
+    needs_patient_file_tiles,
+)
+
+
+class Command(BaseCommand):
+    help = "为超过像素阈值的大图生成 Deep Zoom（DZI）瓦片（补齐历史文件 / 重新生成）"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--type",
+            dest="file_types",
+            action="append",
+            choices=sorted(PATIENT_FILE_MODELS),
+            help="只处理指定模态，可重复；默认全部",
+        )
+        parser.add_argument("--patient", type=int, help="只处理某个患者 id")
+        parser.add_argument("--force", action="store_true", help="已有瓦片也重新生成")
+
+    def handle(self, *args, **options):
+        base_dir = getattr(settings, "LARGE_FILE_BASE_DIR", settings.BASE_DIR / "large_files")
+        file_types = options["file_types"] or list(PATIENT_FILE_MODELS)
+
+        built = skipped = failed = 0
+        start = time.monotonic()
+        for file_type in file_types:
+            qs = PATIENT_FILE_MODELS[file_type].objects.filter(file_ext__in=PREVIEW_IMAGE_EXTS)
+            if options["patient"]:
+                qs = qs.filter(patient_id=options["patient"])
+
+            for file_obj in qs.only("id", "parent_path", "save_name", "hash_code").iterator():
+                file_path = os.path.join(base_dir, file_obj.parent_path, file_obj.save_name)
+                dzi_path, _ = get_patient_file_tile_paths(file_path, file_obj.hash_code)
+                if os.path.exists(dzi_path) and not options["force"]:
+                    skipped += 1
+                    continue
+                if not os.path.exists(file_path) or not needs_patient_file_tiles(file_path):
+                    skipped += 1
+                    continue
+
+                if build_patient_file_tiles(file_obj, file_path, force=options["force"]):
+                    built += 1
+                    self.stdout.write(f"{file_type} #{file_obj.id}: {dzi_path}")
+                else:
+                    failed += 1
+                    self.stderr.write(f"{file_type} #{file_obj.id}: 生成失败")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"完成：生成 {built}，跳过 {skipped}，失败 {failed}，用时 {time.monotonic() - start:.1f}s"
+        ))
@@ -0,0 +1,53 @@
+# epilepsy/management/commands/export_cohort.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+
+from epilepsy.models import Patient
+from epilepsy.views import PatientListView
+from epilepsy.views_helper import export_patient_cohort
+
+
+class Command(BaseCommand):
+    help = "导出患者队列为列式文件（Parquet / gzip NDJSON），供 pandas 等分析使用"
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="输出文件路径，如 cohort.parquet / cohort.ndjson.gz")
+        parser.add_argument(
+            "--format",
+            dest="fmt",
+            choices=["parquet", "ndjson"],
+            default=None,
+            help="默认 parquet；未安装 pyarrow 时为 ndjson",
+        )
+        parser.add_argument(
+            "--filter",
+            default="",
+            help="与患者列表页相同的查询参数，如 \"age_min=18&aura=Y\"；默认导出全部患者",
+        )
+        parser.add_argument("--labels", action="store_true", help="把 code 翻译为中文")
+        parser.add_argument("--chunk-size", type=int, default=None, help="每批读取 / 写出的行数")
+
+    def handle(self, *args, **options):
+        patients = Patient.objects.all()
+        if options["filter"]:
+            patients = PatientListView().filter_queryset(patients, QueryDict(options["filter"]))
+
+        start = time.monotonic()
+        try:
+            fmt, total = export_patient_cohort(
+                patients.order_by("id"),
+                options["output"],
+                fmt=options["fmt"],
+                labels=options["labels"],
+                chunk_size=options["chunk_size"],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        seconds = time.monotonic() - start
+        self.stdout.write(self.style.SUCCESS(
+            f"完成：{total} 位患者 -> {options['output']}（{fmt}），用时 {seconds:.2f}s"
+        ))
@@ -0,0 +1,47 @@
+# epilepsy/management/commands/export_patient_reports.py
+
+from django.core.management.base import BaseCommand, CommandError
+
+from epilepsy.models import Patient
+from epilepsy.views_helper import PATIENT_EXPORT_FORMATS, export_patient_reports
+
+
+class Command(BaseCommand):
+    help = "批量导出患者报告（Word / PDF / CSV），多进程渲染后打包成一个 zip"
+
+    def add_arguments(self, parser):
+        parser.add_argument("output", help="输出的 zip 文件路径")
+        parser.add_argument(
+            "--format",
+            dest="fmt",
+            default="word",
+            choices=sorted(PATIENT_EXPORT_FORMATS),
+            help="报告格式（默认 word）",
+        )
+        parser.add_argument(
+            "--ids",
+            default="",
+            help="逗号分隔的患者 id；不指定时导出全部患者",
+        )
+        parser.add_argument("--workers", type=int, default=None, help="子进程数（默认 CPU 核数）")
+
+    def handle(self, *args, **options):
+        patients = Patient.objects.order_by("id")
+        if options["ids"]:
+            try:
+                id_list = [int(x) for x in options["ids"].split(",") if x.strip()]
+            except ValueError:
+                raise CommandError("--ids 需要是逗号分隔的数字")
+            patients = patients.filter(id__in=id_list)
+
+        stats = export_patient_reports(
+            patients.iterator(),
+            options["fmt"],
+            options["output"],
+            max_workers=options["workers"],
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"完成：{stats['patients']} 位患者（渲染 {stats['rendered']}，复用 {stats['reused']}），"
+            f"用时 {stats['seconds']:.2f}s，{stats['patients_per_second']:.1f} 患者/秒 -> {options['output']}"
+        ))
@@ -0,0 +1,53 @@
+# epilepsy/management/commands/fragment_cache_stats.py
+
+import os
+
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+
+from epilepsy.fragment_cache import FragmentStatsMixin, read_stats, reset_stats
+from epilepsy.views_helper import PATIENT_FRAGMENT_CACHE_ALIAS
+
+
+class Command(BaseCommand):
+    help = "汇总 HTML 片段缓存（列表行 / 详情面板 / 详情分区）的命中率"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--reset", action="store_true", help="输出后清空已累计的统计")
+
+    def handle(self, *args, **options):
+        fragment_cache = caches[PATIENT_FRAGMENT_CACHE_ALIAS]
+        if not isinstance(fragment_cache, FragmentStatsMixin):
+            raise CommandError(
+                f'CACHES["{PATIENT_FRAGMENT_CACHE_ALIAS}"] 没有使用 epilepsy.fragment_cache 的后端，无法统计命中率'
+            )
+
+        self.stdout.write(f"后端：{type(fragment_cache).__name__}，统计目录：{fragment_cache.stats_dir}")
+        location = getattr(fragment_cache, "_dir", None)
+        if location and os.path.isdir(location):
+            files = [e for e in os.scandir(location) if e.is_file() and e.name.endswith(".djcache")]
+            size = sum(e.stat().st_size for e in files)
+            self.stdout.write(f"缓存条目：{len(files)}，占用 {size / 1024 / 1024:.1f} MB（{location}）")
+
+        totals = read_stats(fragment_cache.stats_dir)
+        if not totals:
+            self.stdout.write("暂无统计（进程每 30 秒或退出时写一次统计）")
+        else:
+            all_hits = all_misses = 0
+            self.stdout.write(f"  {'片段':<28} {'命中':>10} {'未命中':>10} {'命中率':>8}")
+            for name, (hits, misses) in sorted(totals.items()):
+                all_hits += hits
+                all_misses += misses
+                self.stdout.write(f"  {name:<28} {hits:>10} {misses:>10} {self._ratio(hits, misses):>8}")
+            self.stdout.write(self.style.SUCCESS(
+                f"  {'合计':<28} {all_hits:>10} {all_misses:>10} {self._ratio(all_hits, all_misses):>8}"
+            ))
+
+        if options["reset"]:
+            reset_stats(fragment_cache.stats_dir)
+            self.stdout.write("已清空统计")
+
+    @staticmethod
+    def _ratio(hits, misses):
+        total = hits + misses
+        return f"{hits / total:.1%}" if total else "-"
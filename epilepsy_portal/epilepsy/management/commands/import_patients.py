@@ -0,0 +1,79 @@
+# epilepsy/management/commands/import_patients.py
+
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from epilepsy.views_helper import (
+    PATIENT_IMPORT_BATCH_SIZE,
+    PATIENT_IMPORT_FORMATS,
+    PatientImportInterrupted,
+    guess_patient_import_format,
+    import_patients,
+    iter_patient_import_rows,
+)
+
+
+class Command(BaseCommand):
+    help = "从 CSV / NDJSON 批量导入患者（按 PatientForm 规则校验，bulk_create 分批入库）"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="导入文件，支持 .csv / .ndjson / .jsonl，可带 .gz")
+        parser.add_argument(
+            "--format",
+            dest="fmt",
+            choices=PATIENT_IMPORT_FORMATS,
+            default=None,
+            help="默认按扩展名判断",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=PATIENT_IMPORT_BATCH_SIZE,
+            help=f"每个事务写入多少行（默认 {PATIENT_IMPORT_BATCH_SIZE}）",
+        )
+        parser.add_argument("--dry-run", action="store_true", help="只校验，不写库")
+        parser.add_argument("--errors", default="", help="把逐行错误写到这个 CSV 文件（行号, 字段, 信息）")
+        parser.add_argument("--show-errors", type=int, default=20, help="在终端显示前 N 条错误")
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        fmt = options["fmt"] or guess_patient_import_format(path)
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size 必须大于 0")
+
+        try:
+            with open(path, "rb") as f:
+                stats = import_patients(
+                    iter_patient_import_rows(f, fmt, filename=path),
+                    batch_size=options["batch_size"],
+                    dry_run=options["dry_run"],
+                )
+        except PatientImportInterrupted as e:
+            action = "校验" if options["dry_run"] else "写入"
+            raise CommandError(f"读取 {path} 到第 {e.rows} 行时出错：{e}（出错前已{action} {e.created} 行）")
+        except OSError as e:
+            raise CommandError(f"无法读取 {path}：{e}")
+        except (ValueError, csv.Error) as e:
+            raise CommandError(str(e))
+
+        errors = stats["errors"]
+        for line_no, field, message in errors[: options["show_errors"]]:
+            self.stderr.write(f"  第 {line_no} 行 {field or '-'}：{message}")
+        if len(errors) > options["show_errors"]:
+            self.stderr.write(f"  …… 共 {len(errors)} 条错误")
+
+        if options["errors"]:
+            with open(options["errors"], "w", newline="", encoding="utf-8-sig") as f:
+                writer = csv.writer(f)
+                writer.writerow(["行号", "字段", "错误"])
+                writer.writerows(errors)
+
+        if stats["ignored_columns"]:
+            self.stdout.write(f"忽略无法识别的列：{', '.join(stats['ignored_columns'])}")
+
+        action = "校验通过" if options["dry_run"] else "导入"
+        self.stdout.write(self.style.SUCCESS(
+            f"完成：共 {stats['rows']} 行，{action} {stats['created']}，失败 {stats['failed']}，"
+            f"用时 {stats['seconds']:.1f}s，{stats['rows_per_second']:.0f} 行/秒"
+        ))
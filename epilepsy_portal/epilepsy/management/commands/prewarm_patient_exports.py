@@ -0,0 +1,63 @@
+# epilepsy/management/commands/prewarm_patient_exports.py
+
+import time
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from epilepsy.models import Patient
+from epilepsy.views_helper import (
+    PATIENT_EXPORT_FORMATS,
+    generate_patient_info_file,
+    get_cached_patient_info_file,
+)
+
+
+class Command(BaseCommand):
+    help = "预生成最近修改过的患者的导出文件（CSV / Word / PDF），建议在闲时通过 cron 运行"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours",
+            type=float,
+            default=24,
+            help="只处理最近 N 小时内修改过的患者（默认 24）；0 表示全部患者",
+        )
+        parser.add_argument(
+            "--format",
+            dest="formats",
+            action="append",
+            choices=sorted(PATIENT_EXPORT_FORMATS),
+            help="只预生成指定格式，可重复；默认全部",
+        )
+        parser.add_argument("--limit", type=int, default=0, help="最多处理多少个患者（0 表示不限）")
+
+    def handle(self, *args, **options):
+        formats = options["formats"] or list(PATIENT_EXPORT_FORMATS)
+
+        patients = Patient.objects.order_by("-updated_at")
+        if options["hours"]:
+            since = timezone.now() - datetime.timedelta(hours=options["hours"])
+            patients = patients.filter(updated_at__gte=since)
+        if options["limit"]:
+            patients = patients[:options["limit"]]
+
+        generated = reused = failed = 0
+        start = time.monotonic()
+        for patient in patients.iterator():
+            for fmt in formats:
+                if get_cached_patient_info_file(patient, fmt):
+                    reused += 1
+                    continue
+                try:
+                    generate_patient_info_file(patient, fmt)
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"患者 #{patient.id} {fmt}: {e}")
+                    continue
+                generated += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"完成：生成 {generated}，已是最新 {reused}，失败 {failed}，用时 {time.monotonic() - start:.1f}s"
+        ))
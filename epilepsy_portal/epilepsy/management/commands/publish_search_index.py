@@ -0,0 +1,51 @@
+# epilepsy/management/commands/publish_search_index.py
+
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from epilepsy.search_publish import SearchPublishError, get_search_auth_header, publish_patients
+
+
+class Command(BaseCommand):
+    help = "把水位线之后变化的患者（去标识化）批量发布到 Globus Search 索引"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--index", default=getattr(settings, "SEARCH_PUBLISH_INDEX", ""), help="Search 索引 UUID")
+        parser.add_argument("--full", action="store_true", help="忽略水位线，全部重新发布")
+        parser.add_argument("--batch-size", type=int, default=None, help="每次 ingest 的记录数")
+        parser.add_argument("--visible-to", action="append", default=None, help="记录的 visible_to（可重复）")
+        parser.add_argument("--token", default="", help="search access token（默认用门户应用的 client credentials）")
+        parser.add_argument("--dry-run", action="store_true", help="只构建记录并打印第一条，不发送")
+
+    def handle(self, *args, **options):
+        if not options["index"]:
+            raise CommandError("请用 --index 或 settings.SEARCH_PUBLISH_INDEX 指定索引")
+        visible_to = options["visible_to"] or getattr(settings, "SEARCH_PUBLISH_VISIBLE_TO", None)
+
+        auth_header = {}
+        if not options["dry_run"]:
+            try:
+                auth_header = get_search_auth_header(options["token"])
+            except Exception as e:
+                raise CommandError(f"无法获取 Globus Search token：{e}")
+
+        try:
+            stats = publish_patients(
+                options["index"],
+                auth_header,
+                visible_to,
+                full=options["full"],
+                batch_size=options["batch_size"],
+                dry_run=options["dry_run"],
+            )
+        except SearchPublishError as e:
+            raise CommandError(str(e))
+
+        if options["dry_run"] and stats["first_document"]:
+            self.stdout.write(json.dumps(stats["first_document"], ensure_ascii=False, indent=2))
+        action = "可发布" if options["dry_run"] else "已发布"
+        self.stdout.write(self.style.SUCCESS(
+            f"{action} {stats['published']} 个患者，{stats['batches']} 批，用时 {stats['seconds']:.1f}s"
+        ))
@@ -0,0 +1,23 @@
+# epilepsy/management/commands/reconcile_file_counters.py
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from epilepsy.file_counters import reconcile_file_counters
+
+
+class Command(BaseCommand):
+    help = "按 MRI / PET / EEG / SEEG 文件表重算患者的文件数和文件大小统计，修正有偏差的患者"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--patient", type=int, action="append", default=[], help="只检查这些患者（可重复）")
+        parser.add_argument("--dry-run", action="store_true", help="只统计有偏差的患者，不写库")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        stats = reconcile_file_counters(patient_ids=options["patient"] or None, dry_run=options["dry_run"])
+        action = "有偏差" if options["dry_run"] else "已修正"
+        self.stdout.write(self.style.SUCCESS(
+            f"检查 {stats['checked']} 个患者，{action} {stats['fixed']} 个，用时 {time.perf_counter() - start:.1f}s"
+        ))
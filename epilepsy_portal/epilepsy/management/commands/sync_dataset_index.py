@@ -0,0 +1,56 @@
+# epilepsy/management/commands/sync_dataset_index.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.template.defaultfilters import filesizeformat
+
+from epilepsy.dataset_index import DatasetIndexError, get_sync_auth_header, sync_dataset_index
+from epilepsy.models import PatientDataset
+
+
+class Command(BaseCommand):
+    help = "递归列出启用中的 PatientDataset 在 Globus 上的文件，增量更新本地文件索引"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dataset", type=int, action="append", default=[], help="只同步这些 dataset（可重复）")
+        parser.add_argument("--patient", type=int, action="append", default=[], help="只同步这些患者的 dataset（可重复）")
+        parser.add_argument("--full", action="store_true", help="忽略目录修改时间，全部重新列出")
+        parser.add_argument("--token", default="", help="transfer access token（默认用门户应用的 client credentials）")
+        parser.add_argument("--workers", type=int, default=None, help="并发 ls 数（默认 GLOBUS_LS_CONCURRENCY）")
+
+    def handle(self, *args, **options):
+        datasets = PatientDataset.objects.filter(is_active=True).order_by("pk")
+        if options["dataset"]:
+            datasets = datasets.filter(pk__in=options["dataset"])
+        if options["patient"]:
+            datasets = datasets.filter(patient_id__in=options["patient"])
+
+        if options["token"]:
+            auth_header = {"Authorization": f"Bearer {options['token']}"}
+        else:
+            try:
+                auth_header = get_sync_auth_header()
+            except Exception as e:
+                raise CommandError(f"无法获取 Globus transfer token：{e}")
+
+        failed = 0
+        for dataset in datasets:
+            start = time.perf_counter()
+            try:
+                stats = sync_dataset_index(
+                    dataset, auth_header, full=options["full"], max_workers=options["workers"]
+                )
+            except DatasetIndexError as e:
+                failed += 1
+                self.stderr.write(f"#{dataset.pk} {dataset} 同步失败：{e}")
+                continue
+            self.stdout.write(
+                f"#{dataset.pk} {dataset}：列出 {stats['dirs_listed']} 个目录，跳过未变化目录 {stats['dirs_skipped']}，"
+                f"新增 {stats['created']} / 更新 {stats['updated']} / 删除 {stats['deleted']}，"
+                f"共 {stats['files']} 个文件 {filesizeformat(stats['bytes'])}，用时 {time.perf_counter() - start:.1f}s"
+            )
+
+        if failed:
+            raise CommandError(f"{failed} 个 dataset 同步失败")
+        self.stdout.write(self.style.SUCCESS("同步完成"))
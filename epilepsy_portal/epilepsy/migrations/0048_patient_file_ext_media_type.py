@@ -0,0 +1,95 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:16
+
+import mimetypes
+import os
+
+from django.db import migrations, models
+
+
+FILE_MODELS = ["MRIFile", "PETFile", "EEGFile", "SEEGFile"]
+INFO_FILE_EXT = {"CSV": ".csv", "WORD": ".docx", "PDF": ".pdf"}
+
+
+def backfill_file_ext_media_type(apps, schema_editor):
+    """按 file_name（导出文件按 format）回填已有记录的 file_ext / media_type。"""
+    for model_name in FILE_MODELS:
+        model = apps.get_model("epilepsy", model_name)
+        batch = []
+        for obj in model.objects.only("id", "file_name").iterator(chunk_size=2000):
+            ext = os.path.splitext(obj.file_name or "")[1].lower()
+            obj.file_ext = ext
+            obj.media_type = mimetypes.guess_type(obj.file_name or "")[0] or ""
+            batch.append(obj)
+            if len(batch) >= 2000:
+                model.objects.bulk_update(batch, ["file_ext", "media_type"])
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, ["file_ext", "media_type"])
+
+    info_model = apps.get_model("epilepsy", "PatientInfoFile")
+    for fmt, ext in INFO_FILE_EXT.items():
+        info_model.objects.filter(format=fmt).update(
+            file_ext=ext,
+            media_type=mimetypes.guess_type(f"x{ext}")[0] or "",
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('epilepsy', '0047_alter_patient_first_stage_lateralization'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eegfile',
+            name='file_ext',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=20, verbose_name='扩展名'),
+        ),
+        migrations.AddField(
+            model_name='eegfile',
+            name='media_type',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='媒体类型'),
+        ),
+        migrations.AddField(
+            model_name='mrifile',
+            name='file_ext',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=20, verbose_name='扩展名'),
+        ),
+        migrations.AddField(
+            model_name='mrifile',
+            name='media_type',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='媒体类型'),
+        ),
+        migrations.AddField(
+            model_name='patientinfofile',
+            name='file_ext',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=20, verbose_name='扩展名'),
+        ),
+        migrations.AddField(
+            model_name='patientinfofile',
+            name='media_type',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='媒体类型'),
+        ),
+        migrations.AddField(
+            model_name='petfile',
+            name='file_ext',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=20, verbose_name='扩展名'),
+        ),
+        migrations.AddField(
+            model_name='petfile',
+            name='media_type',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='媒体类型'),
+        ),
+        migrations.AddField(
+            model_name='seegfile',
+            name='file_ext',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=20, verbose_name='扩展名'),
+        ),
+        migrations.AddField(
+            model_name='seegfile',
+            name='media_type',
+            field=models.CharField(blank=True, editable=False, max_length=100, verbose_name='媒体类型'),
+        ),
+        migrations.RunPython(backfill_file_ext_media_type, migrations.RunPython.noop),
+    ]
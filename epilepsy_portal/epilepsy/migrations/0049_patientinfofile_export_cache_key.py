@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('epilepsy', '0048_patient_file_ext_media_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patientinfofile',
+            name='export_version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='导出版本'),
+        ),
+        migrations.AddField(
+            model_name='patientinfofile',
+            name='patient_updated_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='生成时患者更新时间'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:55
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('epilepsy', '0049_patientinfofile_export_cache_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='patientdataset',
+            name='indexed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='索引同步时间'),
+        ),
+        migrations.AddField(
+            model_name='patientdataset',
+            name='indexed_bytes',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='索引总大小'),
+        ),
+        migrations.AddField(
+            model_name='patientdataset',
+            name='indexed_files',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='索引文件数'),
+        ),
+        migrations.CreateModel(
+            name='PatientDatasetEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('path', models.CharField(max_length=1024, verbose_name='相对路径')),
+                ('name', models.CharField(db_index=True, max_length=255, verbose_name='名称')),
+                ('is_dir', models.BooleanField(default=False, verbose_name='目录')),
+                ('size_bytes', models.BigIntegerField(default=0, verbose_name='大小')),
+                ('modified_at', models.DateTimeField(blank=True, null=True, verbose_name='修改时间')),
+                ('checksum', models.CharField(blank=True, max_length=128, verbose_name='校验码')),
+                ('dataset', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='epilepsy.patientdataset', verbose_name='患者数据')),
+            ],
+            options={
+                'verbose_name': '数据文件索引',
+                'verbose_name_plural': '数据文件索引',
+                'constraints': [models.UniqueConstraint(fields=('dataset', 'path'), name='uniq_dataset_entry_path')],
+            },
+        ),
+    ]
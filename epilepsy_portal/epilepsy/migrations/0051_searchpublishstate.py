@@ -0,0 +1,29 @@
+# Generated by Django 5.2.8 on 2026-10-19 01:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('epilepsy', '0050_patientdataset_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchPublishState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index_id', models.CharField(max_length=64, unique=True, verbose_name='Search 索引')),
+                ('watermark_at', models.DateTimeField(blank=True, null=True, verbose_name='水位线（updated_at）')),
+                ('watermark_id', models.BigIntegerField(default=0, verbose_name='水位线（id）')),
+                ('published_total', models.PositiveIntegerField(default=0, verbose_name='累计发布')),
+                ('last_task_id', models.CharField(blank=True, max_length=64, verbose_name='最近一次 ingest 任务')),
+                ('last_run_at', models.DateTimeField(blank=True, null=True, verbose_name='最近运行时间')),
+            ],
+            options={
+                'verbose_name': '检索索引发布状态',
+                'verbose_name_plural': '检索索引发布状态',
+            },
+        ),
+    ]
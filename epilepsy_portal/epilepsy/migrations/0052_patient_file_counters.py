@@ -0,0 +1,107 @@
+# Generated by Django 5.2.8 on 2026-10-19 02:03
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+FILE_MODELS = {"mri": "MRIFile", "pet": "PETFile", "eeg": "EEGFile", "seeg": "SEEGFile"}
+
+
+def init_file_counts(apps, schema_editor):
+    """按已有文件行初始化患者的文件数（大小未知，为 0，回填后用 reconcile_file_counters 重算）。"""
+    Patient = apps.get_model("epilepsy", "Patient")
+    totals = {}
+    for file_type, model_name in FILE_MODELS.items():
+        model = apps.get_model("epilepsy", model_name)
+        for row in model.objects.values("patient_id").annotate(n=Count("id")).order_by():
+            values = totals.setdefault(row["patient_id"], {"file_count": 0})
+            values[f"{file_type}_file_count"] = row["n"]
+            values["file_count"] += row["n"]
+    for patient_id, values in totals.items():
+        Patient.objects.filter(pk=patient_id).update(**values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('epilepsy', '0051_searchpublishstate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eegfile',
+            name='size_bytes',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='文件大小（字节）'),
+        ),
+        migrations.AddField(
+            model_name='mrifile',
+            name='size_bytes',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='文件大小（字节）'),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='eeg_file_bytes',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='EEG 文件大小（字节）'),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='eeg_file_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='EEG 文件数'),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='file_bytes',
+            field=models.BigIntegerField(db_index=True, default=0, editable=False, verbose_name='文件总大小（字节）'),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='file_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='文件总数'),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='mri_file_bytes',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='MRI 文件大小（字节）'),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='mri_file_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='MRI 文件数'),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='pet_file_bytes',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='PET 文件大小（字节）'),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='pet_file_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='PET 文件数'),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='seeg_file_bytes',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='SEEG 文件大小（字节）'),
+        ),
+        migrations.AddField(
+            model_name='patient',
+            name='seeg_file_count',
+            field=models.IntegerField(default=0, editable=False, verbose_name='SEEG 文件数'),
+        ),
+        migrations.AddField(
+            model_name='patientinfofile',
+            name='size_bytes',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='文件大小（字节）'),
+        ),
+        migrations.AddField(
+            model_name='petfile',
+            name='size_bytes',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='文件大小（字节）'),
+        ),
+        migrations.AddField(
+            model_name='seegfile',
+            name='size_bytes',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='文件大小（字节）'),
+        ),
+        migrations.RunPython(init_file_counts, migrations.RunPython.noop),
+    ]
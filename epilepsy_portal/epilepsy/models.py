@@ -1,6 +1,7 @@
 from django.conf import settings
 from django.db import models
 from django.utils.translation import gettext_lazy as _
+import mimetypes
 import os
 
 class UserRole(models.TextChoices):
@@ -36,6 +37,17 @@ class UserProfile(models.Model):
     def is_guest(self):
         return self.role == UserRole.GUEST
 
+
+# Patient 上由 epilepsy/file_counters.py 维护的文件统计字段
+FILE_COUNTER_FIELDS = (
+    "mri_file_count", "mri_file_bytes",
+    "pet_file_count", "pet_file_bytes",
+    "eeg_file_count", "eeg_file_bytes",
+    "seeg_file_count", "seeg_file_bytes",
+    "file_count", "file_bytes",
+)
+
+
 class Patient(models.Model):
     GENDER_CHOICES = [("M", "男"), ("F", "女"), ("O", "其他"),]
     HAND_CHOICES = [("L", "左利手"), ("R", "右利手"), ("A", "双手"),]
@@ -389,6 +401,19 @@ class Patient(models.Model):
         "评估日期", blank=True, null=True
     )
 
+    # 文件统计：MRI / PET / EEG / SEEG 文件增删时用 F() 原子加减（见 epilepsy/file_counters.py），
+    # 列表直接显示 / 排序，不再 join 文件表；有偏差时 manage.py reconcile_file_counters 按文件表重算
+    mri_file_count = models.IntegerField("MRI 文件数", default=0, editable=False)
+    mri_file_bytes = models.BigIntegerField("MRI 文件大小（字节）", default=0, editable=False)
+    pet_file_count = models.IntegerField("PET 文件数", default=0, editable=False)
+    pet_file_bytes = models.BigIntegerField("PET 文件大小（字节）", default=0, editable=False)
+    eeg_file_count = models.IntegerField("EEG 文件数", default=0, editable=False)
+    eeg_file_bytes = models.BigIntegerField("EEG 文件大小（字节）", default=0, editable=False)
+    seeg_file_count = models.IntegerField("SEEG 文件数", default=0, editable=False)
+    seeg_file_bytes = models.BigIntegerField("SEEG 文件大小（字节）", default=0, editable=False)
+    file_count = models.IntegerField("文件总数", default=0, editable=False)
+    file_bytes = models.BigIntegerField("文件总大小（字节）", default=0, editable=False, db_index=True)
+
     # 系统字段
     created_at = models.DateTimeField("创建时间", auto_now_add=True)
     updated_at = models.DateTimeField("更新时间", auto_now=True)
@@ -400,6 +425,16 @@ class Patient(models.Model):
     def __str__(self):
         return f"{self.name} ({self.bed_number})"
 
+    def save(self, *args, **kwargs):
+        # 文件统计只由 file_counters 用 F() 更新：整行保存（编辑表单等）时不写这些列，
+        # 否则会把读出来时的旧值写回去，覆盖同时进行的上传 / 删除
+        if not self._state.adding and kwargs.get("update_fields") is None and not kwargs.get("force_insert"):
+            kwargs["update_fields"] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in FILE_COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
 
 class PatientDataset(models.Model):
     patient = models.ForeignKey(
@@ -434,6 +469,11 @@ class PatientDataset(models.Model):
 
     created_at = models.DateTimeField("创建时间", auto_now_add=True)
 
+    # 本地文件索引（manage.py sync_dataset_index 维护）的汇总
+    indexed_at = models.DateTimeField("索引同步时间", null=True, blank=True, editable=False)
+    indexed_files = models.PositiveIntegerField("索引文件数", default=0, editable=False)
+    indexed_bytes = models.BigIntegerField("索引总大小", default=0, editable=False)
+
     class Meta:
         verbose_name = "患者数据"
         verbose_name_plural = "患者数据"
@@ -441,6 +481,37 @@ class PatientDataset(models.Model):
     def __str__(self):
         return f"{self.patient.name} - {self.name}"
 
+
+class PatientDatasetEntry(models.Model):
+    """
+    PatientDataset 在 Globus 上的文件索引（本地镜像，只读）：
+    - path: 相对 dataset.globus_path 的路径，目录不带结尾 /
+    - modified_at: Endpoint 返回的 last_modified；目录的修改时间用于增量同步
+    - checksum: Endpoint 提供时才有
+    """
+    dataset = models.ForeignKey(
+        PatientDataset,
+        on_delete=models.CASCADE,
+        related_name="entries",
+        verbose_name="患者数据"
+    )
+    path = models.CharField("相对路径", max_length=1024)
+    name = models.CharField("名称", max_length=255, db_index=True)
+    is_dir = models.BooleanField("目录", default=False)
+    size_bytes = models.BigIntegerField("大小", default=0)
+    modified_at = models.DateTimeField("修改时间", null=True, blank=True)
+    checksum = models.CharField("校验码", max_length=128, blank=True)
+
+    class Meta:
+        verbose_name = "数据文件索引"
+        verbose_name_plural = "数据文件索引"
+        constraints = [
+            models.UniqueConstraint(fields=["dataset", "path"], name="uniq_dataset_entry_path"),
+        ]
+
+    def __str__(self):
+        return f"{self.dataset_id}:{self.path}"
+
 class BasePatientFile(models.Model):
     """
     患者相关文件的抽象基类：
@@ -449,12 +520,17 @@ class BasePatientFile(models.Model):
     - hash_code: 自定义哈希（例如 MD5 或你自己的规则）
     - sha256_code: 文件内容的 SHA256 校验码
     - save_name: 实际保存的文件名 = hash_code + 原文件扩展名
+    - file_ext / media_type: 由 file_name 推导，便于在数据库侧按类型过滤（例如只取图片）
+    - size_bytes: 文件大小，入库时写入，用于患者的文件统计
     """
     parent_path = models.CharField("父路径", max_length=1024, blank=True)
     file_name = models.CharField("原始文件名", max_length=255)
     hash_code = models.CharField("哈希码", max_length=64)
     sha256_code = models.CharField("SHA256 校验码", max_length=64)
     save_name = models.CharField("保存文件名", max_length=300, editable=False)
+    file_ext = models.CharField("扩展名", max_length=20, blank=True, db_index=True, editable=False)
+    media_type = models.CharField("媒体类型", max_length=100, blank=True, editable=False)
+    size_bytes = models.BigIntegerField("文件大小（字节）", default=0, editable=False)
     created_at = models.DateTimeField("创建时间", auto_now_add=True)
 
     class Meta:
@@ -462,10 +538,13 @@ class BasePatientFile(models.Model):
 
     def save(self, *args, **kwargs):
         # 自动根据 file_name 的扩展名生成 save_name = hash_code + ext
-        if self.file_name and self.hash_code:
+        if self.file_name:
             _, ext = os.path.splitext(self.file_name)
             ext = ext.lower()
-            self.save_name = f"{self.hash_code}{ext}"
+            self.file_ext = ext
+            self.media_type = mimetypes.guess_type(self.file_name)[0] or ""
+            if self.hash_code:
+                self.save_name = f"{self.hash_code}{ext}"
         super().save(*args, **kwargs)
 
 class MRIFile(BasePatientFile):
@@ -537,6 +616,7 @@ class PatientInfoFile(BasePatientFile):
     - file_name：显示名，如 “张三_123456”
     - save_name：hashcode + .csv/.docx/.pdf
     - format：导出格式
+    - patient_updated_at / export_version：用于判断已有导出是否仍然有效
     """
     class Format(models.TextChoices):
         CSV = "CSV", "CSV"
@@ -554,6 +634,9 @@ class PatientInfoFile(BasePatientFile):
         max_length=10,
         choices=Format.choices,
     )
+    # 复用判断：生成时患者的 updated_at 与导出代码版本都没变，就直接返回已有文件
+    patient_updated_at = models.DateTimeField("生成时患者更新时间", null=True, blank=True, editable=False)
+    export_version = models.PositiveIntegerField("导出版本", default=0, editable=False)
 
     class Meta:
         verbose_name = "患者信息导出文件"
@@ -569,8 +652,30 @@ class PatientInfoFile(BasePatientFile):
             self.Format.WORD: ".docx",
             self.Format.PDF: ".pdf",
         }
+        ext = ext_map.get(self.format, "")
+        self.file_ext = ext
+        self.media_type = mimetypes.guess_type(f"x{ext}")[0] or ""
         if self.hash_code:
-            ext = ext_map.get(self.format, "")
             self.save_name = f"{self.hash_code}{ext}"
         # 跳过 BasePatientFile.save 的扩展名逻辑，直接走 Model.save
         super(BasePatientFile, self).save(*args, **kwargs)
+
+
+class SearchPublishState(models.Model):
+    """
+    患者元数据发布到 Globus Search 的进度（manage.py publish_search_index 维护）：
+    水位线是已成功发布的最后一个 (updated_at, id)，下次只发布在它之后变化的患者。
+    """
+    index_id = models.CharField("Search 索引", max_length=64, unique=True)
+    watermark_at = models.DateTimeField("水位线（updated_at）", null=True, blank=True)
+    watermark_id = models.BigIntegerField("水位线（id）", default=0)
+    published_total = models.PositiveIntegerField("累计发布", default=0)
+    last_task_id = models.CharField("最近一次 ingest 任务", max_length=64, blank=True)
+    last_run_at = models.DateTimeField("最近运行时间", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "检索索引发布状态"
+        verbose_name_plural = "检索索引发布状态"
+
+    def __str__(self):
+        return f"{self.index_id} @ {self.watermark_at}"
@@ -0,0 +1,220 @@
+# epilepsy/search_publish.py
+
+"""
+把患者元数据（去标识化）批量、增量发布到 Globus Search 索引。
+
+- 每个患者一条记录，subject = SEARCH_PUBLISH_SUBJECT_PREFIX + 患者 id；
+  发布后把该患者 search_subject 为空的 PatientDataset 填上这个 subject
+- 只发布编码字段（单选 / 多选，翻译成中文标签，便于做 facet）、数值评分、入院年龄 / 年份、数据集数量；
+  姓名、生日、病历号、床号、日期以及所有自由文本字段一律不发布
+- 按 (updated_at, id) 水位线增量：只发布上次之后变化过的患者，每批成功后推进水位线，
+  中途失败下次从失败的批次继续；--full 从头重发
+- updated_at 在保存时取值、提交有先后，每次运行从水位线往前回退 SEARCH_PUBLISH_WATERMARK_OVERLAP 秒再开始，
+  晚提交的修改不会被跳过（重复 ingest 同一 subject 是幂等的）
+- PatientDataset 增删 / 启停会刷新所属患者的 updated_at（见 signals），dataset_count 随增量发布更新
+- 每批一次 ingest（GMetaList），429 / 5xx / 网络错误按指数退避重试
+- 删除的患者不会从索引中删除，需要时用 --full 重建索引
+
+相关设置（都可选）：
+    SEARCH_PUBLISH_INDEX          默认发布到的索引 UUID
+    SEARCH_PUBLISH_VISIBLE_TO     记录的 visible_to（如 ["urn:globus:groups:id:..."]），必须显式配置
+    SEARCH_PUBLISH_SUBJECT_PREFIX 默认 "epilepsy-portal:patient:"
+    SEARCH_PUBLISH_BATCH_SIZE     每次 ingest 的记录数，默认 100
+    SEARCH_PUBLISH_RETRIES        默认 3
+    SEARCH_PUBLISH_WATERMARK_OVERLAP  每次运行从水位线往前回退的秒数，默认 120
+    SEARCH_API_BASE_URL           默认 https://search.api.globus.org（测试时指向本地替身）
+    SEARCH_PUBLISH_TOKEN          不配置时用门户应用的 client credentials 取 search token
+"""
+
+import datetime
+import time
+
+from django.conf import settings
+from django.db import models
+from django.db.models import CharField, Count, Q, Value
+from django.db.models.functions import Cast, Concat
+from django.utils import timezone
+
+import requests
+
+from api.globus import get_session
+
+from .labels import MULTI_CHOICE_MAP, get_label_translator
+from .models import Patient, PatientDataset, SearchPublishState
+
+SEARCH_SCOPE = "urn:globus:auth:scope:search.api.globus.org:all"
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# 编码字段里也不发布的（可用于识别个人）
+PUBLISH_EXCLUDED_FIELDS = {"name", "department", "bed_number", "medical_record_number", "imaging_number"}
+
+
+class SearchPublishError(Exception):
+    pass
+
+
+def get_publish_fields():
+    """(编码字段, 数值字段)：只有这两类会进入检索记录。"""
+    coded, numeric = [], []
+    for field in Patient._meta.concrete_fields:
+        # 不可编辑的是系统维护的统计字段（文件数等），变化时不改 updated_at，增量发布跟不上
+        if field.name in PUBLISH_EXCLUDED_FIELDS or not field.editable:
+            continue
+        if field.choices or field.name in MULTI_CHOICE_MAP:
+            coded.append(field.name)
+        elif isinstance(field, (models.DecimalField, models.IntegerField, models.FloatField)) and not field.primary_key:
+            numeric.append(field.name)
+    return coded, numeric
+
+
+def get_subject(patient_id):
+    prefix = getattr(settings, "SEARCH_PUBLISH_SUBJECT_PREFIX", "epilepsy-portal:patient:")
+    return f"{prefix}{patient_id}"
+
+
+def _age_at(birthday, day):
+    if not birthday or not day:
+        return None
+    return day.year - birthday.year - ((day.month, day.day) < (birthday.month, birthday.day))
+
+
+def build_patient_document(patient, coded_fields, numeric_fields, translator=None):
+    """单个患者的去标识化检索内容。patient 需带 dataset_count 注解。"""
+    translator = translator or get_label_translator()
+    content = {}
+    for name in coded_fields:
+        labels = translator.labels(name, getattr(patient, name))
+        if labels:
+            content[name] = labels
+    for name in numeric_fields:
+        value = getattr(patient, name)
+        if value is not None:
+            content[name] = float(value)
+
+    age = _age_at(patient.birthday, patient.admission_date)
+    if age is not None:
+        content["age_at_admission"] = age
+    if patient.admission_date:
+        content["admission_year"] = patient.admission_date.year
+    content["dataset_count"] = patient.dataset_count
+    return {"patient": content}
+
+
+def get_search_auth_header(token=""):
+    token = token or getattr(settings, "SEARCH_PUBLISH_TOKEN", "")
+    if not token:
+        import globus_sdk
+
+        client = globus_sdk.ConfidentialAppAuthClient(
+            settings.SOCIAL_AUTH_GLOBUS_KEY, settings.SOCIAL_AUTH_GLOBUS_SECRET
+        )
+        tokens = client.oauth2_client_credentials_tokens(requested_scopes=SEARCH_SCOPE)
+        token = tokens.by_resource_server["search.api.globus.org"]["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def ingest(index_id, gmeta, auth_header, retries=None):
+    """一次 GMetaList ingest，失败按指数退避重试；返回 Search 的响应 dict。"""
+    retries = getattr(settings, "SEARCH_PUBLISH_RETRIES", 3) if retries is None else retries
+    base_url = getattr(settings, "SEARCH_API_BASE_URL", "https://search.api.globus.org").rstrip("/")
+    body = {"ingest_type": "GMetaList", "ingest_data": {"gmeta": gmeta}}
+
+    for attempt in range(retries + 1):
+        delay = 0.5 * 2 ** attempt
+        try:
+            response = get_session().post(
+                f"{base_url}/v1/index/{index_id}/ingest", json=body, headers=auth_header, timeout=(3.05, 60)
+            )
+        except requests.RequestException as e:
+            error = f"网络错误：{e}"
+        else:
+            if response.ok:
+                return response.json()
+            error = f"HTTP {response.status_code} {response.text[:200]}"
+            if response.status_code not in RETRY_STATUS_CODES:
+                break
+            retry_after = response.headers.get("Retry-After", "")
+            if retry_after.isdigit():
+                delay = int(retry_after)
+        if attempt < retries:
+            time.sleep(delay)
+    raise SearchPublishError(f"ingest 失败：{error}")
+
+
+def iter_changed_patients(state, batch_size, overlap=None):
+    """按 (updated_at, id) 升序，分批返回水位线（往前回退 overlap 秒）之后变化的患者。"""
+    coded, numeric = get_publish_fields()
+    fields = ["id", "updated_at", "birthday", "admission_date", *coded, *numeric]
+    overlap = getattr(settings, "SEARCH_PUBLISH_WATERMARK_OVERLAP", 120) if overlap is None else overlap
+    after_at, after_id = state.watermark_at, state.watermark_id
+    if after_at is not None and overlap:
+        after_at, after_id = after_at - datetime.timedelta(seconds=overlap), 0
+    while True:
+        qs = Patient.objects.only(*fields).annotate(
+            dataset_count=Count("datasets", filter=Q(datasets__is_active=True))
+        )
+        if after_at is not None:
+            qs = qs.filter(Q(updated_at__gt=after_at) | Q(updated_at=after_at, id__gt=after_id))
+        batch = list(qs.order_by("updated_at", "id")[:batch_size])
+        if not batch:
+            return
+        yield batch
+        after_at, after_id = batch[-1].updated_at, batch[-1].pk
+
+
+def publish_patients(index_id, auth_header, visible_to, full=False, batch_size=None, dry_run=False):
+    """
+    增量发布；返回统计 published / batches / seconds。
+    dry_run 时只构建记录不发送、不推进水位线（first_document 给出第一条记录便于检查）。
+    """
+    if not visible_to:
+        raise SearchPublishError("必须配置 SEARCH_PUBLISH_VISIBLE_TO（或 --visible-to）")
+    batch_size = batch_size or getattr(settings, "SEARCH_PUBLISH_BATCH_SIZE", 100)
+
+    state = SearchPublishState.objects.filter(index_id=index_id).first() or SearchPublishState(index_id=index_id)
+    if full:
+        state.watermark_at, state.watermark_id = None, 0
+
+    coded, numeric = get_publish_fields()
+    translator = get_label_translator()
+    stats = {"published": 0, "batches": 0, "first_document": None}
+    start = time.perf_counter()
+
+    for batch in iter_changed_patients(state, batch_size):
+        gmeta = [
+            {
+                "subject": get_subject(patient.pk),
+                "visible_to": list(visible_to),
+                "content": build_patient_document(patient, coded, numeric, translator),
+            }
+            for patient in batch
+        ]
+        if stats["first_document"] is None:
+            stats["first_document"] = gmeta[0]
+        if dry_run:
+            stats["published"] += len(gmeta)
+            stats["batches"] += 1
+            continue
+
+        result = ingest(index_id, gmeta, auth_header)
+
+        PatientDataset.objects.filter(patient_id__in=[p.pk for p in batch], search_subject="").update(
+            search_subject=Concat(Value(get_subject("")), Cast("patient_id", CharField()))
+        )
+        # 回退重发的批次不把水位线往回拉
+        last = (batch[-1].updated_at, batch[-1].pk)
+        if state.watermark_at is None or last > (state.watermark_at, state.watermark_id):
+            state.watermark_at, state.watermark_id = last
+        state.published_total += len(gmeta)
+        state.last_task_id = result.get("task_id", "") or ""
+        state.last_run_at = timezone.now()
+        state.save()
+        stats["published"] += len(gmeta)
+        stats["batches"] += 1
+
+    if not dry_run:
+        state.last_run_at = timezone.now()
+        # 新索引第一次运行且没有可发布的患者时，状态行还没建
+        state.save(update_fields=None if state.pk is None else ["last_run_at"])
+    stats["seconds"] = time.perf_counter() - start
+    return stats
@@ -0,0 +1,48 @@
+# epilepsy/signals.py
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .file_counters import FILE_MODEL_TYPES, adjust_file_counters
+from .models import Patient, PatientDataset, MRIFile, PETFile, EEGFile, SEEGFile
+from .views_helper import invalidate_patient_object_cache
+
+
+@receiver(post_save, sender=Patient)
+@receiver(post_delete, sender=Patient)
+def drop_cached_patient(sender, instance, **kwargs):
+    # 患者对象缓存（get_patient_or_404）
+    invalidate_patient_object_cache(instance.pk)
+
+
+@receiver(post_save, sender=MRIFile)
+@receiver(post_save, sender=PETFile)
+@receiver(post_save, sender=EEGFile)
+@receiver(post_save, sender=SEEGFile)
+def count_created_file(sender, instance, created, **kwargs):
+    # 患者文件统计（file_counters）
+    if created:
+        adjust_file_counters(FILE_MODEL_TYPES[sender], instance.patient_id, 1, instance.size_bytes)
+
+
+@receiver(post_delete, sender=MRIFile)
+@receiver(post_delete, sender=PETFile)
+@receiver(post_delete, sender=EEGFile)
+@receiver(post_delete, sender=SEEGFile)
+def count_deleted_file(sender, instance, **kwargs):
+    adjust_file_counters(FILE_MODEL_TYPES[sender], instance.patient_id, -1, -instance.size_bytes)
+
+
+# 只改索引统计（sync_dataset_index）等不影响患者数据集数量的保存不刷新患者
+DATASET_COUNT_FIELDS = {"patient", "is_active"}
+
+
+@receiver(post_save, sender=PatientDataset)
+@receiver(post_delete, sender=PatientDataset)
+def touch_dataset_patient(sender, instance, update_fields=None, **kwargs):
+    # 刷新患者的 updated_at：检索发布的 dataset_count 走增量，列表行片段也随之失效
+    if update_fields is not None and not DATASET_COUNT_FIELDS & set(update_fields):
+        return
+    Patient.objects.filter(pk=instance.patient_id).update(updated_at=timezone.now())
+    invalidate_patient_object_cache(instance.patient_id)
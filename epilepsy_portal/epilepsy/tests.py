@@ -1,3 +1,1196 @@
-from django.test import TestCase
+import csv
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import zipfile
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.http import Http404
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+try:
+    import pyarrow.parquet as pq
+    import pyarrow.types as pa_types
+except ImportError:
+    pq = pa_types = None
+
+from api.transfer_stub import TransferStubServer
+
+from . import dataset_index, file_counters, search_publish, views, views_helper
+from .forms import PatientForm
+from .labels import get_label_translator, split_codes
+from .models import (
+    EEGFile,
+    MRIFile,
+    Patient,
+    PatientDataset,
+    PatientDatasetEntry,
+    PatientInfoFile,
+    SearchPublishState,
+    UserProfile,
+    UserRole,
+)
+from .views_helper import (
+    THUMBNAIL_DIR_NAME,
+    PatientImportInterrupted,
+    build_patient_detail,
+    build_patient_gallery,
+    export_patient_cohort,
+    export_patient_reports,
+    generate_patient_info_file,
+    get_patient_section_form_class,
+    import_patients,
+    iter_patient_export_csv,
+    iter_patient_import_rows,
+    render_patient_detail_section,
+)
+
+
+def create_user(role, username=None):
+    user = get_user_model().objects.create(username=username or role.lower())
+    UserProfile.objects.create(user=user, role=role)
+    return user
+
+
+def create_patient(**fields):
+    values = {
+        "name": "张三",
+        "gender": "M",
+        "birthday": datetime.date(1990, 1, 1),
+        "handedness": "R",
+        "admission_date": datetime.date(2024, 1, 1),
+    }
+    values.update(fields)
+    return Patient.objects.create(**values)
+
+
+def image_bytes(size=(800, 600), fmt="PNG"):
+    buf = io.BytesIO()
+    Image.new("RGB", size, (200, 30, 30)).save(buf, fmt)
+    return buf.getvalue()
+
+
+class PatientFileTestCase(TestCase):
+    """LARGE_FILE_BASE_DIR 指向临时目录，add_file 按上传时的布局写入物理文件并建记录。"""
+
+    def setUp(self):
+        super().setUp()
+        self.base_dir = tempfile.mkdtemp(prefix="epilepsy_files_")
+        self.addCleanup(shutil.rmtree, self.base_dir, ignore_errors=True)
+        settings_override = override_settings(LARGE_FILE_BASE_DIR=self.base_dir)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def add_file(self, patient, file_name, content, model_cls=MRIFile, file_type="mri"):
+        hash_code = hashlib.md5(content).hexdigest()
+        parent_path = f"{file_type}/{patient.pk}"
+        abs_dir = os.path.join(self.base_dir, parent_path)
+        os.makedirs(abs_dir, exist_ok=True)
+        with open(os.path.join(abs_dir, hash_code + os.path.splitext(file_name)[1].lower()), "wb") as f:
+            f.write(content)
+        return model_cls.objects.create(
+            patient=patient,
+            parent_path=parent_path,
+            file_name=file_name,
+            hash_code=hash_code,
+            sha256_code=hashlib.sha256(content).hexdigest(),
+            size_bytes=len(content),
+        )
+
+
+class PatientSectionUpdateTests(TestCase):
+    """分区保存是部分更新：只校验、只写入请求里提交了的字段。"""
+
+    def setUp(self):
+        user = get_user_model().objects.create(username="staff")
+        UserProfile.objects.create(user=user, role=UserRole.STAFF)
+        self.client.force_login(user)
+
+        history_form = get_patient_section_form_class("history")
+        self.history_code = history_form.base_fields["past_medical_history"].choices[0][0]
+        self.patient = Patient.objects.create(
+            name="张三",
+            gender="M",
+            birthday=datetime.date(1990, 1, 1),
+            handedness="R",
+            admission_date=datetime.date(2024, 1, 1),
+            family_history="无",
+            medication_history="丙戊酸钠",
+            past_medical_history=self.history_code,
+        )
+
+    def url(self, section):
+        return reverse("epilepsy:patient_section_update", args=[self.patient.pk, section])
+
+    def test_patch_one_field_keeps_rest_of_section(self):
+        response = self.client.generic(
+            "PATCH", self.url("history"), "first_seizure_age=5",
+            content_type="application/x-www-form-urlencoded",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["updated_fields"], ["first_seizure_age"])
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.first_seizure_age, 5)
+        self.assertEqual(self.patient.family_history, "无")
+        self.assertEqual(self.patient.medication_history, "丙戊酸钠")
+        self.assertEqual(self.patient.past_medical_history, self.history_code)
+
+    def test_post_one_field_skips_required_fields_not_submitted(self):
+        response = self.client.post(self.url("basic"), {"name": "李四"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["updated_fields"], ["name"])
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.name, "李四")
+        self.assertEqual(self.patient.admission_date, datetime.date(2024, 1, 1))
+
+    def test_empty_multi_choice_clears_it(self):
+        response = self.client.post(self.url("history"), {"past_medical_history": ""})
+
+        self.assertEqual(response.status_code, 200)
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.past_medical_history, "")
+        self.assertEqual(self.patient.family_history, "无")
+
+    def test_invalid_submitted_field_is_rejected(self):
+        response = self.client.post(self.url("basic"), {"name": "李四", "birthday": "not-a-date"})
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("birthday", response.json()["errors"])
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.name, "张三")
+
+
+class PatientFilePreviewTests(PatientFileTestCase):
+    """?size= 返回磁盘缓存的缩略图，不带 size 返回原图。"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(create_user(UserRole.GUEST))
+        self.patient = create_patient()
+        self.image = self.add_file(self.patient, "scan.png", image_bytes())
+
+    def url(self, file_obj, file_type="mri"):
+        return reverse("epilepsy:patient_file_preview", args=[file_type, file_obj.pk])
+
+    def test_thumbnail_is_resized_and_cached_on_disk(self):
+        response = self.client.get(self.url(self.image), {"size": 256})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(response["Content-Type"], ("image/webp", "image/jpeg"))
+        self.assertIn("max-age", response["Cache-Control"])
+        with Image.open(io.BytesIO(b"".join(response.streaming_content))) as thumb:
+            self.assertEqual(max(thumb.size), 256)
+
+        thumb_dir = os.path.join(self.base_dir, self.image.parent_path, THUMBNAIL_DIR_NAME)
+        cached = os.listdir(thumb_dir)
+        self.assertEqual(len(cached), 1)
+        self.assertTrue(cached[0].startswith(f"{self.image.hash_code}_256"))
+
+    def test_cached_thumbnail_is_served_without_decoding(self):
+        self.client.get(self.url(self.image), {"size": 256}).close()
+
+        with mock.patch("PIL.Image.open", side_effect=AssertionError("decoded again")):
+            response = self.client.get(self.url(self.image), {"size": 256})
+        self.assertEqual(response.status_code, 200)
+        response.close()
+
+    def test_original_without_size(self):
+        response = self.client.get(self.url(self.image))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "image/png")
+        self.assertEqual(b"".join(response.streaming_content), image_bytes())
+
+    def test_unsupported_size_is_404(self):
+        response = self.client.get(self.url(self.image), {"size": 300})
+        self.assertEqual(response.status_code, 404)
+
+    def test_non_image_file_is_404(self):
+        edf = self.add_file(self.patient, "record.edf", b"0       EDF")
+        response = self.client.get(self.url(edf), {"size": 256})
+        self.assertEqual(response.status_code, 404)
+
+
+class PatientGalleryTests(TestCase):
+    """画廊只取图片文件，按扩展名过滤和分页都在一条 SQL 里完成。"""
+
+    def setUp(self):
+        self.client.force_login(create_user(UserRole.GUEST))
+        self.patient = create_patient()
+        for i in range(5):
+            MRIFile.objects.create(patient=self.patient, file_name=f"slice{i}.JPG", hash_code=f"img{i}")
+        MRIFile.objects.create(patient=self.patient, file_name="brain.nii.gz", hash_code="nii")
+        MRIFile.objects.create(patient=self.patient, file_name="report.pdf", hash_code="pdf")
+
+    def test_filters_images_and_paginates_in_one_query(self):
+        with self.assertNumQueries(1):
+            first = build_patient_gallery(self.patient, "mri", page=1, page_size=2)
+        self.assertEqual([f.file_name for f in first["items"]], ["slice4.JPG", "slice3.JPG"])
+        self.assertTrue(first["has_more"])
+        self.assertEqual(first["next_page"], 2)
+
+        last = build_patient_gallery(self.patient, "mri", page=3, page_size=2)
+        self.assertEqual([f.file_name for f in last["items"]], ["slice0.JPG"])
+        self.assertFalse(last["has_more"])
+
+    def test_gallery_view_renders_one_page(self):
+        url = reverse("epilepsy:patient_gallery", args=[self.patient.pk, "mri"])
+        response = self.client.get(url, {"page": 1})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "slice4.JPG")
+        self.assertNotContains(response, "brain.nii.gz")
+        self.assertNotContains(response, "js-gallery-more")
+
+    def test_unknown_file_type_is_404(self):
+        response = self.client.get(reverse("epilepsy:patient_gallery", args=[self.patient.pk, "ct"]))
+        self.assertEqual(response.status_code, 404)
+
+
+class PatientInfoExportCacheTests(PatientFileTestCase):
+    """患者没改过、导出版本没变时复用上次生成的文件。"""
+
+    def setUp(self):
+        super().setUp()
+        self.patient = create_patient(medical_record_number="MR001")
+
+    def generate(self, fmt="csv"):
+        return generate_patient_info_file(Patient.objects.get(pk=self.patient.pk), fmt)
+
+    def test_unchanged_patient_reuses_file(self):
+        first_path, filename, _ = self.generate()
+        self.assertEqual(filename, "张三_MR001.csv")
+
+        with mock.patch.object(views_helper, "render_patient_report") as render:
+            second_path, _, _ = self.generate()
+        render.assert_not_called()
+        self.assertEqual(second_path, first_path)
+        self.assertEqual(PatientInfoFile.objects.filter(patient=self.patient).count(), 1)
+
+    def test_saving_patient_regenerates(self):
+        first_path, _, _ = self.generate()
+
+        self.patient.family_history = "母亲有癫痫史"
+        self.patient.save()
+        second_path, _, _ = self.generate()
+
+        self.assertNotEqual(second_path, first_path)
+        self.assertFalse(os.path.exists(first_path))
+        with open(second_path, encoding="utf-8-sig") as f:
+            self.assertIn("母亲有癫痫史", f.read())
+        self.assertEqual(PatientInfoFile.objects.filter(patient=self.patient).count(), 1)
+
+    def test_export_version_bump_regenerates(self):
+        self.generate()
+
+        with mock.patch.object(views_helper, "PATIENT_EXPORT_VERSION", views_helper.PATIENT_EXPORT_VERSION + 1), \
+                mock.patch.object(views_helper, "render_patient_report", wraps=views_helper.render_patient_report) as render:
+            self.generate()
+        render.assert_called_once()
+
+    def test_missing_file_regenerates(self):
+        first_path, _, _ = self.generate()
+        os.remove(first_path)
+
+        second_path, _, _ = self.generate()
+        self.assertTrue(os.path.exists(second_path))
+
+    def test_export_view_downloads_cached_file(self):
+        self.client.force_login(create_user(UserRole.STAFF))
+        path, _, _ = self.generate("word")
+
+        response = self.client.get(reverse("epilepsy:patient_export", args=[self.patient.pk, "word"]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("attachment", response["Content-Disposition"])
+        with open(path, "rb") as f:
+            self.assertEqual(b"".join(response.streaming_content), f.read())
+
+
+class PatientReportBatchExportTests(PatientFileTestCase):
+    """多个患者的报告打成一个 zip：有效的导出文件直接复用，其余的渲染（可在进程池里）。"""
+
+    def setUp(self):
+        super().setUp()
+        self.patients = [
+            create_patient(name="张三", medical_record_number="MR001"),
+            create_patient(name="李四", bed_number="B12"),
+            create_patient(name="李四", bed_number="B12"),
+        ]
+
+    def export(self, max_workers):
+        buf = io.BytesIO()
+        stats = export_patient_reports(Patient.objects.order_by("id"), "csv", buf, max_workers=max_workers)
+        with zipfile.ZipFile(buf) as zf:
+            return stats, {name: zf.read(name).decode("utf-8-sig") for name in zf.namelist()}
+
+    def test_archive_names_and_reuse(self):
+        generate_patient_info_file(self.patients[0], "csv")
+
+        stats, files = self.export(max_workers=1)
+
+        self.assertEqual((stats["patients"], stats["rendered"], stats["reused"]), (3, 2, 1))
+        self.assertEqual(sorted(files), sorted([
+            "MR001-张三.csv",
+            "B12-李四.csv",
+            f"B12-李四-{self.patients[2].pk}.csv",
+        ]))
+        self.assertIn("MR001", files["MR001-张三.csv"])
+
+    def test_process_pool_renders_same_reports(self):
+        _, serial = self.export(max_workers=1)
+        stats, pooled = self.export(max_workers=2)
+
+        self.assertEqual(stats["rendered"], 3)
+        self.assertEqual(pooled, serial)
+
+    def test_web_export_caps_selection(self):
+        self.client.force_login(create_user(UserRole.STAFF))
+        ids = ",".join(str(p.pk) for p in self.patients)
+
+        with mock.patch.object(views, "PATIENT_REPORT_EXPORT_WEB_MAX_PATIENTS", 2):
+            response = self.client.post(reverse("epilepsy:batch_export_reports"), {"patient_ids": ids, "fmt": "pdf"})
+        self.assertRedirects(response, reverse("epilepsy:patient_list"), fetch_redirect_response=False)
+
+        with mock.patch.object(views, "PATIENT_REPORT_EXPORT_WEB_WORKERS", 1):
+            response = self.client.post(reverse("epilepsy:batch_export_reports"), {"patient_ids": ids, "fmt": "pdf"})
+        self.assertEqual(response.status_code, 200)
+        with zipfile.ZipFile(io.BytesIO(b"".join(response.streaming_content))) as zf:
+            self.assertEqual(len(zf.namelist()), 3)
+
+
+class PatientCsvExportTests(TestCase):
+    """批量 CSV 流式输出，code 翻译成中文。"""
+
+    def setUp(self):
+        self.client.force_login(create_user(UserRole.STAFF))
+        self.patients = [
+            create_patient(name="张三", past_medical_history="HYPOXIA,TRAUMA"),
+            create_patient(name="李四", gender="F", birthday=datetime.date(1985, 6, 1)),
+            create_patient(name="王五"),
+        ]
+
+    def read_rows(self, content):
+        self.assertTrue(content.startswith("\ufeff".encode("utf-8")))
+        return list(csv.DictReader(io.StringIO(content.decode("utf-8-sig"))))
+
+    def test_codes_are_translated(self):
+        ids = ",".join(str(p.pk) for p in self.patients)
+        response = self.client.post(reverse("epilepsy:batch_download_info"), {"patient_ids": ids})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        rows = self.read_rows(b"".join(response.streaming_content))
+        self.assertEqual([row["患者姓名"] for row in rows], ["张三", "李四", "王五"])
+        self.assertEqual(rows[0]["性别"], "男")
+        self.assertEqual(rows[0]["既往不良病史（多选）"], "围产期乏氧，外伤")
+        self.assertEqual(rows[1]["性别"], "女")
+        self.assertEqual(rows[1]["生日"], "1985-06-01")
+
+    def test_rows_are_streamed_in_chunks(self):
+        chunks = list(iter_patient_export_csv(Patient.objects.order_by("id"), chunk_size=2))
+
+        # 表头一块，之后每 2 行一块
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(len(self.read_rows(b"".join(chunks))), 3)
+
+
+class PatientCohortExportTests(TestCase):
+    """列式队列导出：按列表页的筛选条件，多选字段拆成列表，可选翻译。"""
+
+    def setUp(self):
+        self.client.force_login(create_user(UserRole.GUEST))
+        create_patient(name="张三", past_medical_history="HYPOXIA,TRAUMA", first_seizure_age=5)
+        create_patient(name="李四", gender="F")
+
+    def test_ndjson_export_follows_list_filters(self):
+        response = self.client.get(reverse("epilepsy:patient_cohort_export"), {"fmt": "ndjson", "q": "张三"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Export-Rows"], "1")
+        records = [json.loads(line) for line in gzip.decompress(b"".join(response.streaming_content)).splitlines()]
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]["name"], "张三")
+        self.assertEqual(records[0]["gender"], "M")
+        self.assertEqual(records[0]["birthday"], "1990-01-01")
+        self.assertEqual(records[0]["past_medical_history"], ["HYPOXIA", "TRAUMA"])
+        self.assertEqual(records[0]["first_seizure_age"], 5)
+
+    def test_ndjson_labels(self):
+        response = self.client.get(reverse("epilepsy:patient_cohort_export"), {"fmt": "ndjson", "labels": "1"})
+
+        records = [json.loads(line) for line in gzip.decompress(b"".join(response.streaming_content)).splitlines()]
+        self.assertEqual([r["gender"] for r in records], ["男", "女"])
+        self.assertEqual(records[0]["past_medical_history"], ["围产期乏氧", "外伤"])
+
+    def test_unknown_format_is_404(self):
+        response = self.client.get(reverse("epilepsy:patient_cohort_export"), {"fmt": "xlsx"})
+        self.assertEqual(response.status_code, 404)
+
+    @skipUnless(pq, "需要 pyarrow")
+    def test_parquet_columns_are_typed(self):
+        with tempfile.NamedTemporaryFile(suffix=".parquet") as out:
+            fmt, total = export_patient_cohort(Patient.objects.order_by("id"), out.name, fmt="parquet", chunk_size=1)
+            table = pq.read_table(out.name)
+
+        self.assertEqual((fmt, total), ("parquet", 2))
+        self.assertTrue(pa_types.is_date32(table.schema.field("birthday").type))
+        self.assertTrue(pa_types.is_list(table.schema.field("past_medical_history").type))
+        self.assertEqual(table.column("past_medical_history").to_pylist(), [["HYPOXIA", "TRAUMA"], []])
+        self.assertEqual(table.column("first_seizure_age").to_pylist(), [5, None])
+
+
+class LabelTranslatorTests(TestCase):
+    """详情页、导出和模板过滤器共用的 code -> 中文翻译。"""
+
+    def setUp(self):
+        self.translator = get_label_translator()
+
+    def test_split_codes_formats(self):
+        self.assertEqual(split_codes("HYPOXIA,TRAUMA"), ["HYPOXIA", "TRAUMA"])
+        self.assertEqual(split_codes('["HYPOXIA", "TRAUMA"]'), ["HYPOXIA", "TRAUMA"])
+        self.assertEqual(split_codes("['HYPOXIA']"), ["HYPOXIA"])
+        self.assertEqual(split_codes(["HYPOXIA", None, ""]), ["HYPOXIA"])
+        self.assertEqual(split_codes(""), [])
+
+    def test_label(self):
+        self.assertEqual(self.translator.label("gender", "F"), "女")
+        self.assertEqual(self.translator.label("gender", "X"), "X")
+        self.assertEqual(self.translator.label("past_medical_history", "HYPOXIA,UNKNOWN"), "围产期乏氧，UNKNOWN")
+        self.assertEqual(self.translator.label("name", "张三"), "张三")
+        self.assertEqual(self.translator.label("gender", None), "")
+
+    def test_row_translator_matches_label(self):
+        fields = ["name", "gender", "past_medical_history"]
+        translate = self.translator.row_translator(fields)
+
+        for row in [("张三", "M", "HYPOXIA,TRAUMA"), ("李四", "F", '["NONE"]'), ("王五", None, "")]:
+            expected = [self.translator.label(name, value) or value for name, value in zip(fields, row)]
+            self.assertEqual(translate(row), expected)
+
+    def test_display_multi_filter(self):
+        rendered = Template('{% load choice_display %}{{ value|display_multi:"past_medical_history" }}').render(
+            Context({"value": "['HYPOXIA', 'TRAUMA']"})
+        )
+        self.assertEqual(rendered, "围产期乏氧、外伤")
+
+
+class PatientDetailViewModelTests(TestCase):
+    """只读详情不构造 PatientForm，也不再查库。"""
+
+    def setUp(self):
+        self.patient = create_patient(gender="F", past_medical_history="HYPOXIA,MYSTERY")
+
+    def fields(self, slug):
+        section = build_patient_detail(self.patient, slugs={slug})[0]
+        return {field["name"]: field for field in section["fields"]}
+
+    def test_builds_without_form_or_queries(self):
+        with mock.patch.object(PatientForm, "__init__", side_effect=AssertionError("form built")), \
+                self.assertNumQueries(0):
+            sections = build_patient_detail(self.patient)
+
+        self.assertEqual(len(sections), len(views_helper.PATIENT_DETAIL_SECTIONS))
+        self.assertTrue(sections[0]["expanded"])
+        self.assertFalse(any(section["expanded"] for section in sections[1:]))
+
+    def test_choice_and_multi_choice_values(self):
+        basic = self.fields("basic")
+        self.assertEqual(basic["gender"]["value"], "女")
+        self.assertEqual(basic["gender"]["label"], str(PatientForm.base_fields["gender"].label))
+        self.assertEqual(basic["birthday"]["value"], datetime.date(1990, 1, 1))
+
+        history = self.fields("history")
+        self.assertIsNone(history["past_medical_history"]["value"])
+        self.assertEqual(history["past_medical_history"]["badges"], ["围产期乏氧", "MYSTERY"])
+
+
+class PatientDetailSectionLoadingTests(TestCase):
+    """详情面板先返回外壳和默认展开的分区，其余分区展开时按 ?section= 加载。"""
+
+    def setUp(self):
+        caches["fragments"].clear()
+        self.client.force_login(create_user(UserRole.STAFF))
+        self.patient = create_patient(family_history="外祖母有癫痫史")
+        self.url = reverse("epilepsy:patient_detail", args=[self.patient.pk])
+
+    def test_outline_only_renders_expanded_section(self):
+        response = self.client.get(self.url, HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "张三")
+        self.assertContains(response, f"{self.url}?section=history")
+        self.assertContains(response, f"{self.url}?section=preview")
+        self.assertNotContains(response, f"{self.url}?section=basic")
+        self.assertNotContains(response, "外祖母有癫痫史")
+
+    def test_section_fragment(self):
+        response = self.client.get(self.url, {"section": "history"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "外祖母有癫痫史")
+        self.assertNotContains(response, "collapseBasic")
+
+    def test_preview_section(self):
+        MRIFile.objects.create(patient=self.patient, file_name="t1.png", hash_code="t1")
+
+        response = self.client.get(self.url, {"section": "preview"})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "t1.png")
+
+    def test_unknown_section_is_404(self):
+        response = self.client.get(self.url, {"section": "nope"})
+        self.assertEqual(response.status_code, 404)
+
+
+class PatientFragmentCacheTests(TestCase):
+    """列表行和详情分区的 HTML 片段按 updated_at 缓存，保存患者后自然失效。"""
+
+    def setUp(self):
+        caches["fragments"].clear()
+        self.client.force_login(create_user(UserRole.ADMIN))
+        self.patient = create_patient(bed_number="A-01", family_history="无")
+
+    def test_detail_section_is_rendered_once_per_version(self):
+        first = render_patient_detail_section(self.patient, "history")
+
+        with mock.patch.object(views_helper, "render_to_string") as render:
+            self.assertEqual(render_patient_detail_section(self.patient, "history"), first)
+        render.assert_not_called()
+
+        self.patient.family_history = "父亲有热惊厥史"
+        self.patient.save()
+        self.assertIn("父亲有热惊厥史", render_patient_detail_section(self.patient, "history"))
+
+    def test_list_row_is_reused_until_patient_changes(self):
+        self.assertContains(self.client.get(reverse("epilepsy:patient_list")), "A-01")
+
+        # queryset.update 不改 updated_at：命中旧片段
+        Patient.objects.filter(pk=self.patient.pk).update(bed_number="B-02")
+        self.assertContains(self.client.get(reverse("epilepsy:patient_list")), "A-01")
+
+        self.patient.refresh_from_db()
+        self.patient.save()
+        response = self.client.get(reverse("epilepsy:patient_list"))
+        self.assertContains(response, "B-02")
+        self.assertNotContains(response, "A-01")
+
+    def test_list_row_changes_with_file_counters(self):
+        self.client.get(reverse("epilepsy:patient_list"))
+
+        MRIFile.objects.create(patient=self.patient, file_name="t1.nii", hash_code="t1", size_bytes=2048)
+        self.assertContains(self.client.get(reverse("epilepsy:patient_list")), "MRI 1")
+
+
+class PatientImportTests(TestCase):
+    """批量导入：CSV 导出文件可以直接回导；校验失败的行跳过并逐行报错；读文件中途出错时报告已写入的行数。"""
+
+    HEADER = "name,gender,birthday,handedness,admission_date"
+
+    def run_import(self, content, filename="patients.csv", batch_size=None, dry_run=False):
+        fmt = views_helper.guess_patient_import_format(filename)
+        return import_patients(
+            iter_patient_import_rows(io.BytesIO(content), fmt, filename=filename),
+            batch_size=batch_size,
+            dry_run=dry_run,
+        )
+
+    def rows(self, count, prefix="导入"):
+        lines = [self.HEADER] + [f"{prefix}{i},M,1990-01-01,R,2024-01-01" for i in range(count)]
+        return ("\n".join(lines) + "\n").encode("utf-8")
+
+    def test_csv_export_round_trip(self):
+        create_patient(name="张三", gender="F", past_medical_history="HYPOXIA,TRAUMA", family_history="无")
+        exported = b"".join(iter_patient_export_csv(Patient.objects.all()))
+        Patient.objects.all().delete()
+
+        stats = self.run_import(exported)
+
+        self.assertEqual((stats["rows"], stats["created"], stats["failed"]), (1, 1, 0), stats["errors"])
+        patient = Patient.objects.get()
+        self.assertEqual(patient.gender, "F")
+        self.assertEqual(split_codes(patient.past_medical_history), ["HYPOXIA", "TRAUMA"])
+        self.assertEqual(patient.family_history, "无")
+
+    def test_ndjson_with_invalid_rows(self):
+        lines = [
+            json.dumps({"name": "张三", "gender": "M", "birthday": "1990-01-01", "handedness": "R",
+                        "admission_date": "2024-01-01", "unknown_column": 1}),
+            json.dumps({"name": "李四", "gender": "M", "birthday": "not-a-date", "handedness": "R",
+                        "admission_date": "2024-01-01"}),
+            "{broken",
+            json.dumps(["not", "an", "object"]),
+        ]
+        stats = self.run_import("\n".join(lines).encode("utf-8"), filename="patients.ndjson")
+
+        self.assertEqual((stats["rows"], stats["created"], stats["failed"]), (4, 1, 3))
+        self.assertEqual([(line, field) for line, field, _ in stats["errors"]], [(2, "birthday"), (3, ""), (4, "")])
+        self.assertEqual(stats["ignored_columns"], ["unknown_column"])
+        self.assertEqual(list(Patient.objects.values_list("name", flat=True)), ["张三"])
+
+    def test_dry_run_writes_nothing(self):
+        stats = self.run_import(self.rows(3), dry_run=True)
+
+        self.assertEqual(stats["created"], 3)
+        self.assertFalse(Patient.objects.exists())
+
+    def test_gzip_and_batches(self):
+        stats = self.run_import(gzip.compress(self.rows(25)), filename="patients.csv.gz", batch_size=10)
+
+        self.assertEqual(stats["created"], 25)
+        self.assertEqual(Patient.objects.count(), 25)
+
+    def test_truncated_file_reports_committed_rows(self):
+        truncated = gzip.compress(self.rows(50))[:-12]
+
+        with self.assertRaises(PatientImportInterrupted) as ctx:
+            self.run_import(truncated, filename="patients.csv.gz", batch_size=10)
+
+        # 已提交的批次保留，没攒满的一批丢弃
+        self.assertEqual(ctx.exception.created, Patient.objects.count())
+        self.assertGreater(ctx.exception.created, 0)
+        self.assertEqual(ctx.exception.created % 10, 0)
+
+    def test_command_reports_committed_rows(self):
+        with tempfile.NamedTemporaryFile(suffix=".csv.gz") as f:
+            f.write(gzip.compress(self.rows(50))[:-12])
+            f.flush()
+            with self.assertRaisesMessage(CommandError, "出错前已写入"):
+                call_command("import_patients", f.name, "--batch-size", "10", stdout=io.StringIO())
+
+    def test_admin_upload(self):
+        admin_user = get_user_model().objects.create(username="root", is_staff=True, is_superuser=True)
+        self.client.force_login(admin_user)
+        url = reverse("admin:epilepsy_patient_import")
+
+        response = self.client.post(url, {"file": SimpleUploadedFile("p.csv", self.rows(3)), "batch_size": 10})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Patient.objects.count(), 3)
+
+        response = self.client.post(url, {"file": SimpleUploadedFile("p.csv.gz", b"not gzip"), "batch_size": 10})
+        self.assertContains(response, "无法读取导入文件")
+        self.assertEqual(Patient.objects.count(), 3)
+
+
+class DatasetIndexSyncTests(TestCase):
+    """本地文件索引的增量同步：没变化的目录不 ls 自己，但仍往下 ls 子目录。"""
+
+    OLD = "2024-01-01 00:00:00+00:00"
+    NEW = "2024-02-01 00:00:00+00:00"
+
+    def setUp(self):
+        self.dataset = PatientDataset.objects.create(
+            patient=create_patient(), name="SEEG", globus_endpoint_id="ep", globus_path="/data/p1",
+        )
+        # Endpoint 上的目录树：绝对路径 -> ls 结果
+        self.tree = {
+            "/data/p1/": [self.item("eeg", "dir"), self.item("notes.txt", size=10)],
+            "/data/p1/eeg/": [self.item("day1", "dir"), self.item("a.edf", size=100)],
+            "/data/p1/eeg/day1/": [self.item("b.edf", size=200)],
+        }
+        self.listed = []
+        patcher = mock.patch.object(dataset_index, "_list_dir", side_effect=self.list_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def item(self, name, type="file", size=0, modified=OLD):
+        return {"name": name, "type": type, "size": size, "last_modified": modified}
+
+    def list_dir(self, endpoint_id, path, auth_header):
+        self.listed.append(path)
+        if path not in self.tree:
+            raise dataset_index.DatasetIndexError(f"{path}：HTTP 404")
+        return self.tree[path]
+
+    def sync(self, **kwargs):
+        self.listed.clear()
+        return dataset_index.sync_dataset_index(self.dataset, {}, max_workers=2, **kwargs)
+
+    def paths(self):
+        return sorted(self.dataset.entries.values_list("path", flat=True))
+
+    def test_first_sync_indexes_everything(self):
+        stats = self.sync()
+
+        self.assertEqual(stats["created"], 5)
+        self.assertEqual((stats["files"], stats["bytes"]), (3, 310))
+        self.assertEqual(self.paths(), ["eeg", "eeg/a.edf", "eeg/day1", "eeg/day1/b.edf", "notes.txt"])
+        self.dataset.refresh_from_db()
+        self.assertEqual(self.dataset.indexed_files, 3)
+        self.assertIsNotNone(self.dataset.indexed_at)
+
+    def test_unchanged_directory_is_not_listed_but_its_subdirectories_are(self):
+        self.sync()
+        stats = self.sync()
+
+        self.assertEqual(sorted(self.listed), ["/data/p1/", "/data/p1/eeg/day1/"])
+        self.assertEqual(stats["dirs_skipped"], 1)
+        self.assertEqual((stats["created"], stats["updated"], stats["deleted"]), (0, 0, 0))
+
+    def test_change_below_an_unchanged_directory_is_found(self):
+        self.sync()
+        # 只有 day1 自己的 mtime 变了，它在 eeg 的列表里，而 eeg 没变
+        self.tree["/data/p1/eeg/day1/"].append(self.item("c.edf", size=50))
+        self.tree["/data/p1/eeg/"][0]["last_modified"] = self.NEW
+
+        stats = self.sync()
+
+        self.assertNotIn("/data/p1/eeg/", self.listed)
+        self.assertEqual(stats["created"], 1)
+        self.assertIn("eeg/day1/c.edf", self.paths())
+        self.assertEqual(stats["bytes"], 360)
+
+    def test_changed_directory_drops_deleted_entries(self):
+        self.sync()
+        self.tree["/data/p1/"] = [self.item("eeg", "dir", modified=self.NEW)]
+        del self.tree["/data/p1/eeg/"][1]
+
+        stats = self.sync()
+
+        self.assertEqual(stats["deleted"], 2)
+        self.assertEqual(self.paths(), ["eeg", "eeg/day1", "eeg/day1/b.edf"])
+
+    def test_full_sync_lists_every_directory(self):
+        self.sync()
+        self.sync(full=True)
+        self.assertEqual(len(self.listed), 3)
+
+    def test_listing_error_keeps_previous_index(self):
+        self.sync()
+        del self.tree["/data/p1/eeg/day1/"]
+
+        with self.assertRaises(dataset_index.DatasetIndexError):
+            self.sync()
+        self.assertEqual(PatientDatasetEntry.objects.count(), 5)
+
+
+@override_settings(SEARCH_PUBLISH_WATERMARK_OVERLAP=0, SEARCH_PUBLISH_RETRIES=0)
+class SearchPublishTests(TestCase):
+    """增量发布到本地 Search 替身：水位线只前进，失败的批次下次重发。"""
+
+    INDEX = "index-1"
+    VISIBLE_TO = ["public"]
+    AUTH = {"Authorization": "Bearer search-token"}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = TransferStubServer().start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.stop()
+        super().tearDownClass()
+
+    def setUp(self):
+        host, port = self.server.server_address[:2]
+        settings_override = override_settings(SEARCH_API_BASE_URL=f"http://{host}:{port}")
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.server.ingested.clear()
+        self.server.fail_ingests = 0
+        self.addCleanup(setattr, self.server, "fail_ingests", 0)
+        self.base_time = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        self.patients = [create_patient(name=f"患者{i}", gender="M") for i in range(3)]
+        for i, patient in enumerate(self.patients):
+            self.touch(patient, minutes=i)
+
+    def touch(self, patient, minutes):
+        """把患者的 updated_at 设成 base_time + minutes（不走 save，时间可控）。"""
+        updated_at = self.base_time + datetime.timedelta(minutes=minutes)
+        Patient.objects.filter(pk=patient.pk).update(updated_at=updated_at)
+        return updated_at
+
+    def publish(self, **kwargs):
+        kwargs.setdefault("batch_size", 2)
+        return search_publish.publish_patients(self.INDEX, self.AUTH, self.VISIBLE_TO, **kwargs)
+
+    def published_ids(self):
+        prefix = search_publish.get_subject("")
+        return [int(entry["subject"][len(prefix):]) for entry in self.server.ingested.get(self.INDEX, [])]
+
+    def test_first_run_publishes_everything_and_sets_watermark(self):
+        PatientDataset.objects.create(patient=self.patients[0], name="SEEG")
+        # 新建数据集会刷新患者的 updated_at，放回原来的位置
+        self.touch(self.patients[0], minutes=0)
+
+        stats = self.publish()
+
+        self.assertEqual((stats["published"], stats["batches"]), (3, 2))
+        self.assertEqual(self.published_ids(), [p.pk for p in self.patients])
+        state = SearchPublishState.objects.get(index_id=self.INDEX)
+        self.assertEqual((state.watermark_at, state.watermark_id), (self.base_time + datetime.timedelta(minutes=2), self.patients[2].pk))
+        self.assertEqual(state.published_total, 3)
+        self.assertEqual(
+            PatientDataset.objects.get().search_subject, search_publish.get_subject(self.patients[0].pk)
+        )
+
+    def test_documents_are_deidentified(self):
+        self.publish()
+        entry = self.server.ingested[self.INDEX][0]
+
+        self.assertEqual(entry["visible_to"], self.VISIBLE_TO)
+        content = entry["content"]["patient"]
+        self.assertEqual(content["gender"], ["男"])
+        self.assertEqual(content["age_at_admission"], 34)
+        self.assertNotIn("name", content)
+        self.assertNotIn("birthday", content)
+        self.assertNotIn("file_count", content)
+
+    def test_only_changed_patients_are_republished(self):
+        self.publish()
+        self.server.ingested.clear()
+        self.touch(self.patients[1], minutes=10)
+
+        stats = self.publish()
+
+        self.assertEqual(stats["published"], 1)
+        self.assertEqual(self.published_ids(), [self.patients[1].pk])
+        self.assertEqual(self.publish()["published"], 0)
+
+    def test_overlap_catches_late_commits_without_moving_watermark_back(self):
+        self.publish()
+        self.server.ingested.clear()
+        # 与水位线同一时刻、id 更小的修改，提交晚于上次发布
+        self.touch(self.patients[0], minutes=2)
+
+        self.assertEqual(self.publish()["published"], 0)
+        with override_settings(SEARCH_PUBLISH_WATERMARK_OVERLAP=30):
+            self.publish()
+
+        self.assertEqual(self.published_ids(), [self.patients[0].pk, self.patients[2].pk])
+        state = SearchPublishState.objects.get(index_id=self.INDEX)
+        self.assertEqual(state.watermark_id, self.patients[2].pk)
+
+    def test_failed_ingest_keeps_watermark_and_next_run_resumes(self):
+        self.server.fail_ingests = 1
+
+        with self.assertRaises(search_publish.SearchPublishError):
+            self.publish()
+        self.assertFalse(SearchPublishState.objects.filter(index_id=self.INDEX).exists())
+
+        self.assertEqual(self.publish()["published"], 3)
+
+    def test_retry_on_unavailable(self):
+        self.server.fail_ingests = 1
+        with override_settings(SEARCH_PUBLISH_RETRIES=1), mock.patch.object(search_publish.time, "sleep"):
+            self.assertEqual(self.publish()["published"], 3)
+
+    def test_full_and_dry_run(self):
+        self.publish()
+        self.server.ingested.clear()
+
+        stats = self.publish(full=True, dry_run=True)
+        self.assertEqual(stats["published"], 3)
+        self.assertEqual(stats["first_document"]["subject"], search_publish.get_subject(self.patients[0].pk))
+        self.assertEqual(self.server.ingested, {})
+
+        self.publish(full=True)
+        self.assertEqual(len(self.published_ids()), 3)
+        self.assertEqual(SearchPublishState.objects.get(index_id=self.INDEX).published_total, 6)
+
+    def test_system_counters_are_not_published(self):
+        coded, numeric = search_publish.get_publish_fields()
+        self.assertIn("gender", coded)
+        self.assertNotIn("name", coded)
+        self.assertFalse({"file_count", "file_bytes", "mri_file_count"} & set(numeric))
+
+    def test_command_requires_visible_to(self):
+        with override_settings(SEARCH_PUBLISH_VISIBLE_TO=None), self.assertRaises(CommandError):
+            call_command("publish_search_index", "--index", self.INDEX, "--token", "t", stdout=io.StringIO())
+
+
+class PatientObjectCacheTests(TestCase):
+    """患者对象读穿缓存：命中不查库，保存后按代数作废，进程内缓存时不启用。"""
+
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        self.object_cache = FileBasedCache(cache_dir, {})
+        patcher = mock.patch.object(views_helper, "get_patient_object_cache", return_value=self.object_cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.patient = create_patient(name="张三")
+
+    def test_locmem_fragments_disable_cache(self):
+        mock.patch.stopall()
+        self.assertIsNone(views_helper.get_patient_object_cache())
+
+    def test_hit_needs_no_query(self):
+        views_helper.get_patient_or_404(self.patient.pk)
+
+        with self.assertNumQueries(0):
+            patient = views_helper.get_patient_or_404(self.patient.pk)
+        self.assertEqual((patient.pk, patient.name, patient.birthday), (self.patient.pk, "张三", self.patient.birthday))
+        self.assertFalse(patient._state.adding)
+
+    def test_save_and_update_invalidate(self):
+        views_helper.get_patient_or_404(self.patient.pk)
+        self.patient.name = "李四"
+        self.patient.save()
+        self.assertEqual(views_helper.get_patient_or_404(self.patient.pk).name, "李四")
+
+        # queryset.update() 不发信号，要手动清除
+        Patient.objects.filter(pk=self.patient.pk).update(name="王五")
+        views_helper.invalidate_patient_object_cache(self.patient.pk)
+        self.assertEqual(views_helper.get_patient_or_404(self.patient.pk).name, "王五")
+
+    def test_row_read_before_concurrent_save_is_not_served(self):
+        stale = Patient.objects.get(pk=self.patient.pk)
+
+        def load_then_concurrent_save(model, pk):
+            # 读者查到旧行之后、写缓存之前，另一个请求保存了患者
+            Patient.objects.get(pk=pk).save()
+            Patient.objects.filter(pk=pk).update(name="李四")
+            return stale
+
+        with mock.patch.object(views_helper, "get_object_or_404", side_effect=load_then_concurrent_save):
+            self.assertEqual(views_helper.get_patient_or_404(self.patient.pk).name, "张三")
+
+        self.assertEqual(views_helper.get_patient_or_404(self.patient.pk).name, "李四")
+
+    def test_missing_patient_is_404(self):
+        with self.assertRaises(Http404):
+            views_helper.get_patient_or_404(self.patient.pk + 100)
+
+
+class FileCounterTests(PatientFileTestCase):
+    """患者上的文件统计：信号增减、按文件表重算、计数为 0 时页面当场修正。"""
+
+    def setUp(self):
+        super().setUp()
+        self.patient = create_patient()
+
+    def counters(self, *names):
+        self.patient.refresh_from_db()
+        return tuple(getattr(self.patient, name) for name in names)
+
+    def bulk_add(self, *sizes):
+        """bulk_create 不发信号，计数不会变。"""
+        MRIFile.objects.bulk_create([
+            MRIFile(patient=self.patient, parent_path=f"mri/{self.patient.pk}", file_name=f"{i}.nii",
+                    hash_code=f"h{i}", size_bytes=size)
+            for i, size in enumerate(sizes)
+        ])
+
+    def test_signals_adjust_counters(self):
+        mri = self.add_file(self.patient, "a.nii", b"x" * 10)
+        self.add_file(self.patient, "b.edf", b"y" * 5, model_cls=EEGFile, file_type="eeg")
+        self.assertEqual(
+            self.counters("mri_file_count", "mri_file_bytes", "eeg_file_count", "file_count", "file_bytes"),
+            (1, 10, 1, 2, 15),
+        )
+
+        mri.delete()
+        self.assertEqual(self.counters("mri_file_count", "mri_file_bytes", "file_count", "file_bytes"), (0, 0, 1, 5))
+
+    def test_patient_save_does_not_overwrite_counters(self):
+        stale = Patient.objects.get(pk=self.patient.pk)
+        self.add_file(self.patient, "a.nii", b"x" * 10)
+
+        stale.name = "李四"
+        stale.save()
+
+        self.assertEqual(self.counters("name", "file_count", "file_bytes"), ("李四", 1, 10))
+
+    def test_reconcile_fixes_drift(self):
+        other = create_patient(name="李四")
+        self.bulk_add(10, 20)
+
+        stats = file_counters.reconcile_file_counters(dry_run=True)
+        self.assertEqual(stats, {"checked": 2, "fixed": 1})
+        self.assertEqual(self.counters("file_count"), (0,))
+
+        self.assertEqual(file_counters.reconcile_file_counters()["fixed"], 1)
+        self.assertEqual(self.counters("mri_file_count", "mri_file_bytes", "file_count", "file_bytes"), (2, 30, 2, 30))
+        other.refresh_from_db()
+        self.assertEqual(other.file_count, 0)
+        self.assertEqual(file_counters.reconcile_file_counters()["fixed"], 0)
+
+    def test_reconcile_command(self):
+        self.bulk_add(10)
+        out = io.StringIO()
+
+        call_command("reconcile_file_counters", "--patient", str(self.patient.pk), "--dry-run", stdout=out)
+        self.assertIn("检查 1 个患者，有偏差 1 个", out.getvalue())
+        call_command("reconcile_file_counters", stdout=out)
+        self.assertEqual(self.counters("file_count"), (1,))
+
+    def test_repair_zero_counters(self):
+        empty = create_patient(name="李四")
+        self.bulk_add(10)
+        patients = list(Patient.objects.order_by("pk"))
+
+        self.assertEqual(file_counters.repair_zero_file_counters(patients), {self.patient.pk})
+        self.assertEqual((patients[0].file_count, patients[0].mri_file_bytes), (1, 10))
+        self.assertEqual(patients[1].pk, empty.pk)
+        self.assertEqual(self.counters("file_count"), (1,))
+
+        # 计数都对了之后不再查库
+        with self.assertNumQueries(0):
+            self.assertEqual(file_counters.repair_zero_file_counters(patients[:1]), set())
+
+    def test_pages_repair_zero_counters(self):
+        self.client.force_login(create_user(UserRole.STAFF))
+        self.bulk_add(10)
+
+        response = self.client.get(reverse("epilepsy:patient_files_panel", args=[self.patient.pk]))
+        self.assertEqual(len(response.context["mri_files"]), 1)
+
+        Patient.objects.filter(pk=self.patient.pk).update(file_count=0, mri_file_count=0, mri_file_bytes=0, file_bytes=0)
+        response = self.client.get(reverse("epilepsy:patient_list"))
+        self.assertEqual(response.context["patients"][0].file_count, 1)
+
+
+class FileMetadataTests(PatientFileTestCase):
+    """文件的扩展名 / 媒体类型 / 大小在入库时记录，预览和下载直接用这些列；历史数据用 backfill 补。"""
+
+    def setUp(self):
+        super().setUp()
+        self.patient = create_patient()
+
+    def upload(self, *files):
+        request = RequestFactory().post("/", {"mri_files": list(files)})
+        views_helper.handle_patient_file_uploads(request, self.patient)
+
+    def test_save_derives_ext_and_media_type(self):
+        file_obj = self.add_file(self.patient, "Scan.PNG", image_bytes())
+        self.assertEqual((file_obj.file_ext, file_obj.media_type), (".png", "image/png"))
+        self.assertEqual(file_obj.save_name, file_obj.hash_code + ".png")
+
+    def test_upload_records_size_and_counters(self):
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("t1.nii", b"x" * 7)
+        self.upload(
+            SimpleUploadedFile("a.png", image_bytes(), content_type="image/png"),
+            SimpleUploadedFile("series.zip", archive.getvalue(), content_type="application/zip"),
+        )
+
+        files = {f.file_name: f for f in MRIFile.objects.filter(patient=self.patient)}
+        self.assertEqual(set(files), {"a.png", "series/t1.nii"})
+        self.assertEqual(files["a.png"].size_bytes, len(image_bytes()))
+        self.assertEqual(files["series/t1.nii"].size_bytes, 7)
+        self.assertEqual(files["series/t1.nii"].file_ext, ".nii")
+        self.patient.refresh_from_db()
+        self.assertEqual(self.patient.mri_file_bytes, len(image_bytes()) + 7)
+
+    def test_preview_uses_stored_media_type(self):
+        file_obj = self.add_file(self.patient, "a.png", image_bytes())
+        MRIFile.objects.filter(pk=file_obj.pk).update(media_type="image/x-portable")
+        self.client.force_login(create_user(UserRole.GUEST))
+
+        response = self.client.get(reverse("epilepsy:patient_file_preview", args=["mri", file_obj.pk]))
+        self.assertEqual(response["Content-Type"], "image/x-portable")
+
+    def test_missing_file_is_404(self):
+        file_obj = self.add_file(self.patient, "a.png", image_bytes())
+        os.remove(os.path.join(self.base_dir, file_obj.parent_path, file_obj.save_name))
+        self.client.force_login(create_user(UserRole.GUEST))
+
+        self.assertEqual(
+            self.client.get(reverse("epilepsy:patient_file_preview", args=["mri", file_obj.pk])).status_code, 404
+        )
+        self.assertEqual(
+            self.client.get(reverse("epilepsy:patient_file_download", args=["mri", file_obj.pk])).status_code, 404
+        )
+
+    def add_legacy_rows(self):
+        """历史记录：bulk_create 不走 save()，没有大小、扩展名和媒体类型。"""
+        present = self.add_file(self.patient, "a.png", image_bytes())
+        MRIFile.objects.filter(pk=present.pk).update(size_bytes=0, file_ext="", media_type="")
+        MRIFile.objects.bulk_create([
+            MRIFile(patient=self.patient, parent_path=f"mri/{self.patient.pk}", file_name="gone.nii",
+                    hash_code="gone", save_name="gone.nii"),
+        ])
+        return present
+
+    def test_backfill_fills_missing_metadata(self):
+        present = self.add_legacy_rows()
+
+        stats = views_helper.backfill_patient_file_metadata(MRIFile, max_workers=2)
+
+        self.assertEqual(
+            (stats["checked"], stats["updated"], stats["missing"], stats["patient_ids"]), (2, 1, 1, {self.patient.pk})
+        )
+        present.refresh_from_db()
+        self.assertEqual(
+            (present.size_bytes, present.file_ext, present.media_type), (len(image_bytes()), ".png", "image/png")
+        )
+        self.assertEqual(views_helper.backfill_patient_file_metadata(MRIFile)["updated"], 0)
+
+    def test_backfill_command_reconciles_counters(self):
+        self.add_legacy_rows()
+        out, err = io.StringIO(), io.StringIO()
+
+        call_command("backfill_file_metadata", "--type", "mri", stdout=out, stderr=err)
+
+        self.assertIn("mri：检查 2 条，更新 1 条，文件缺失 1 条", out.getvalue())
+        self.assertIn("找不到物理文件", err.getvalue())
+        self.patient.refresh_from_db()
+        self.assertEqual((self.patient.mri_file_count, self.patient.mri_file_bytes), (2, len(image_bytes())))
+
+
+class PatientImageTileTests(PatientFileTestCase):
+    """大图 DZI 瓦片：金字塔逐层减半，.dzi 最后写入；未开启时接口 404，前端回退普通预览。"""
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(create_user(UserRole.GUEST))
+        self.file_obj = self.add_file(create_patient(), "big.png", image_bytes())
+        self.file_path = os.path.join(self.base_dir, self.file_obj.parent_path, self.file_obj.save_name)
+
+    def urls(self):
+        return (
+            reverse("epilepsy:patient_file_tiles_dzi", args=["mri", self.file_obj.pk]),
+            reverse("epilepsy:patient_file_tile", args=["mri", self.file_obj.pk, 10, 3, 2]),
+        )
+
+    def test_build_pyramid(self):
+        dzi_path = views_helper.build_patient_file_tiles(self.file_obj, self.file_path)
+
+        with open(dzi_path, encoding="utf-8") as f:
+            self.assertIn('<Size Width="800" Height="600"/>', f.read())
+        _, tiles_root = views_helper.get_patient_file_tile_paths(self.file_path, self.file_obj.hash_code)
+        # 800 像素需要 11 层（2^10 >= 800），最高层 4 x 3 个瓦片，最低层 1 x 1
+        self.assertEqual(len(os.listdir(tiles_root)), 11)
+        self.assertEqual(len(os.listdir(os.path.join(tiles_root, "10"))), 12)
+        with Image.open(os.path.join(tiles_root, "10", "3_2.jpg")) as tile:
+            self.assertEqual(tile.size, (800 - 3 * 256, 600 - 2 * 256))
+        with Image.open(os.path.join(tiles_root, "0", "0_0.jpg")) as tile:
+            self.assertEqual(tile.size, (1, 1))
+
+    def test_needs_tiles_by_pixel_count(self):
+        self.assertFalse(views_helper.needs_patient_file_tiles(self.file_path))
+        with mock.patch.object(views_helper, "PATIENT_IMAGE_TILE_MIN_PIXELS", 800 * 600):
+            self.assertTrue(views_helper.needs_patient_file_tiles(self.file_path))
+
+    def test_endpoints_404_when_disabled(self):
+        views_helper.build_patient_file_tiles(self.file_obj, self.file_path)
+        for url in self.urls():
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_endpoints_serve_built_tiles(self):
+        with mock.patch.object(views, "PATIENT_IMAGE_TILES_ENABLED", True):
+            dzi_url, tile_url = self.urls()
+            self.assertEqual(self.client.get(dzi_url).status_code, 404)
+
+            views_helper.build_patient_file_tiles(self.file_obj, self.file_path)
+            response = self.client.get(dzi_url)
+            self.assertEqual(response["Content-Type"], "application/xml")
+            response = self.client.get(tile_url)
+            self.assertEqual(response["Content-Type"], "image/jpeg")
@@ -18,10 +18,18 @@ urlpatterns = [
     path("patients/<int:pk>/export/<str:fmt>/",views.patient_export,name="patient_export",),
     path("patients/<int:pk>/edit/", views.patient_edit, name="patient_edit"),
     path("patients/<int:pk>/detail/", views.patient_detail, name="patient_detail"),
+    # 分区保存（POST / PATCH），section 为 PATIENT_GROUP_FIELDS 的 key
+    path("patients/<int:pk>/sections/<str:section>/", views.patient_section_update, name="patient_section_update"),
+    path("patients/<int:pk>/gallery/<str:file_type>/", views.patient_gallery, name="patient_gallery"),
     path('patients/batch_download_info/', views.batch_download_info, name='batch_download_info'),
     path('patients/batch_delete/', views.batch_delete_patients, name='batch_delete_patients'),
+    path('patients/batch_export_reports/', views.batch_export_reports, name='batch_export_reports'),
+    path('patients/cohort_export/', views.patient_cohort_export, name='patient_cohort_export'),
     path('patients/batch_download_files/', views.batch_download_files, name='batch_download_files'),
     path("patients/files/preview/<str:file_type>/<int:file_id>/", views.patient_file_preview, name="patient_file_preview"),
+    # Deep Zoom：瓦片 URL 由查看器按 DZI 约定从 .dzi 地址推导（xxx.dzi -> xxx_files/<level>/<col>_<row>.jpg）
+    path("patients/files/tiles/<str:file_type>/<int:file_id>.dzi", views.patient_file_tiles_dzi, name="patient_file_tiles_dzi"),
+    path("patients/files/tiles/<str:file_type>/<int:file_id>_files/<int:level>/<int:col>_<int:row>.jpg", views.patient_file_tile, name="patient_file_tile"),
 
     path("settings/users/", views.UserListView.as_view(), name="user_list"),  # 管理设置
     path("users/", views.UserListView.as_view(), name="user_list"),
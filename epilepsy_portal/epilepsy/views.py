@@ -1,14 +1,14 @@
 # epilepsy/views.py
 
-import os, csv, datetime, io, zipfile, re
-import mimetypes
+import os, io, zipfile, re, tempfile
+from functools import partial
 from django.utils.encoding import smart_str
 from django.conf import settings
 from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import get_user_model, logout
 from django.shortcuts import render, get_object_or_404, redirect
-from django.http import HttpResponse, JsonResponse, HttpResponseForbidden, FileResponse, Http404
+from django.http import HttpResponse, JsonResponse, HttpResponseForbidden, HttpResponseNotAllowed, FileResponse, Http404, StreamingHttpResponse, QueryDict
 from django.views.generic import ListView, CreateView, UpdateView, DetailView, TemplateView
 from django.urls import reverse_lazy
 from django.db import models
@@ -31,15 +31,40 @@ from .forms import PatientForm, UserWithRoleForm
 from .views_helper import (
     build_dashboard_context,
     require_admin,
+    require_file_viewer,
     handle_patient_file_uploads,
+    has_patient_file_changes,
+    save_patient_section,
+    get_patient_or_404,
     build_patient_file_path,
+    open_patient_file_or_404,
+    build_patient_file_thumbnail,
+    build_patient_gallery,
+    build_patient_detail_outline,
+    render_patient_detail_section,
+    PATIENT_DETAIL_PREVIEW_SECTION,
+    PATIENT_FRAGMENT_CACHE_TIMEOUT,
+    get_viewer_role,
+    export_patient_cohort,
+    export_patient_reports,
+    PATIENT_REPORT_EXPORT_WEB_WORKERS,
+    PATIENT_REPORT_EXPORT_WEB_MAX_PATIENTS,
+    iter_patient_export_csv,
     generate_patient_info_file,
+    get_patient_file_tile_paths,
+    get_preview_image_or_404,
+    PATIENT_IMAGE_TILES_ENABLED,
+    PATIENT_GALLERY_TYPES,
+    PREVIEW_THUMBNAIL_SIZES,
 )
-from .json import PATIENT_GROUP_FIELDS, FIELDS_FOR_EXPORT
+from .dataset_index import ENTRY_SEARCH_LIMIT, search_dataset_entries
+from .file_counters import repair_zero_file_counters
+from .json import PATIENT_GROUP_FIELDS
 import logging
 from pprint import pformat
 
 form_debug_logger = logging.getLogger("epilepsy.formdebug")
+logger = logging.getLogger(__name__)
 
 
 def log_invalid_form(request, form, *, tag="PatientForm"):
@@ -168,12 +193,13 @@ class PatientListView(RoleRequiredMixin, ListView):
 
         return tuple(parts)
 
-    def get_queryset(self):
-        qs = super().get_queryset()
-        request = self.request
-
+    def filter_queryset(self, qs, params):
+        """
+        按列表页的搜索参数（关键字 / 高级搜索）过滤患者，不含排序。
+        params 一般是 request.GET；队列导出等入口复用同一套条件。
+        """
         # 基础关键字搜索
-        q = request.GET.get("q", "").strip()
+        q = params.get("q", "").strip()
         if q:
             qs = qs.filter(
                 Q(name__icontains=q)
@@ -187,21 +213,21 @@ class PatientListView(RoleRequiredMixin, ListView):
         qs = self._apply_date_range_filter(
             qs,
             "admission_date",
-            request.GET.get("admission_start"),
-            request.GET.get("admission_end"),
+            params.get("admission_start"),
+            params.get("admission_end"),
         )
 
         # 评估时间范围：假定字段名为 evaluation_date（如不同，请改 field_name）
         qs = self._apply_date_range_filter(
             qs,
             "evaluation_date",
-            request.GET.get("evaluation_start"),
-            request.GET.get("evaluation_end"),
+            params.get("evaluation_start"),
+            params.get("evaluation_end"),
         )
 
         # 年龄范围：用“当前年份 - 生日年份”近似计算
-        age_min = request.GET.get("age_min")
-        age_max = request.GET.get("age_max")
+        age_min = params.get("age_min")
+        age_max = params.get("age_max")
         if (age_min or age_max) and self._field_exists("birthday"):
             today = timezone.now().date()
             from datetime import date
@@ -232,7 +258,7 @@ class PatientListView(RoleRequiredMixin, ListView):
                 qs = qs.filter(**lookup)
 
         # 自然发作状态：对应模型字段 seizure_state (AWAKE/SLEEP/BOTH)
-        natural_state = request.GET.get("natural_state", "").strip()
+        natural_state = params.get("natural_state", "").strip()
         if self._field_exists("seizure_state"):
             # 兼容旧版（1=有, 0=无）：这里解释为“该字段是否已填写”
             if natural_state in ("1", "0"):
@@ -250,7 +276,7 @@ class PatientListView(RoleRequiredMixin, ListView):
                     pass
 
         # 先兆：对应模型字段 aura (Y/N)。若存在 major_aura，也一并纳入“有/无”的判断
-        aura = request.GET.get("aura", "").strip()
+        aura = params.get("aura", "").strip()
         # 兼容旧版（1=有, 0=无）
         if aura in ("1", "0"):
             aura = "Y" if aura == "1" else "N"
@@ -273,38 +299,38 @@ class PatientListView(RoleRequiredMixin, ListView):
         qs = self._apply_numeric_range_filter(
             qs,
             "moca_score",
-            request.GET.get("moca_min"),
-            request.GET.get("moca_max"),
+            params.get("moca_min"),
+            params.get("moca_max"),
         )
         qs = self._apply_numeric_range_filter(
             qs,
             "hama_score",
-            request.GET.get("hama_min"),
-            request.GET.get("hama_max"),
+            params.get("hama_min"),
+            params.get("hama_max"),
         )
         qs = self._apply_numeric_range_filter(
             qs,
             "hamd_score",
-            request.GET.get("hamd_min"),
-            request.GET.get("hamd_max"),
+            params.get("hamd_min"),
+            params.get("hamd_max"),
         )
         qs = self._apply_numeric_range_filter(
             qs,
             "bai_score",
-            request.GET.get("bai_min"),
-            request.GET.get("bai_max"),
+            params.get("bai_min"),
+            params.get("bai_max"),
         )
         qs = self._apply_numeric_range_filter(
             qs,
             "bdi_score",
-            request.GET.get("bdi_min"),
-            request.GET.get("bdi_max"),
+            params.get("bdi_min"),
+            params.get("bdi_max"),
         )
         qs = self._apply_numeric_range_filter(
             qs,
             "epilepsy_scale_score",
-            request.GET.get("epilepsy_scale_min"),
-            request.GET.get("epilepsy_scale_max"),
+            params.get("epilepsy_scale_min"),
+            params.get("epilepsy_scale_max"),
         )
 
         # 关键字过滤：按字段分组（PATIENT_GROUP_FIELDS）
@@ -455,7 +481,7 @@ class PatientListView(RoleRequiredMixin, ListView):
             return out
 
         for param, group_names in group_param_to_group_names.items():
-            raw = (request.GET.get(param) or "").strip()
+            raw = (params.get(param) or "").strip()
             if not raw:
                 continue
 
@@ -506,7 +532,11 @@ class PatientListView(RoleRequiredMixin, ListView):
                     qs = qs.filter(q_obj)
 
         # 防止关联过滤导致重复
-        qs = qs.distinct()
+        return qs.distinct()
+
+    def get_queryset(self):
+        qs = self.filter_queryset(super().get_queryset(), self.request.GET)
+        request = self.request
 
         # ---------- 排序（点击表头） ----------
         sort = (request.GET.get("sort") or "").strip()
@@ -515,12 +545,12 @@ class PatientListView(RoleRequiredMixin, ListView):
             direction = "asc"
         reverse = (direction == "desc")
 
-        allowed = {"name", "gender", "birthday", "bed_number", "admission_date"}
+        allowed = {"name", "gender", "birthday", "bed_number", "admission_date", "file_bytes"}
         if sort not in allowed:
             return qs.order_by("id")
 
-        # 日期字段：用数据库排序
-        if sort in ("birthday", "admission_date"):
+        # 日期 / 数据量：用数据库排序（数据量是 Patient 上的统计字段，不用 join 文件表）
+        if sort in ("birthday", "admission_date", "file_bytes"):
             order = f"-{sort}" if reverse else sort
             return qs.order_by(order, "id")
 
@@ -637,7 +667,7 @@ class PatientListView(RoleRequiredMixin, ListView):
             prefix = f"?{base_qs}&" if base_qs else "?"
             return f"{prefix}sort={field}&dir={next_dir}"
 
-        sort_fields = ["name", "gender", "birthday", "bed_number", "admission_date"]
+        sort_fields = ["name", "gender", "birthday", "bed_number", "admission_date", "file_bytes"]
         sort_links = {}
         for field in sort_fields:
             is_cur = (sort == field)
@@ -647,6 +677,13 @@ class PatientListView(RoleRequiredMixin, ListView):
 
         context["sort_links"] = sort_links
 
+        # 计数为 0 的行确认一下是否真的没有文件（不发信号的写入会漏计），有就当场重算
+        repair_zero_file_counters(context["patients"])
+
+        # 列表行片段缓存：按 患者 + updated_at + 查看者角色 缓存整行 HTML
+        context["viewer_role"] = get_viewer_role(request)
+        context["fragment_cache_timeout"] = PATIENT_FRAGMENT_CACHE_TIMEOUT
+
         return context
 
     # ---------- 内部工具方法 ----------
@@ -715,7 +752,8 @@ class PatientCreateView(RoleRequiredMixin, CreateView):
 
     def form_valid(self, form):
         self.object = form.save()
-        handle_patient_file_uploads(self.request, self.object)
+        if has_patient_file_changes(self.request):
+            handle_patient_file_uploads(self.request, self.object)
 
         if self.request.headers.get("x-requested-with") == "XMLHttpRequest":
             return JsonResponse(
@@ -754,7 +792,8 @@ class PatientUpdateView(RoleRequiredMixin, UpdateView):
     def form_valid(self, form):
         # 手动保存，避免 UpdateView 默认 success_url 跳转
         self.object = form.save()
-        handle_patient_file_uploads(self.request, self.object)
+        if has_patient_file_changes(self.request):
+            handle_patient_file_uploads(self.request, self.object)
 
         if self.request.headers.get("x-requested-with") == "XMLHttpRequest":
             return JsonResponse(
@@ -886,9 +925,18 @@ class PatientDatasetListView(RoleRequiredMixin, DetailView):
     context_object_name = "patient"
     allowed_roles = [UserRole.ADMIN, UserRole.STAFF, UserRole.GUEST]
 
+    def get_object(self, queryset=None):
+        return get_patient_or_404(self.kwargs["pk"])
+
     def get_context_data(self, **kwargs):
         ctx = super().get_context_data(**kwargs)
         ctx["datasets"] = self.object.datasets.filter(is_active=True)
+        # 文件搜索走本地索引（manage.py sync_dataset_index），不实时访问 Globus
+        q = self.request.GET.get("q", "").strip()
+        ctx["q"] = q
+        if q:
+            ctx["entries"] = search_dataset_entries(ctx["datasets"], q)
+            ctx["entry_limit"] = ENTRY_SEARCH_LIMIT
         return ctx
 
 
@@ -913,7 +961,7 @@ def patient_dataset_download(request, pk):
 
 @login_required
 def patient_files_panel(request, pk):
-    patient = get_object_or_404(Patient, pk=pk)
+    patient = get_patient_or_404(pk)
 
     profile = getattr(request.user, "profile", None)
     if not profile or profile.role not in [
@@ -923,12 +971,14 @@ def patient_files_panel(request, pk):
     ]:
         return HttpResponseForbidden("无权限查看")
 
+    # 按 Patient 上的文件统计跳过没有文件的类型，不再逐类查询
+    repair_zero_file_counters([patient])
     context = {
         "patient": patient,
-        "mri_files": patient.mri_files.all().order_by("-created_at"),
-        "pet_files": patient.pet_files.all().order_by("-created_at"),
-        "eeg_files": patient.eeg_files.all().order_by("-created_at"),
-        "seeg_files": patient.seeg_files.all().order_by("-created_at"),
+        "mri_files": patient.mri_files.all().order_by("-created_at") if patient.mri_file_count else [],
+        "pet_files": patient.pet_files.all().order_by("-created_at") if patient.pet_file_count else [],
+        "eeg_files": patient.eeg_files.all().order_by("-created_at") if patient.eeg_file_count else [],
+        "seeg_files": patient.seeg_files.all().order_by("-created_at") if patient.seeg_file_count else [],
     }
     return render(request, "epilepsy/patient_files_panel.html", context)
 
@@ -954,11 +1004,8 @@ def patient_file_download(request, file_type, file_id):
         raise Http404("未知文件类型")
 
     file_obj, file_path = build_patient_file_path(model_cls, file_id)
-    if not os.path.exists(file_path):
-        raise Http404("文件不存在")
-
     return FileResponse(
-        open(file_path, "rb"),
+        open_patient_file_or_404(file_path),
         as_attachment=True,
         filename=file_obj.file_name,
     )
@@ -970,13 +1017,15 @@ def simple_logout(request):
 
 
 def patient_edit(request, pk):
+    # 编辑表单始终从数据库取，不用患者对象缓存
     patient = get_object_or_404(Patient, pk=pk)
 
     if request.method == "POST":
         form = PatientForm(request.POST, request.FILES, instance=patient)
         if form.is_valid():
             patient = form.save()
-            handle_patient_file_uploads(request, patient)
+            if has_patient_file_changes(request):
+                handle_patient_file_uploads(request, patient)
 
             if request.headers.get("x-requested-with") == "XMLHttpRequest":
                 return JsonResponse({"success": True, "keep_open": True})
@@ -999,39 +1048,69 @@ def patient_edit(request, pk):
 
 
 
-def patient_detail(request, pk):
+@login_required
+def patient_section_update(request, pk, section):
+    """
+    分区保存：只校验、只写入一个分区（PATIENT_GROUP_FIELDS 的 key，如 basic / eeg）里提交了的字段。
+    - POST（表单，可带文件）或 PATCH（application/x-www-form-urlencoded）
+    - 未提交的字段保持原值；多选字段提交空值（field=）表示清空
+    - 只 UPDATE 有变化的列；请求里没有文件上传 / 删除时不进入文件处理
+    """
+    profile = getattr(request.user, "profile", None)
+    if not profile or profile.role not in [UserRole.ADMIN, UserRole.STAFF]:
+        return HttpResponseForbidden("无权限修改")
+
+    if request.method == "POST":
+        data = request.POST
+    elif request.method == "PATCH":
+        data = QueryDict(request.body, encoding=request.encoding)
+    else:
+        return HttpResponseNotAllowed(["POST", "PATCH"])
+
     patient = get_object_or_404(Patient, pk=pk)
-    form = PatientForm(instance=patient)
+    form, updated_fields = save_patient_section(patient, section, data)
+    if updated_fields is None:
+        log_invalid_form(request, form, tag=f"patient_section_update.{section}")
+        error_data = form.errors.get_json_data(escape_html=True)
+        errors = {k: [e.get("message", "") for e in v] for k, v in error_data.items()}
+        return JsonResponse({"success": False, "errors": errors}, status=400)
+
+    # PATCH 不解析 multipart，文件只随 POST 提交
+    if request.method == "POST" and has_patient_file_changes(request):
+        handle_patient_file_uploads(request, patient)
+
+    return JsonResponse({
+        "success": True,
+        "updated_fields": updated_fields,
+        "updated_at": patient.updated_at.isoformat() if patient.updated_at else None,
+    })
 
-    allowed_ext = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}
 
-    def first_three_images(qs):
-        out = []
-        for f in qs.order_by("-created_at"):
-            ext = os.path.splitext(getattr(f, "file_name", "") or "")[1].lower()
-            if ext in allowed_ext:
-                out.append(f)
-            if len(out) >= 60:
-                break
-        return out
-    def all_images(qs):
-        out = []
-        for f in qs.order_by("-created_at"):
-            ext = os.path.splitext(getattr(f, "file_name", "") or "")[1].lower()
-            if ext in allowed_ext:
-                out.append(f)
-        return out
+def patient_detail(request, pk):
+    patient = get_patient_or_404(pk)
+
+    # ?section=<key>：只返回一个分区的片段（面板展开时按需加载）
+    section = request.GET.get("section")
+    if section == PATIENT_DETAIL_PREVIEW_SECTION:
+        # 每个模态只取第一页图片，其余通过 patient_gallery 按页加载
+        return render(request, "epilepsy/patient_detail_preview.html", {
+            "patient": patient,
+            "preview_mri": build_patient_gallery(patient, "mri"),
+            "preview_pet": build_patient_gallery(patient, "pet"),
+            "preview_eeg": build_patient_gallery(patient, "eeg"),
+            "preview_seeg": build_patient_gallery(patient, "seeg"),
+        })
+    if section:
+        return HttpResponse(render_patient_detail_section(patient, section))
+
+    # 只读展示不再构造 PatientForm：先返回标题和折叠卡片外壳，默认展开的分区直接带上内容。
+    # 外壳本身按 患者 + updated_at + 查看者角色 做片段缓存；detail_sections 传可调用对象，
+    # 模板只在缓存未命中时才会调用它
     context = {
         "patient": patient,
-        "form": form,
-        # "preview_mri": first_three_images(patient.mri_files.all()),
-        # "preview_pet": first_three_images(patient.pet_files.all()),
-        # "preview_eeg": first_three_images(patient.eeg_files.all()),
-        # "preview_seeg": first_three_images(patient.seeg_files.all()),
-        "preview_mri": all_images(patient.mri_files.all()),
-        "preview_pet": all_images(patient.pet_files.all()),
-        "preview_eeg": all_images(patient.eeg_files.all()),
-        "preview_seeg": all_images(patient.seeg_files.all()),
+        "detail_sections": partial(build_patient_detail_outline, patient),
+        "viewer_role": get_viewer_role(request),
+        "fragment_cache_timeout": PATIENT_FRAGMENT_CACHE_TIMEOUT,
     }
 
     if request.headers.get("x-requested-with") == "XMLHttpRequest":
@@ -1040,6 +1119,28 @@ def patient_detail(request, pk):
     return render(request, "epilepsy/patient_detail.html", context)
 
 
+@login_required
+def patient_gallery(request, pk, file_type):
+    """
+    详情页画廊的分页片段：?page=N，返回该页图片 + “加载更多”按钮。
+    """
+    profile = getattr(request.user, "profile", None)
+    if not profile or profile.role not in [UserRole.ADMIN, UserRole.STAFF, UserRole.GUEST]:
+        return HttpResponseForbidden("无权限查看")
+
+    if file_type not in PATIENT_GALLERY_TYPES:
+        raise Http404("未知文件类型")
+
+    patient = get_patient_or_404(pk)
+    try:
+        page = int(request.GET.get("page", 1))
+    except ValueError:
+        page = 1
+
+    gallery = build_patient_gallery(patient, file_type, page=page)
+    return render(request, "epilepsy/patient_gallery_items.html", {"patient": patient, "gallery": gallery})
+
+
 
 @login_required
 def patient_export(request, pk, fmt):
@@ -1047,7 +1148,7 @@ def patient_export(request, pk, fmt):
     导出单个患者信息，view 只做权限 + 响应，
     实际文件生成在 helper 中完成。
     """
-    patient = get_object_or_404(Patient, pk=pk)
+    patient = get_patient_or_404(pk)
 
     profile = getattr(request.user, "profile", None)
     if not profile or profile.role not in [
@@ -1103,22 +1204,89 @@ def batch_download_info(request):
     id_list = [int(x) for x in ids_str.split(',') if x.strip()]
     patients = Patient.objects.filter(id__in=id_list).order_by('id')
 
-    response = HttpResponse(content_type='text/csv; charset=utf-8-sig')
+    # 边查边写：分批读库、逐块返回，大批量导出时内存占用恒定、浏览器立即开始下载
+    response = StreamingHttpResponse(iter_patient_export_csv(patients), content_type='text/csv; charset=utf-8')
     response['Content-Disposition'] = 'attachment; filename="患者信息_批量导出.csv"'
+    return response
+
+@login_required
+def patient_cohort_export(request):
+    """
+    按列表页当前的筛选条件导出患者队列（列式，供 pandas 等分析使用）。
+    默认 Parquet（需要 pyarrow），?fmt=ndjson 或未安装 pyarrow 时为 gzip 压缩的 NDJSON；
+    ?labels=1 时把 code 翻译为中文。
+    """
+    profile = getattr(request.user, "profile", None)
+    if not profile or profile.role not in [UserRole.ADMIN, UserRole.STAFF, UserRole.GUEST]:
+        return HttpResponseForbidden("无权限导出")
 
-    writer = csv.writer(response)
-    # header
-    writer.writerow([label for _, label in FIELDS_FOR_EXPORT])
+    fmt = request.GET.get("fmt") or None
+    if fmt not in (None, "parquet", "ndjson"):
+        raise Http404("未知导出格式")
 
-    for p in patients:
-        row = []
-        for field_name, _ in FIELDS_FOR_EXPORT:
-            value = getattr(p, field_name, '')
-            if isinstance(value, (datetime.date, datetime.datetime)):
-                value = value.strftime('%Y-%m-%d')
-            row.append(value if value is not None else '')
-        writer.writerow(row)
+    patients = PatientListView().filter_queryset(Patient.objects.all(), request.GET).order_by("id")
 
+    # Parquet 的元数据写在文件末尾，只能先写临时文件再返回
+    out = tempfile.NamedTemporaryFile(prefix="tmp_cohort_", delete=False)
+    out.close()
+    try:
+        fmt, total = export_patient_cohort(patients, out.name, fmt=fmt, labels=request.GET.get("labels") == "1")
+    except ValueError as e:
+        os.remove(out.name)
+        return HttpResponse(str(e), status=400)
+
+    archive = open(out.name, "rb")
+    # 打开后即可删除，文件句柄关闭时空间才真正释放
+    os.remove(out.name)
+
+    filename = "患者队列.parquet" if fmt == "parquet" else "患者队列.ndjson.gz"
+    content_type = "application/vnd.apache.parquet" if fmt == "parquet" else "application/gzip"
+    response = FileResponse(archive, as_attachment=True, filename=filename, content_type=content_type)
+    response["X-Export-Rows"] = str(total)
+    return response
+
+@login_required
+@require_POST
+def batch_export_reports(request):
+    """
+    批量导出所选患者的 Word / PDF 报告，打包成一个 zip。
+    渲染在进程池中并行完成，压缩包先写到临时文件再流式返回，不占用大块内存。
+    在 web worker 里执行，子进程数和一次导出的患者数有上限（更多的用 manage.py export_patient_reports）。
+    """
+    profile = getattr(request.user, "profile", None)
+    if not profile or profile.role not in [UserRole.ADMIN, UserRole.STAFF, UserRole.GUEST]:
+        return HttpResponseForbidden("无权限导出")
+
+    ids_str = request.POST.get('patient_ids', '')
+    id_list = [int(x) for x in ids_str.split(',') if x.strip()]
+    fmt = request.POST.get('fmt', 'word').lower()
+    if fmt not in ('word', 'pdf'):
+        raise Http404("未知导出格式")
+    if not id_list:
+        messages.warning(request, '未选择任何患者。')
+        return redirect('epilepsy:patient_list')
+    if len(set(id_list)) > PATIENT_REPORT_EXPORT_WEB_MAX_PATIENTS:
+        messages.warning(
+            request,
+            f'一次最多导出 {PATIENT_REPORT_EXPORT_WEB_MAX_PATIENTS} 位患者的报告，'
+            f'更多患者请联系管理员使用 manage.py export_patient_reports 导出。',
+        )
+        return redirect('epilepsy:patient_list')
+
+    patients = Patient.objects.filter(id__in=id_list).order_by('id')
+
+    archive = tempfile.TemporaryFile(suffix=".zip")
+    stats = export_patient_reports(patients, fmt, archive, max_workers=PATIENT_REPORT_EXPORT_WEB_WORKERS)
+    archive.seek(0)
+    logger.info(
+        "batch_export_reports: %s patients (%s rendered, %s reused) in %.2fs, %.1f patients/s",
+        stats["patients"], stats["rendered"], stats["reused"], stats["seconds"], stats["patients_per_second"],
+    )
+
+    label = "Word" if fmt == "word" else "PDF"
+    response = FileResponse(archive, as_attachment=True, filename=f"患者报告_{label}_批量导出.zip",
+                            content_type='application/zip')
+    response['X-Export-Patients-Per-Second'] = f"{stats['patients_per_second']:.1f}"
     return response
 
 @login_required
@@ -1198,28 +1366,77 @@ def patient_file_preview(request, file_type, file_id):
     用于 <img src="..."> 预览：Content-Disposition inline，不强制下载。
     仅允许图片类型，避免浏览器直接打开非图片内容带来的风险。
     """
-    profile = getattr(request.user, "profile", None)
-    if not profile or profile.role not in [UserRole.ADMIN, UserRole.STAFF, UserRole.GUEST]:
-        return HttpResponseForbidden("无权限查看")
+    forbidden = require_file_viewer(request)
+    if forbidden:
+        return forbidden
 
-    model_map = {"mri": MRIFile, "pet": PETFile, "eeg": EEGFile, "seeg": SEEGFile}
-    model_cls = model_map.get(file_type)
-    if model_cls is None:
-        raise Http404("未知文件类型")
+    file_obj, file_path = get_preview_image_or_404(file_type, file_id)
 
-    file_obj, file_path = build_patient_file_path(model_cls, file_id)
-    if not os.path.exists(file_path):
-        raise Http404("文件不存在")
+    # ?size=256 / ?size=1024：返回缓存的缩略图；不带 size 时返回原图
+    size_raw = request.GET.get("size", "").strip()
+    if size_raw:
+        try:
+            size = int(size_raw)
+        except ValueError:
+            size = None
+        if size not in PREVIEW_THUMBNAIL_SIZES:
+            raise Http404("不支持的缩略图尺寸")
+
+        thumb_path, thumb_type = build_patient_file_thumbnail(file_obj, file_path, size)
+        if thumb_path:
+            resp = FileResponse(open(thumb_path, "rb"), content_type=thumb_type)
+            resp["Content-Disposition"] = f'inline; filename="{smart_str(file_obj.file_name)}"'
+            # 缩略图按内容 hash 命名，内容不会变化，允许浏览器缓存
+            resp["Cache-Control"] = "private, max-age=604800"
+            return resp
+
+    # 媒体类型入库时已记录，不再按文件名猜；文件不存在时打开即 404，不单独 exists
+    content_type = file_obj.media_type or "application/octet-stream"
+    resp = FileResponse(open_patient_file_or_404(file_path), content_type=content_type)
+    resp["Content-Disposition"] = f'inline; filename="{smart_str(file_obj.file_name)}"'
+    return resp
 
-    # 仅允许常见图片扩展名（按 file_name）
-    allowed_ext = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}
-    ext = os.path.splitext(getattr(file_obj, "file_name", "") or "")[1].lower()
-    if ext not in allowed_ext:
-        raise Http404("不支持预览的文件类型")
 
-    content_type, _ = mimetypes.guess_type(file_obj.file_name)
-    content_type = content_type or "application/octet-stream"
+@login_required
+def patient_file_tiles_dzi(request, file_type, file_id):
+    """
+    大图 Deep Zoom 描述文件（.dzi）。权限检查与 patient_file_preview 相同；
+    未开启瓦片或瓦片尚未生成时返回 404，前端回退为普通预览。
+    """
+    forbidden = require_file_viewer(request)
+    if forbidden:
+        return forbidden
+    if not PATIENT_IMAGE_TILES_ENABLED:
+        raise Http404("未开启瓦片预览")
+
+    file_obj, file_path = get_preview_image_or_404(file_type, file_id)
+    dzi_path, _ = get_patient_file_tile_paths(file_path, file_obj.hash_code)
+    if not os.path.exists(dzi_path):
+        raise Http404("瓦片尚未生成")
+
+    resp = FileResponse(open(dzi_path, "rb"), content_type="application/xml")
+    resp["Cache-Control"] = "private, max-age=604800"
+    return resp
+
 
-    resp = FileResponse(open(file_path, "rb"), content_type=content_type)
-    resp["Content-Disposition"] = f'inline; filename="{smart_str(file_obj.file_name)}"'
+@login_required
+def patient_file_tile(request, file_type, file_id, level, col, row):
+    """
+    单个瓦片：<file_id>_files/<level>/<col>_<row>.jpg，查看器只请求可见区域的瓦片。
+    """
+    forbidden = require_file_viewer(request)
+    if forbidden:
+        return forbidden
+    if not PATIENT_IMAGE_TILES_ENABLED:
+        raise Http404("未开启瓦片预览")
+
+    file_obj, file_path = get_preview_image_or_404(file_type, file_id)
+    _, tiles_root = get_patient_file_tile_paths(file_path, file_obj.hash_code)
+    tile_path = os.path.join(tiles_root, str(level), f"{col}_{row}.jpg")
+    if not os.path.exists(tile_path):
+        raise Http404("瓦片不存在")
+
+    resp = FileResponse(open(tile_path, "rb"), content_type="image/jpeg")
+    # 瓦片按内容 hash 存放，内容不会变化，允许浏览器缓存
+    resp["Cache-Control"] = "private, max-age=604800"
     return resp
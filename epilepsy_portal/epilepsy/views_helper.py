@@ -1,17 +1,35 @@
 # epilepsy/views_helper.py
 
 import os
+import io
 import csv
+import gzip
+import json
 import shutil
+import datetime
 import hashlib
+import mimetypes
 import psutil
 import zipfile
 import tempfile
+import time
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait
+from functools import lru_cache
 from pathlib import Path
 
 from django.conf import settings
-from django.http import HttpResponseForbidden
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.http import HttpResponseForbidden, Http404
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
 from django.shortcuts import get_object_or_404
+from django.template.loader import render_to_string
+from django.utils import timezone
+from django.utils.datastructures import MultiValueDict
+from django.utils.safestring import mark_safe
+from django import forms
+from django.forms.utils import pretty_name
 
 from docx import Document
 from reportlab.lib.pagesizes import A4
@@ -24,25 +42,8 @@ from .models import (
     PatientInfoFile, UserRole,
 )
 
-# 这些字段是“逗号分隔存储”的多选 code，需要手动翻译成中文
-MULTI_CHOICE_MAP = {
-    "past_medical_history": dict(Patient.PAST_MEDICAL_HISTORY_CHOICES),
-    "other_medical_history": dict(Patient.OTHER_MEDICAL_HISTORY_CHOICES),
-    "eeg_interictal_state": dict(Patient.EEG_INTERICTAL_STATE_CHOICES),
-    "eeg_interictal_location": dict(Patient.EEG_INTERICTAL_LOCATION_CHOICES),
-    "eeg_interictal_morph": dict(Patient.EEG_INTERICTAL_MORPH_CHOICES),
-    "eeg_interictal_amount": dict(Patient.EEG_INTERICTAL_AMOUNT_CHOICES),
-    "eeg_interictal_pattern": dict(Patient.EEG_INTERICTAL_PATTERN_CHOICES),
-    "eeg_interictal_eye_relation": dict(Patient.EEG_INTERICTAL_EYE_RELATED_CHOICES),
-    "eeg_ictal_state": dict(Patient.EEG_INTERICTAL_STATE_CHOICES),
-    "eeg_ictal_location": dict(Patient.EEG_INTERICTAL_LOCATION_CHOICES),
-    "eeg_onset_pattern": dict(Patient.EEG_ONSET_PATTERN_CHOICES),
-    "seeg_ictal_morph": dict(Patient.EEG_INTERICTAL_MORPH_CHOICES),
-    "seeg_ictal_amount": dict(Patient.EEG_INTERICTAL_AMOUNT_CHOICES),
-    "seeg_ictal_pattern": dict(Patient.EEG_INTERICTAL_PATTERN_CHOICES),
-    "seeg_ictal_onset_pattern": dict(Patient.SEEG_ICTAL_ONSET_PATTERN_CHOICES),
-
-}
+# 多选字段的选项表与统一翻译器见 labels.py；这里保留 MULTI_CHOICE_MAP 的导入以兼容旧引用
+from .labels import MULTI_CHOICE_MAP, MULTI_LABEL_SEPARATOR, get_label_translator, split_codes
 
 # =======================
 #  Dashboard 配置 & 计算
@@ -134,6 +135,16 @@ def require_admin(request):
     return None
 
 
+def require_file_viewer(request):
+    """
+    ADMIN / STAFF / GUEST 可以在线查看患者文件（预览图、缩略图、瓦片），否则返回 HttpResponseForbidden。
+    """
+    profile = getattr(request.user, "profile", None)
+    if not profile or profile.role not in [UserRole.ADMIN, UserRole.STAFF, UserRole.GUEST]:
+        return HttpResponseForbidden("无权限查看")
+    return None
+
+
 def _get_field_choice_map(obj, field_name: str):
     """Return a {code: label} mapping for a model field's choices, if any.
 
@@ -164,9 +175,9 @@ def _get_field_choice_map(obj, field_name: str):
 
 def get_display_value(obj, field_name):
     """
+    0) Patient 上有 choices 的字段（含逗号分隔多选）：走预编译的翻译器（labels.py）
     1) Django 原生 choices（单选）：优先 get_xxx_display()
     2) choices + 多选值（逗号分隔字符串 / list / tuple / set）：自动用 choices 翻译
-       - 兼容旧逻辑：如在 MULTI_CHOICE_MAP 中，优先使用手工映射
     3) ManyToMany（或类似 manager）：展示为 '，' 连接的对象字符串
     4) 其它字段：原样返回
     """
@@ -174,6 +185,14 @@ def get_display_value(obj, field_name):
     if value in (None, "", [], {}):
         return ""
 
+    # 0) Patient：每个字段的查表在进程内只编译一次
+    translator = get_label_translator()
+    if isinstance(obj, translator.model):
+        if translator.table(field_name) is not None:
+            return translator.label(field_name, value)
+        if not hasattr(value, "all"):
+            return value
+
     # 1) Django 原生 choices（单选）
     method_name = f"get_{field_name}_display"
     if hasattr(obj, method_name):
@@ -195,21 +214,12 @@ def get_display_value(obj, field_name):
             pass
 
     # 2) choices 多选（checkbox / 多选下拉等）
-    mapping = MULTI_CHOICE_MAP.get(field_name) or _get_field_choice_map(obj, field_name)
+    mapping = _get_field_choice_map(obj, field_name)
     if mapping:
-        # 逗号分隔字符串，例如 "A,B,C"
-        if isinstance(value, str):
-            codes = [v.strip() for v in value.split(",") if v.strip()]
-            if len(codes) > 1:
-                labels = [mapping.get(code, code) for code in codes]
-                return "，".join(labels)
-            if len(codes) == 1:
-                return mapping.get(codes[0], codes[0])
-
-        # list/tuple/set，例如 ["A", "B"]
-        if isinstance(value, (list, tuple, set)):
-            labels = [mapping.get(str(code), str(code)) for code in value]
-            return "，".join(labels)
+        if isinstance(value, (str, list, tuple, set)):
+            codes = split_codes(value)
+            if codes:
+                return "，".join(mapping.get(code, code) for code in codes)
 
         # 单值兜底
         return mapping.get(value, value)
@@ -290,6 +300,351 @@ def build_patient_sections(patient: Patient):
     return sections
 
 
+# =======================
+#  详情页只读视图模型
+# =======================
+
+# 详情页各折叠卡片：(分区 key, 卡片 id 后缀, 标题, 字段)。分区 key 与 PATIENT_GROUP_FIELDS 一致，
+# 也是 ?section= 的取值。字段顺序与原表单页一致，
+# 与 PATIENT_SECTION_FIELDS（导出用）略有差异：详情页带上了先兆补充说明，不展示文件链接类字段。
+PATIENT_DETAIL_SECTIONS = [
+    ("basic", "Basic", "一、基本信息", [
+        "name", "gender", "handedness", "birthday", "department", "bed_number",
+        "medical_record_number", "admission_date", "education_level", "occupation",
+        "imaging_number", "admission_diagnosis",
+    ]),
+    ("history", "History", "二、病史", [
+        "first_seizure_age", "first_seizure_description", "past_medical_history",
+        "past_medical_history_other_text", "family_history", "medication_history",
+    ]),
+    ("semiology", "Semiology", "三、发作症状学", [
+        "seizure_state", "aura", "aura_text", "minor_initial_symptom",
+        "seizure_duration_seconds", "seizure_freq_per_day", "major_aura", "major_aura_text",
+        "initial_seizure_symptom", "evolution_symptom", "postictal_state",
+        "major_duration", "major_frequency",
+    ]),
+    ("neuro", "Neuro", "四、神经系统检查", ["neuro_exam", "neuro_exam_description"]),
+    ("cognitive", "Cognitive", "五、认知和精神量表", [
+        "assessment_done", "moca_score", "mmse_score", "hama_score", "hamd_score",
+        "bai_score", "bdi_score", "epilepsy_scale_score",
+    ]),
+    ("eeg", "EEG", "六、视频头皮 EEG 检查", [
+        "eeg_recording_electrodes", "eeg_recording_duration_days", "eeg_bg_occipital_rhythm",
+        "eeg_eye_response", "eeg_symmetry", "eeg_awake_background", "eeg_hv_result",
+        "eeg_hv_slow_wave_build", "eeg_hv_slow_wave_frequency", "eeg_hv_slow_wave_symmetry",
+        "eeg_hv_epileptiform_discharge", "eeg_hv_discharge_laterality", "ips_result",
+        "frequency", "laterality", "eeg_sleep_period_overall", "eeg_sleep_vertex_wave",
+        "eeg_sleep_k_complex", "eeg_sleep_spindle", "eeg_interictal_state",
+        "eeg_interictal_location", "eeg_interictal_focal_lobe", "eeg_interictal_laterality",
+        "eeg_interictal_morph", "eeg_interictal_amount", "eeg_interictal_pattern",
+        "eeg_interictal_eye_relation", "eeg_ictal_state", "eeg_ictal_location",
+        "eeg_onset_pattern", "eeg_interictal", "eeg_ictal_precede_clinical_sec",
+        "eeg_ictal_amount", "eeg_clinical_correlation",
+    ]),
+    ("imaging", "Imaging", "七、影像学检查", ["mri_brief", "pet_brief"]),
+    ("first_stage", "FirstStage", "八、一期无创性评估结果", [
+        "first_stage_lateralization", "first_stage_region", "first_stage_location",
+    ]),
+    ("seeg", "SEEG", "九、SEEG 发作间期及发作期放电", [
+        "seeg_record_channel_count", "seeg_electrode_count", "seeg_electrode_coverage",
+        "seeg_record_duration_days", "seeg_ictal_morph", "seeg_ictal_amount",
+        "seeg_ictal_pattern", "seeg_primary_discharge_zone", "seeg_secondary_discharge_zone",
+        "seeg_other_discharge_zone", "seeg_ictal_onset_zone", "seeg_ictal_spread_zone_sequence",
+        "seeg_ictal_onset_pattern", "seeg_interictal_overall", "seeg_ictal_precede_clinical_sec",
+        "eeg_ictal_amount", "seeg_ictal",
+    ]),
+    ("second_stage", "SecondStage", "十、二期有创性评估结果", [
+        "second_stage_core_zone", "second_stage_hypothesis_zone",
+    ]),
+    ("resection", "Resection", "十一、外科切除计划", ["resection_plan_convex", "resection_plan_concave"]),
+    ("evaluation", "Evaluation", "十二、评估信息", ["evaluator", "evaluation_date"]),
+]
+
+
+@lru_cache(maxsize=None)
+def get_patient_detail_field_specs():
+    """
+    从 PatientForm 的类级字段定义取一次详情页字段的显示名（不实例化表单）：{field_name: label}。
+    code -> 中文统一走 get_label_translator()，与导出 / 模板过滤器一致。
+    """
+    from .forms import PatientForm
+
+    specs = {}
+    for _slug, _key, _title, field_names in PATIENT_DETAIL_SECTIONS:
+        for name in field_names:
+            field = PatientForm.base_fields.get(name)
+            if field is None:
+                specs[name] = name
+                continue
+            specs[name] = str(field.label if field.label is not None else pretty_name(name))
+    return specs
+
+
+def _build_patient_detail_fields(patient, field_names, specs, translator):
+    fields = []
+    for name in field_names:
+        raw = getattr(patient, name, None)
+        value, badges = raw, None
+        if translator.table(name) is not None:
+            if raw in (None, ""):
+                value = None
+            elif name in translator.multi_fields:
+                # 未知 code 原样显示
+                badges = translator.labels(name, raw)
+                value = None
+            else:
+                value = translator.label(name, raw)
+        fields.append({"name": name, "label": specs[name], "value": value, "badges": badges})
+    return fields
+
+
+def build_patient_detail(patient: Patient, slugs=None):
+    """
+    详情页的只读视图模型，替代 PatientForm(instance=patient)：
+    返回 [{"slug", "key", "label", "expanded", "fields": [{"name", "label", "value", "badges"}, ...]}, ...]
+    - 单选字段：value 为翻译后的中文，未知 code 原样显示
+    - 多选字段：badges 为翻译后的中文列表（按存储顺序，未知 code 原样显示），value 为 None
+    - 其他字段：value 为模型原值（日期等交给模板本地化显示）
+    slugs 不为空时只构造这些分区。
+    """
+    specs = get_patient_detail_field_specs()
+    translator = get_label_translator()
+    sections = []
+    for index, (slug, key, title, field_names) in enumerate(PATIENT_DETAIL_SECTIONS):
+        if slugs is not None and slug not in slugs:
+            continue
+        sections.append({
+            "slug": slug,
+            "key": key,
+            "label": title,
+            "expanded": index == 0,
+            "fields": _build_patient_detail_fields(patient, field_names, specs, translator),
+        })
+    return sections
+
+
+# 详情面板分片加载：先返回标题 + 折叠卡片外壳（默认展开的分区直接带上内容），
+# 其余分区和文件预览在展开时通过 ?section=<key> 请求
+PATIENT_DETAIL_PREVIEW_SECTION = "preview"
+PATIENT_DETAIL_SECTION_SLUGS = {slug for slug, _key, _title, _fields in PATIENT_DETAIL_SECTIONS}
+
+# 分区片段缓存时间（秒）；key 里带 updated_at，患者一保存旧片段自然失效
+PATIENT_DETAIL_FRAGMENT_CACHE_TIMEOUT = getattr(settings, "PATIENT_DETAIL_FRAGMENT_CACHE_TIMEOUT", 24 * 3600)
+
+# 列表行 / 详情外壳（{% cache %} 模板片段）的缓存时间（秒）。
+# 行里的“下载管理”取决于文件和旧数据集，文件增删会刷新 updated_at，旧数据集变更靠过期兜底
+PATIENT_FRAGMENT_CACHE_TIMEOUT = getattr(settings, "PATIENT_FRAGMENT_CACHE_TIMEOUT", 3600)
+
+# HTML 片段统一放在 settings.CACHES["fragments"]（带命中率统计，见 epilepsy/fragment_cache.py）
+PATIENT_FRAGMENT_CACHE_ALIAS = "fragments"
+
+
+def get_viewer_role(request):
+    """片段缓存 key 里的“查看者角色”：同一患者的行 / 面板对 GUEST 和 ADMIN/STAFF 渲染不同。"""
+    if not request.user.is_authenticated:
+        return "anonymous"
+    profile = getattr(request.user, "profile", None)
+    return profile.role if profile else ""
+
+
+def get_patient_detail_fragment_cache_key(patient, slug):
+    version = patient.updated_at.timestamp() if patient.updated_at else 0
+    return f"epilepsy:patient-detail:{patient.pk}:{version}:{slug}"
+
+
+def render_patient_detail_section(patient, slug):
+    """
+    渲染单个字段分区的 HTML 片段，按 (患者, updated_at, 分区) 缓存。
+    未知分区抛 Http404。
+    """
+    if slug not in PATIENT_DETAIL_SECTION_SLUGS:
+        raise Http404("未知分区")
+
+    fragment_cache = caches[PATIENT_FRAGMENT_CACHE_ALIAS]
+    key = get_patient_detail_fragment_cache_key(patient, slug)
+    html = fragment_cache.get(key)
+    if html is None:
+        section = build_patient_detail(patient, slugs={slug})[0]
+        html = render_to_string("epilepsy/patient_detail_section.html", {"section": section})
+        fragment_cache.set(key, str(html), PATIENT_DETAIL_FRAGMENT_CACHE_TIMEOUT)
+    return mark_safe(html)
+
+
+def build_patient_detail_outline(patient):
+    """
+    详情面板外壳：每个分区只带 slug / key / 标题 / 是否展开，
+    默认展开的分区附带渲染好的 html，其余分区 html 为 None（前端展开时再取）。
+    """
+    outline = []
+    for index, (slug, key, title, _fields) in enumerate(PATIENT_DETAIL_SECTIONS):
+        expanded = index == 0
+        outline.append({
+            "slug": slug,
+            "key": key,
+            "label": title,
+            "expanded": expanded,
+            "html": render_patient_detail_section(patient, slug) if expanded else None,
+        })
+    return outline
+
+
+# 患者对象读穿缓存：详情 / 文件面板 / 导出 / 数据列表之间来回切换时，同一患者的整行不重复查库。
+# 缓存的是按字段顺序序列化的一行（不是 pickle 的模型对象），命中后用 Patient.from_db 还原。
+# key 带字段列表的版本号，模型加减字段后旧缓存自动作废；保存 / 删除由 signals 清除，
+# queryset.update() 不发信号，直接 update 患者行的地方需要手动调用 invalidate_patient_object_cache。
+# 清除不是删 key，而是把该患者的代数（epilepsy:patient-gen:<pk>）加一，代数是 key 的一部分：
+# 读者先取代数再查库，查库期间发生的清除会让它写进旧代数的 key，之后没人再读到这份旧行。
+# 清除只对共享缓存有效：fragments 是 LocMem（未配置 FRAGMENT_CACHE_DIR）时，别的 worker 清不到，
+# 这时不启用，每次都查库。编辑表单永远从数据库取，不用这个缓存。
+# 命中率和 HTML 片段一起由 manage.py fragment_cache_stats 统计（epilepsy:patient-object）。
+PATIENT_OBJECT_CACHE_TIMEOUT = getattr(settings, "PATIENT_OBJECT_CACHE_TIMEOUT", 300)
+PATIENT_OBJECT_FIELDS = [field.attname for field in Patient._meta.concrete_fields]
+PATIENT_OBJECT_CACHE_VERSION = hashlib.md5(",".join(PATIENT_OBJECT_FIELDS).encode("utf-8")).hexdigest()[:8]
+
+
+def get_patient_object_cache():
+    """患者对象缓存；fragments 是进程内缓存（LocMem）时返回 None（不启用）。"""
+    object_cache = caches[PATIENT_FRAGMENT_CACHE_ALIAS]
+    if isinstance(object_cache, LocMemCache):
+        return None
+    return object_cache
+
+
+def _patient_generation_key(pk):
+    return f"epilepsy:patient-gen:{pk}"
+
+
+def _patient_generation(object_cache, pk):
+    generation = object_cache.get(_patient_generation_key(pk))
+    if generation is None:
+        generation = 0
+        object_cache.add(_patient_generation_key(pk), generation, None)
+    return generation
+
+
+def get_patient_object_cache_key(pk, generation):
+    return f"epilepsy:patient-object:{pk}:{generation}:{PATIENT_OBJECT_CACHE_VERSION}"
+
+
+def get_patient_or_404(pk):
+    """按 pk 取患者（启用缓存时先查缓存），不存在抛 Http404。"""
+    object_cache = get_patient_object_cache()
+    if object_cache is None:
+        return get_object_or_404(Patient, pk=pk)
+
+    # 代数必须在查库之前取
+    key = get_patient_object_cache_key(pk, _patient_generation(object_cache, pk))
+    row = object_cache.get(key)
+    if row is not None:
+        return Patient.from_db(DEFAULT_DB_ALIAS, PATIENT_OBJECT_FIELDS, row)
+
+    patient = get_object_or_404(Patient, pk=pk)
+    object_cache.set(
+        key,
+        tuple(getattr(patient, name) for name in PATIENT_OBJECT_FIELDS),
+        PATIENT_OBJECT_CACHE_TIMEOUT,
+    )
+    return patient
+
+
+def invalidate_patient_object_cache(pk):
+    object_cache = get_patient_object_cache()
+    if object_cache is None:
+        return
+    try:
+        object_cache.incr(_patient_generation_key(pk))
+    except ValueError:
+        object_cache.set(_patient_generation_key(pk), 1, None)
+
+
+# =======================
+#  分区保存（只校验 / 只写入一个分区的字段）
+# =======================
+
+# 文件上传 / 删除相关的表单项；请求里没有这些内容时不进入 handle_patient_file_uploads
+PATIENT_FILE_INPUT_NAMES = ("mri_files", "pet_files", "eeg_files", "seeg_files")
+PATIENT_FILE_DELETE_FIELDS = (
+    "delete_mri_file_ids", "delete_pet_file_ids", "delete_eeg_file_ids", "delete_seeg_file_ids",
+)
+
+
+def has_patient_file_changes(request, data=None):
+    """请求里是否带了要上传 / 删除的文件。"""
+    data = request.POST if data is None else data
+    if any(request.FILES.getlist(name) for name in PATIENT_FILE_INPUT_NAMES):
+        return True
+    return any((data.get(name) or "").strip() for name in PATIENT_FILE_DELETE_FIELDS)
+
+
+@lru_cache(maxsize=None)
+def get_patient_section_form_class(slug):
+    """
+    只包含某个分区字段的 PatientForm 子类（按分区缓存）。
+    分区字段 = PATIENT_GROUP_FIELDS 的字段 + 详情页同分区的补充字段（如先兆说明），且必须是表单字段。
+    PatientForm 的 clean_<field> / clean() 只作用于存在的字段，未提交分区的字段不会被校验或写入。
+    未知分区返回 None。
+    """
+    from .forms import PatientForm
+
+    if slug not in PATIENT_GROUP_FIELDS:
+        return None
+    names = list(PATIENT_GROUP_FIELDS[slug]["fields"])
+    for detail_slug, _key, _title, field_names in PATIENT_DETAIL_SECTIONS:
+        if detail_slug == slug:
+            names += [name for name in field_names if name not in names]
+
+    form_class = type(f"PatientSectionForm_{slug}", (PatientForm,), {})
+    form_class.base_fields = {
+        name: field for name, field in PatientForm.base_fields.items() if name in names
+    }
+    return form_class
+
+
+def _is_field_submitted(form, name, data):
+    """请求里是否带了这个字段。复选框类控件没勾选时不提交键（value_omitted_from_data 恒为 False），只看键是否存在。"""
+    key = form.add_prefix(name)
+    if key in data:
+        return True
+    widget = form.fields[name].widget
+    if isinstance(widget, (forms.CheckboxInput, forms.CheckboxSelectMultiple)):
+        return False
+    return not widget.value_omitted_from_data(data, {}, key)
+
+
+def save_patient_section(patient, slug, data):
+    """
+    校验并保存一个分区里“请求中提交了的”字段（部分更新）。返回 (form, 实际写入的字段列表)；
+    form 无效时写入字段为 None。没有字段变化时不写库（返回空列表）。
+    - 未提交的字段不校验、保持原值（只改一个字段时不用带上整个分区，必填字段也不会报缺失）
+    - 多选字段提交空值（field=）表示清空
+    - 只 UPDATE 变化的列（update_fields），不重写整行
+    """
+    form_class = get_patient_section_form_class(slug)
+    if form_class is None:
+        raise Http404("未知分区")
+
+    data = data.copy()
+    form = form_class(data, instance=patient)
+    for name in list(form.fields):
+        if not _is_field_submitted(form, name, data):
+            del form.fields[name]
+        elif isinstance(form.fields[name], forms.MultipleChoiceField):
+            key = form.add_prefix(name)
+            if not any(data.getlist(key)):
+                data.setlist(key, [])
+
+    if not form.is_valid():
+        return form, None
+
+    changed = [name for name in form.changed_data if name in form.fields]
+    if not changed:
+        return form, []
+
+    patient = form.save(commit=False)
+    patient.save(update_fields=changed + ["updated_at"])
+    return form, changed
+
+
 # =======================
 #  文件上传 / 下载辅助
 # =======================
@@ -299,6 +654,7 @@ def handle_patient_file_uploads(request, patient):
     统一处理 MRI / PET / EEG / SEEG 文件的上传和删除。
     """
     base_dir = getattr(settings, "LARGE_FILE_BASE_DIR", settings.BASE_DIR / "large_files")
+    changed = False
 
     config = {
         "mri": {
@@ -331,6 +687,7 @@ def handle_patient_file_uploads(request, patient):
         # 删除旧记录
         delete_ids_raw = request.POST.get(delete_field, "").strip()
         if delete_ids_raw:
+            changed = True
             ids = [i for i in delete_ids_raw.split(",") if i]
             for file_obj in model_cls.objects.filter(id__in=ids, patient=patient):
                 file_path = os.path.join(
@@ -343,12 +700,17 @@ def handle_patient_file_uploads(request, patient):
                         os.remove(file_path)
                     except OSError:
                         pass
+                remove_patient_file_derivatives(
+                    os.path.join(base_dir, file_obj.parent_path),
+                    file_obj.hash_code,
+                )
                 file_obj.delete()
 
         # 新上传文件（支持普通文件 + zip）
         uploads = request.FILES.getlist(input_name)
         if not uploads:
             continue
+        changed = True
 
         parent_path = f"{file_type}/{patient.id}"
         abs_dir = os.path.join(base_dir, parent_path)
@@ -361,12 +723,14 @@ def handle_patient_file_uploads(request, patient):
             """
             md5 = hashlib.md5()
             sha256 = hashlib.sha256()
+            size_bytes = 0
 
-            # 读入并计算 hash
+            # 读入并计算 hash（顺带统计大小）
             with open(src_path, "rb") as rf:
                 for chunk in iter(lambda: rf.read(1024 * 1024), b""):
                     md5.update(chunk)
                     sha256.update(chunk)
+                    size_bytes += len(chunk)
 
             hash_code = md5.hexdigest()
             sha256_code = sha256.hexdigest()
@@ -379,14 +743,18 @@ def handle_patient_file_uploads(request, patient):
             # 直接移动/覆盖（同 hash 会覆盖为相同内容）
             os.replace(src_path, final_path)
 
-            model_cls.objects.create(
+            file_obj = model_cls.objects.create(
                 patient=patient,
                 parent_path=parent_path,
                 file_name=display_name,
                 hash_code=hash_code,
                 sha256_code=sha256_code,
+                size_bytes=size_bytes,
             )
 
+            # 大图（可选）：后台生成 DZI 瓦片
+            schedule_patient_file_tiles(file_obj, final_path)
+
         def _safe_extract_zip(zip_path: str, extract_dir: str):
             """
             防 Zip Slip：确保解压后的文件路径都在 extract_dir 内。
@@ -457,6 +825,13 @@ def handle_patient_file_uploads(request, patient):
                 except OSError:
                     pass
 
+    # 文件写完后再刷新一次 updated_at：form.save() 早于上传完成，
+    # 按 updated_at 做版本的片段缓存（列表行的“下载管理”等）需要在文件变化后失效
+    if changed:
+        patient.updated_at = timezone.now()
+        Patient.objects.filter(pk=patient.pk).update(updated_at=patient.updated_at)
+        invalidate_patient_object_cache(patient.pk)
+
 def build_patient_file_path(model_cls, file_id):
     """
     公共的“根据模型和 id 找到物理文件路径”的逻辑。
@@ -467,50 +842,456 @@ def build_patient_file_path(model_cls, file_id):
     return file_obj, file_path
 
 
+def open_patient_file_or_404(file_path):
+    """直接打开物理文件（不先 os.path.exists 再打开），不存在时抛 Http404。"""
+    try:
+        return open(file_path, "rb")
+    except (FileNotFoundError, IsADirectoryError):
+        raise Http404("文件不存在")
+
+
+# 回填 size_bytes 时每批写库的行数 / 默认并发 stat 数（存储多为网络盘，stat 延迟高，用线程并发）
+FILE_METADATA_BATCH_SIZE = 1000
+FILE_METADATA_WORKERS = getattr(settings, "FILE_METADATA_WORKERS", 16)
+
+
+def backfill_patient_file_metadata(model_cls, all_rows=False, max_workers=None, batch_size=FILE_METADATA_BATCH_SIZE):
+    """
+    给已有文件记录补 size_bytes（并发 stat 物理文件），顺带补空的 file_ext / media_type（按 file_name）。
+    默认只处理 size_bytes 为 0 的记录，all_rows=True 时全部重新 stat。
+    queryset 写库不发信号，调用方需要对返回的 patient_ids 重算文件统计（reconcile_file_counters）。
+    返回统计 checked / updated / missing / patient_ids
+    """
+    base_dir = getattr(settings, "LARGE_FILE_BASE_DIR", settings.BASE_DIR / "large_files")
+    max_workers = max_workers or FILE_METADATA_WORKERS
+
+    qs = model_cls.objects.only(
+        "id", "patient_id", "parent_path", "save_name", "file_name", "file_ext", "media_type", "size_bytes"
+    ).order_by("id")
+    if not all_rows:
+        qs = qs.filter(size_bytes=0)
+
+    stats = {"checked": 0, "updated": 0, "missing": 0, "patient_ids": set()}
+
+    def stat_one(file_obj):
+        try:
+            return os.stat(os.path.join(base_dir, file_obj.parent_path, file_obj.save_name)).st_size
+        except OSError:
+            return None
+
+    def process(batch):
+        changed = []
+        for file_obj, size in zip(batch, executor.map(stat_one, batch)):
+            stats["checked"] += 1
+            if size is None:
+                stats["missing"] += 1
+                continue
+            ext = os.path.splitext(file_obj.file_name or "")[1].lower()
+            values = {
+                "size_bytes": size,
+                "file_ext": file_obj.file_ext or ext,
+                "media_type": file_obj.media_type or mimetypes.guess_type(file_obj.file_name or "")[0] or "",
+            }
+            if any(getattr(file_obj, k) != v for k, v in values.items()):
+                for k, v in values.items():
+                    setattr(file_obj, k, v)
+                changed.append(file_obj)
+                stats["patient_ids"].add(file_obj.patient_id)
+        model_cls.objects.bulk_update(changed, ["size_bytes", "file_ext", "media_type"])
+        stats["updated"] += len(changed)
+
+    # 按 id 分页（边读边写，不用 iterator 的长游标）
+    last_id = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            batch = list(qs.filter(id__gt=last_id)[:batch_size])
+            if not batch:
+                break
+            process(batch)
+            last_id = batch[-1].pk
+    return stats
+
+
+def remove_patient_file_derivatives(abs_dir, hash_code):
+    """
+    删除某个文件的派生文件（缩略图、瓦片金字塔等），在删除原文件时一并调用。
+    """
+    thumb_dir = os.path.join(abs_dir, THUMBNAIL_DIR_NAME)
+    for size in PREVIEW_THUMBNAIL_SIZES:
+        for ext in (".webp", ".jpg"):
+            path = os.path.join(thumb_dir, f"{hash_code}_{size}{ext}")
+            if os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    tile_dir = os.path.join(abs_dir, TILE_DIR_NAME)
+    dzi_path = os.path.join(tile_dir, f"{hash_code}.dzi")
+    if os.path.exists(dzi_path):
+        try:
+            os.remove(dzi_path)
+        except OSError:
+            pass
+    shutil.rmtree(os.path.join(tile_dir, f"{hash_code}_files"), ignore_errors=True)
+
+
 # =======================
-#  导出辅助
+#  图片预览 / 缩略图
 # =======================
 
-def generate_patient_info_file(patient, fmt: str):
+# 允许在线预览的图片扩展名（按 file_name 判断）
+PREVIEW_IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp"}
+
+# 预览接口允许的缩略图尺寸（长边像素），详情页画廊用 256，大图用 1024
+PREVIEW_THUMBNAIL_SIZES = (256, 1024)
+
+# 缩略图缓存目录：与原文件同目录下的子目录，文件名 = hash_code + "_" + size
+THUMBNAIL_DIR_NAME = "thumbs"
+
+# 详情页画廊每页图片数
+PATIENT_GALLERY_PAGE_SIZE = getattr(settings, "PATIENT_GALLERY_PAGE_SIZE", 24)
+
+# file_type -> 文件模型，预览 / 瓦片接口使用
+PATIENT_FILE_MODELS = {"mri": MRIFile, "pet": PETFile, "eeg": EEGFile, "seeg": SEEGFile}
+
+# file_type -> (related_name, 显示名)，与 patient_file_preview 的 file_type 保持一致
+PATIENT_GALLERY_TYPES = {
+    "mri": ("mri_files", "MRI"),
+    "pet": ("pet_files", "PET"),
+    "eeg": ("eeg_files", "EEG"),
+    "seeg": ("seeg_files", "sEEG"),
+}
+
+
+def build_patient_gallery(patient, file_type, page=1, page_size=None):
     """
-    生成患者信息文件并写入 PatientInfoFile 表。
-    返回 (final_path, download_filename, fmt_enum)
+    取某个模态的一页图片文件：扩展名过滤与分页都在数据库完成（file_ext 有索引）。
+    多取一条用于判断是否还有下一页，每个模态每页只有一条查询。
+    返回 dict：file_type / label / items / page / has_more / next_page
     """
-    fmt = fmt.lower()
-    if fmt == "csv":
-        fmt_enum = PatientInfoFile.Format.CSV
-        ext = "csv"
-    elif fmt == "word":
-        fmt_enum = PatientInfoFile.Format.WORD
-        ext = "docx"
-    elif fmt == "pdf":
-        fmt_enum = PatientInfoFile.Format.PDF
-        ext = "pdf"
+    related_name, label = PATIENT_GALLERY_TYPES[file_type]
+    page_size = page_size or PATIENT_GALLERY_PAGE_SIZE
+    page = max(int(page or 1), 1)
+    offset = (page - 1) * page_size
+
+    qs = (
+        getattr(patient, related_name)
+        .filter(file_ext__in=PREVIEW_IMAGE_EXTS)
+        .only("id", "patient_id", "file_name", "hash_code", "created_at")
+        .order_by("-created_at", "-id")
+    )
+    rows = list(qs[offset:offset + page_size + 1])
+    has_more = len(rows) > page_size
+
+    return {
+        "file_type": file_type,
+        "label": label,
+        "items": rows[:page_size],
+        "page": page,
+        "has_more": has_more,
+        "next_page": page + 1 if has_more else None,
+    }
+
+
+def build_patient_file_thumbnail(file_obj, file_path, size):
+    """
+    按需生成缩略图并缓存到磁盘：<原文件目录>/thumbs/<hash_code>_<size>.webp
+    （Pillow 不支持 WebP 时退化为 .jpg）。
+
+    - 同一 hash 的文件内容相同，缓存命中后直接返回，不再解码原图
+    - 需要安装 Pillow：pip install Pillow；未安装或原图无法解码时返回 (None, None)，
+      由调用方回退为返回原图
+    返回 (thumb_path, content_type)
+    """
+    if size not in PREVIEW_THUMBNAIL_SIZES:
+        raise ValueError(f"不支持的缩略图尺寸: {size}")
+
+    try:
+        from PIL import Image, ImageOps, features
+    except ImportError:
+        return None, None
+
+    if features.check("webp"):
+        ext, pil_format, content_type = ".webp", "WEBP", "image/webp"
     else:
-        raise ValueError("未知导出格式")
+        ext, pil_format, content_type = ".jpg", "JPEG", "image/jpeg"
 
-    base_dir = getattr(settings, "LARGE_FILE_BASE_DIR", settings.BASE_DIR / "large_files")
-    parent_path = f"info/{patient.id}"
-    abs_dir = os.path.join(base_dir, parent_path)
-    os.makedirs(abs_dir, exist_ok=True)
+    thumb_dir = os.path.join(os.path.dirname(file_path), THUMBNAIL_DIR_NAME)
+    thumb_path = os.path.join(thumb_dir, f"{file_obj.hash_code}_{size}{ext}")
+    if os.path.exists(thumb_path):
+        return thumb_path, content_type
 
-    # 删除旧文件
-    old_qs = PatientInfoFile.objects.filter(patient=patient, format=fmt_enum)
-    for old in old_qs:
-        old_path = os.path.join(base_dir, old.parent_path, old.save_name)
-        if os.path.exists(old_path):
+    os.makedirs(thumb_dir, exist_ok=True)
+    try:
+        with Image.open(file_path) as img:
+            # JPEG 可以在解码阶段直接按比例缩小，大图时省掉大部分解码开销
+            img.draft("RGB", (size, size))
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((size, size), Image.LANCZOS)
+
+            if pil_format == "JPEG" or img.mode not in ("RGB", "RGBA"):
+                has_alpha = img.mode in ("RGBA", "LA", "PA") or "transparency" in img.info
+                img = img.convert("RGBA" if has_alpha and pil_format == "WEBP" else "RGB")
+
+            # 先写临时文件再原子替换，避免并发请求读到写了一半的缩略图
+            fd, tmp_path = tempfile.mkstemp(prefix="tmp_thumb_", suffix=ext, dir=thumb_dir)
             try:
-                os.remove(old_path)
-            except OSError:
-                pass
-    old_qs.delete()
+                with os.fdopen(fd, "wb") as f:
+                    img.save(f, pil_format, quality=80)
+                os.replace(tmp_path, thumb_path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None, None
 
-    sections = build_patient_sections(patient)
-    tmp_name = f"tmp_patient_info.{ext}"
-    tmp_path = os.path.join(abs_dir, tmp_name)
+    return thumb_path, content_type
+
+
+def get_preview_image_or_404(file_type, file_id):
+    """
+    预览 / 瓦片接口共用：按 file_type + id 找到文件，要求为可预览的图片（只查库，不访问文件系统）。
+    返回 (file_obj, file_path)
+    """
+    model_cls = PATIENT_FILE_MODELS.get(file_type)
+    if model_cls is None:
+        raise Http404("未知文件类型")
 
+    file_obj, file_path = build_patient_file_path(model_cls, file_id)
+
+    # 仅允许常见图片扩展名（入库时记录的 file_ext）；物理文件是否存在由打开文件时判断
+    if file_obj.file_ext not in PREVIEW_IMAGE_EXTS:
+        raise Http404("不支持预览的文件类型")
+    return file_obj, file_path
+
+
+# =======================
+#  大图瓦片金字塔（Deep Zoom / DZI）
+# =======================
+
+# 默认关闭；开启后，像素数超过阈值的图片上传后在后台切成 256px 瓦片。
+# 页面里还没有 Deep Zoom 查看器（OpenSeadragon 未随项目提供），灯箱仍显示原图；
+# .dzi / 瓦片接口供外部查看器使用，引入查看器后在 patient_gallery_items.html 上接 data-dzi-src 即可
+PATIENT_IMAGE_TILES_ENABLED = getattr(settings, "PATIENT_IMAGE_TILES_ENABLED", False)
+PATIENT_IMAGE_TILE_MIN_PIXELS = getattr(settings, "PATIENT_IMAGE_TILE_MIN_PIXELS", 16_000_000)
+# 后台切图线程数：切图很吃内存，zip 里一次上传很多大图时也只排队处理
+PATIENT_IMAGE_TILE_WORKERS = getattr(settings, "PATIENT_IMAGE_TILE_WORKERS", 1)
+
+# 瓦片目录：与原文件同目录下的子目录，
+#   tiles/<hash_code>.dzi                         描述文件（最后写入，存在即表示瓦片已就绪）
+#   tiles/<hash_code>_files/<level>/<col>_<row>.jpg
+TILE_DIR_NAME = "tiles"
+TILE_SIZE = 256
+TILE_OVERLAP = 0
+TILE_FORMAT = "jpg"
+
+# 正在后台生成的瓦片（按目标 .dzi 路径去重），避免同一文件被重复切图
+_tile_jobs_lock = threading.Lock()
+_tile_jobs = set()
+_tile_executor = None
+
+
+def get_patient_file_tile_paths(file_path, hash_code):
+    """
+    返回 (dzi_path, tiles_root)。
+    """
+    tile_dir = os.path.join(os.path.dirname(file_path), TILE_DIR_NAME)
+    return (
+        os.path.join(tile_dir, f"{hash_code}.dzi"),
+        os.path.join(tile_dir, f"{hash_code}_files"),
+    )
+
+
+def needs_patient_file_tiles(file_path):
+    """
+    只读图片头判断尺寸，像素数达到 PATIENT_IMAGE_TILE_MIN_PIXELS 才需要切瓦片。
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return False
+
+    try:
+        with Image.open(file_path) as img:
+            width, height = img.size
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return False
+    return width * height >= PATIENT_IMAGE_TILE_MIN_PIXELS
+
+
+def build_patient_file_tiles(file_obj, file_path, force=False):
+    """
+    为大图生成 DZI 瓦片金字塔：第 max_level 层为原图尺寸，每往下一层宽高减半，直到 1x1。
+    每层切成 TILE_SIZE 的 JPEG 瓦片。
+
+    - 先写到临时目录，完成后整体 rename，再写 .dzi 描述文件；.dzi 存在即表示瓦片完整
+    - 需要安装 Pillow；未安装或原图无法解码时返回 None
+    返回 dzi_path
+    """
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None
+
+    dzi_path, tiles_root = get_patient_file_tile_paths(file_path, file_obj.hash_code)
+    if os.path.exists(dzi_path) and not force:
+        return dzi_path
+
+    tile_dir = os.path.dirname(dzi_path)
+    os.makedirs(tile_dir, exist_ok=True)
+    tmp_root = tempfile.mkdtemp(prefix=f"tmp_{file_obj.hash_code}_", dir=tile_dir)
+    try:
+        with Image.open(file_path) as src:
+            img = ImageOps.exif_transpose(src)
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            width, height = img.size
+
+            max_level = max(width, height).bit_length() - 1
+            if (1 << max_level) < max(width, height):
+                max_level += 1
+
+            level_img = img
+            for level in range(max_level, -1, -1):
+                scale = 1 << (max_level - level)
+                level_w = max(1, -(-width // scale))
+                level_h = max(1, -(-height // scale))
+                if level_img.size != (level_w, level_h):
+                    # 每层由上一层缩小得到，避免每层都从原图重新缩放
+                    level_img = level_img.resize((level_w, level_h), Image.LANCZOS)
+
+                level_dir = os.path.join(tmp_root, str(level))
+                os.makedirs(level_dir)
+                for col in range(-(-level_w // TILE_SIZE)):
+                    for row in range(-(-level_h // TILE_SIZE)):
+                        x0 = col * TILE_SIZE
+                        y0 = row * TILE_SIZE
+                        box = (
+                            max(x0 - TILE_OVERLAP, 0),
+                            max(y0 - TILE_OVERLAP, 0),
+                            min(x0 + TILE_SIZE + TILE_OVERLAP, level_w),
+                            min(y0 + TILE_SIZE + TILE_OVERLAP, level_h),
+                        )
+                        level_img.crop(box).save(
+                            os.path.join(level_dir, f"{col}_{row}.{TILE_FORMAT}"),
+                            "JPEG",
+                            quality=85,
+                        )
+
+        if os.path.exists(tiles_root):
+            shutil.rmtree(tiles_root, ignore_errors=True)
+        os.replace(tmp_root, tiles_root)
+
+        descriptor = (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            '<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" '
+            f'Format="{TILE_FORMAT}" Overlap="{TILE_OVERLAP}" TileSize="{TILE_SIZE}">\n'
+            f'  <Size Width="{width}" Height="{height}"/>\n'
+            '</Image>\n'
+        )
+        fd, tmp_dzi = tempfile.mkstemp(prefix="tmp_dzi_", suffix=".dzi", dir=tile_dir)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(descriptor)
+        os.replace(tmp_dzi, dzi_path)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    finally:
+        shutil.rmtree(tmp_root, ignore_errors=True)
+
+    return dzi_path
+
+
+def schedule_patient_file_tiles(file_obj, file_path):
+    """
+    上传完成后调用：PATIENT_IMAGE_TILES_ENABLED 开启、且是超过阈值的大图时，
+    在后台线程里切瓦片，不阻塞上传请求。已有瓦片或正在生成时直接跳过。
+    """
+    if not PATIENT_IMAGE_TILES_ENABLED:
+        return False
+    if (file_obj.file_ext or "") not in PREVIEW_IMAGE_EXTS:
+        return False
+
+    dzi_path, _ = get_patient_file_tile_paths(file_path, file_obj.hash_code)
+    if os.path.exists(dzi_path) or not needs_patient_file_tiles(file_path):
+        return False
+
+    global _tile_executor
+    with _tile_jobs_lock:
+        if dzi_path in _tile_jobs:
+            return False
+        _tile_jobs.add(dzi_path)
+        if _tile_executor is None:
+            _tile_executor = ThreadPoolExecutor(
+                max_workers=PATIENT_IMAGE_TILE_WORKERS,
+                thread_name_prefix="patient-tiles",
+            )
+
+    def _run():
+        try:
+            build_patient_file_tiles(file_obj, file_path)
+        finally:
+            with _tile_jobs_lock:
+                _tile_jobs.discard(dzi_path)
+
+    _tile_executor.submit(_run)
+    return True
+
+
+# =======================
+#  导出辅助
+# =======================
+
+# 导出内容（字段、分区、排版）有改动时加 1，已有的导出文件会在下次访问时重新生成
+PATIENT_EXPORT_VERSION = 1
+
+# fmt -> (PatientInfoFile.Format, 扩展名)
+PATIENT_EXPORT_FORMATS = {
+    "csv": (PatientInfoFile.Format.CSV, "csv"),
+    "word": (PatientInfoFile.Format.WORD, "docx"),
+    "pdf": (PatientInfoFile.Format.PDF, "pdf"),
+}
+
+
+def get_cached_patient_info_file(patient, fmt: str):
+    """
+    查找仍然有效的导出文件：生成时的 patient.updated_at 与当前一致，且导出版本相同，
+    物理文件也还在。命中返回 (final_path, download_filename, fmt_enum)，否则返回 None。
+    """
+    try:
+        fmt_enum, ext = PATIENT_EXPORT_FORMATS[fmt.lower()]
+    except KeyError:
+        raise ValueError("未知导出格式")
+
+    info_file = (
+        PatientInfoFile.objects
+        .filter(
+            patient=patient,
+            format=fmt_enum,
+            patient_updated_at=patient.updated_at,
+            export_version=PATIENT_EXPORT_VERSION,
+        )
+        .order_by("-created_at")
+        .first()
+    )
+    if info_file is None:
+        return None
+
+    base_dir = getattr(settings, "LARGE_FILE_BASE_DIR", settings.BASE_DIR / "large_files")
+    final_path = os.path.join(base_dir, info_file.parent_path, info_file.save_name)
+    if not os.path.exists(final_path):
+        return None
+    return final_path, f"{info_file.file_name}.{ext}", fmt_enum
+
+
+def render_patient_report(out_path, fmt, patient_name, medical_record_number, sections):
+    """
+    把 build_patient_sections 的结果渲染成 CSV / Word / PDF 写到 out_path。
+    只依赖传入的普通数据、不访问数据库，因此可以放到子进程里执行（见批量导出）。
+    """
     if fmt == "csv":
-        with open(tmp_path, "w", encoding="utf-8-sig", newline="") as f:
+        with open(out_path, "w", encoding="utf-8-sig", newline="") as f:
             writer = csv.writer(f)
             writer.writerow(["分区", "字段", "值"])
             for section_title, fields in sections:
@@ -542,10 +1323,10 @@ def generate_patient_info_file(patient, fmt: str):
         h1 = document.add_heading("癫痫术前评估报告", level=1)
         tighten_paragraph(h1, after=4, before=0)
 
-        p1 = document.add_paragraph(f"患者姓名：{patient.name}")
+        p1 = document.add_paragraph(f"患者姓名：{patient_name}")
         tighten_paragraph(p1, after=0, before=0)
 
-        p2 = document.add_paragraph(f"住院号：{patient.medical_record_number}")
+        p2 = document.add_paragraph(f"住院号：{medical_record_number}")
         tighten_paragraph(p2, after=2, before=0)
 
         for section_title, fields in sections:
@@ -582,10 +1363,10 @@ def generate_patient_info_file(patient, fmt: str):
             spacer = document.add_paragraph("")
             tighten_paragraph(spacer, after=2, before=0)
 
-        document.save(tmp_path)
+        document.save(out_path)
     
     elif fmt == "pdf":
-        c = canvas.Canvas(tmp_path, pagesize=A4)
+        c = canvas.Canvas(out_path, pagesize=A4)
         width, height = A4
         margin = 50
         y = height - margin
@@ -596,8 +1377,8 @@ def generate_patient_info_file(patient, fmt: str):
 
         c.setFont("Helvetica", 10)
         header_lines = [
-            f"患者姓名：{patient.name}",
-            f"住院号：{patient.medical_record_number}",
+            f"患者姓名：{patient_name}",
+            f"住院号：{medical_record_number}",
         ]
         for line in header_lines:
             c.drawString(margin, y, line)
@@ -630,6 +1411,47 @@ def generate_patient_info_file(patient, fmt: str):
 
         c.save()
 
+
+def generate_patient_info_file(patient, fmt: str, force: bool = False):
+    """
+    生成患者信息文件并写入 PatientInfoFile 表。
+    患者自上次导出后没有修改过（且导出版本未变）时直接复用已有文件；force=True 强制重新生成。
+    返回 (final_path, download_filename, fmt_enum)
+    """
+    fmt = fmt.lower()
+    if fmt not in PATIENT_EXPORT_FORMATS:
+        raise ValueError("未知导出格式")
+    fmt_enum, ext = PATIENT_EXPORT_FORMATS[fmt]
+
+    if not force:
+        cached = get_cached_patient_info_file(patient, fmt)
+        if cached:
+            return cached
+
+    base_dir = getattr(settings, "LARGE_FILE_BASE_DIR", settings.BASE_DIR / "large_files")
+    parent_path = f"info/{patient.id}"
+    abs_dir = os.path.join(base_dir, parent_path)
+    os.makedirs(abs_dir, exist_ok=True)
+
+    # 删除旧文件
+    old_qs = PatientInfoFile.objects.filter(patient=patient, format=fmt_enum)
+    for old in old_qs:
+        old_path = os.path.join(base_dir, old.parent_path, old.save_name)
+        if os.path.exists(old_path):
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+    old_qs.delete()
+
+    sections = build_patient_sections(patient)
+    # 临时文件名唯一，避免页面导出与预生成命令同时写同一个文件
+    fd, tmp_path = tempfile.mkstemp(prefix="tmp_patient_info_", suffix=f".{ext}", dir=abs_dir)
+    os.close(fd)
+
+    render_patient_report(out_path=tmp_path, fmt=fmt, patient_name=patient.name,
+                          medical_record_number=patient.medical_record_number, sections=sections)
+
     # hash & rename
     md5 = hashlib.md5()
     sha256 = hashlib.sha256()
@@ -657,7 +1479,498 @@ def generate_patient_info_file(patient, fmt: str):
         file_name=display_name,
         hash_code=hash_code,
         sha256_code=sha256_code,
+        patient_updated_at=patient.updated_at,
+        export_version=PATIENT_EXPORT_VERSION,
     )
 
     download_filename = f"{display_name}.{ext}"
     return final_path, download_filename, fmt_enum
+
+
+# =======================
+#  批量导出 CSV（流式）
+# =======================
+
+# 每次从数据库取多少行；同时也是每个响应块包含的行数
+PATIENT_CSV_EXPORT_CHUNK_SIZE = getattr(settings, "PATIENT_CSV_EXPORT_CHUNK_SIZE", 2000)
+
+
+def _export_cell(value):
+    """
+    单个单元格（已翻译）：None -> ''，日期 -> YYYY-MM-DD。
+    """
+    if value is None:
+        return ""
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.strftime("%Y-%m-%d")
+    return value
+
+
+def iter_patient_export_csv(queryset, chunk_size=None):
+    """
+    流式生成患者信息 CSV（bytes），供 StreamingHttpResponse 使用。
+
+    - 只取 FIELDS_FOR_EXPORT 中的列（values_list），用 iterator(chunk_size) 分批读库，内存占用与总行数无关
+    - code 用统一翻译器（labels.py）按列预先确定的查表方式翻译成中文
+    - 第一块带 UTF-8 BOM，Excel 打开中文不乱码
+    """
+    chunk_size = chunk_size or PATIENT_CSV_EXPORT_CHUNK_SIZE
+    field_names = [name for name, _ in FIELDS_FOR_EXPORT]
+    translate = get_label_translator().row_translator(field_names)
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def _flush():
+        data = buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate(0)
+        return data
+
+    writer.writerow([label for _, label in FIELDS_FOR_EXPORT])
+    yield "\ufeff".encode("utf-8") + _flush()
+
+    pending = 0
+    for row in queryset.values_list(*field_names).iterator(chunk_size=chunk_size):
+        writer.writerow([_export_cell(v) for v in translate(row)])
+        pending += 1
+        if pending >= chunk_size:
+            yield _flush()
+            pending = 0
+    if pending:
+        yield _flush()
+
+
+# =======================
+#  队列导出（列式，供数据分析）
+# =======================
+
+# 列式导出的列：id + FIELDS_FOR_EXPORT（列名用英文字段名，方便 pandas 使用）
+PATIENT_COLUMNAR_FIELDS = ["id"] + [name for name, _ in FIELDS_FOR_EXPORT]
+
+
+def _columnar_kind(field_name):
+    """
+    字段 -> 列类型：int / float / date / datetime / list（逗号分隔多选）/ str
+    """
+    if field_name in MULTI_CHOICE_MAP:
+        return "list"
+    field = Patient._meta.get_field(field_name)
+    internal = field.get_internal_type()
+    if internal in ("AutoField", "BigAutoField", "IntegerField", "BigIntegerField",
+                    "PositiveIntegerField", "SmallIntegerField", "PositiveSmallIntegerField"):
+        return "int"
+    if internal in ("DecimalField", "FloatField"):
+        return "float"
+    if internal == "DateField":
+        return "date"
+    if internal == "DateTimeField":
+        return "datetime"
+    return "str"
+
+
+def _columnar_value(value, kind, mapping):
+    """
+    单个值转换：空字符串 -> None，Decimal -> float，多选 -> list，labels 模式下 code -> 中文。
+    """
+    if value is None or value == "":
+        return [] if kind == "list" else None
+    if kind == "list":
+        codes = split_codes(value)
+        return [mapping.get(c, c) for c in codes] if mapping else codes
+    if kind == "float":
+        return float(value)
+    if kind == "str" and mapping:
+        return mapping.get(value, value)
+    return value
+
+
+def export_patient_cohort(queryset, out_path, fmt=None, labels=False, chunk_size=None):
+    """
+    把（筛选后的）患者队列导出为列式文件，供 pandas 等分析使用：
+
+    - parquet（需要 pyarrow：pip install pyarrow）：列带类型，Decimal -> float64，日期 -> date32，
+      多选字段 -> list<string>
+    - ndjson：gzip 压缩的 NDJSON，每行一个患者；fmt 为空且未安装 pyarrow 时使用
+    - 分批读库（values_list + iterator），按批写出，内存占用与患者数量无关
+    - labels=False 时保留原始 code（便于统计），True 时翻译为中文
+
+    返回 (fmt, 行数)
+    """
+    chunk_size = chunk_size or PATIENT_CSV_EXPORT_CHUNK_SIZE
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        pa = pq = None
+
+    if fmt is None:
+        fmt = "parquet" if pa is not None else "ndjson"
+    if fmt == "parquet" and pa is None:
+        raise ValueError("导出 Parquet 需要安装 pyarrow")
+    if fmt not in ("parquet", "ndjson"):
+        raise ValueError("未知导出格式")
+
+    fields = PATIENT_COLUMNAR_FIELDS
+    kinds = [_columnar_kind(name) for name in fields]
+    # 不翻译时 mapping 全部为空，多选字段仍按 kind 拆成 list
+    if labels:
+        translator = get_label_translator()
+        tables = [translator.table(name) for name in fields]
+    else:
+        tables = [None] * len(fields)
+    rows = queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+
+    total = 0
+    if fmt == "ndjson":
+        with gzip.open(out_path, "wt", encoding="utf-8") as f:
+            for row in rows:
+                record = {}
+                for name, kind, mapping, value in zip(fields, kinds, tables, row):
+                    value = _columnar_value(value, kind, mapping)
+                    if kind in ("date", "datetime") and value is not None:
+                        value = value.isoformat()
+                    record[name] = value
+                f.write(json.dumps(record, ensure_ascii=False))
+                f.write("\n")
+                total += 1
+        return fmt, total
+
+    arrow_types = {
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "date": pa.date32(),
+        "datetime": pa.timestamp("us", tz="UTC"),
+        "list": pa.list_(pa.string()),
+        "str": pa.string(),
+    }
+    schema = pa.schema([pa.field(name, arrow_types[kind]) for name, kind in zip(fields, kinds)])
+
+    def _write(writer, columns):
+        writer.write_table(pa.Table.from_arrays(
+            [pa.array(col, type=schema.field(i).type) for i, col in enumerate(columns)],
+            schema=schema,
+        ))
+
+    with pq.ParquetWriter(out_path, schema) as writer:
+        columns = [[] for _ in fields]
+        for row in rows:
+            for i, (kind, mapping, value) in enumerate(zip(kinds, tables, row)):
+                columns[i].append(_columnar_value(value, kind, mapping))
+            total += 1
+            if len(columns[0]) >= chunk_size:
+                _write(writer, columns)
+                columns = [[] for _ in fields]
+        if columns[0] or total == 0:
+            _write(writer, columns)
+    return fmt, total
+
+
+# =======================
+#  批量导出报告（多进程）
+# =======================
+
+# 批量导出的子进程数，默认 = CPU 核数（manage.py export_patient_reports）
+PATIENT_REPORT_EXPORT_WORKERS = getattr(settings, "PATIENT_REPORT_EXPORT_WORKERS", None)
+
+# 页面上的批量导出在 gunicorn worker 里执行：子进程数和一次可选的患者数都要限制，
+# 超过上限的导出交给 manage.py export_patient_reports
+PATIENT_REPORT_EXPORT_WEB_WORKERS = getattr(settings, "PATIENT_REPORT_EXPORT_WEB_WORKERS", 2)
+PATIENT_REPORT_EXPORT_WEB_MAX_PATIENTS = getattr(settings, "PATIENT_REPORT_EXPORT_WEB_MAX_PATIENTS", 200)
+
+
+def _render_patient_report_job(job):
+    """
+    子进程入口：渲染一个患者的报告到临时文件，返回 (arcname, 临时文件路径)。
+    """
+    arcname, fmt, patient_name, medical_record_number, sections, tmp_dir = job
+    fd, out_path = tempfile.mkstemp(prefix="report_", suffix=f".{PATIENT_EXPORT_FORMATS[fmt][1]}", dir=tmp_dir)
+    os.close(fd)
+    render_patient_report(out_path, fmt, patient_name, medical_record_number, sections)
+    return arcname, out_path
+
+
+def export_patient_reports(patients, fmt: str, out_file, max_workers=None):
+    """
+    把多个患者的 Word / PDF / CSV 报告打包成一个 zip，写入 out_file（路径或可写文件对象）。
+
+    - 数据库查询和 build_patient_sections 在当前进程完成，子进程只负责 python-docx / reportlab 渲染
+    - 已有且仍然有效的导出文件（见 get_cached_patient_info_file）直接打包，不再渲染
+    - 渲染完成一个就写入 zip 一个，不在内存里攒整个压缩包
+    - 同时在途的任务最多 2 × max_workers 个，其余患者等有任务完成后再查库、提交，内存占用不随患者数增长
+    返回统计 dict：patients / rendered / reused / seconds / patients_per_second
+    """
+    fmt = fmt.lower()
+    if fmt not in PATIENT_EXPORT_FORMATS:
+        raise ValueError("未知导出格式")
+    ext = PATIENT_EXPORT_FORMATS[fmt][1]
+    max_workers = max_workers or PATIENT_REPORT_EXPORT_WORKERS or os.cpu_count() or 1
+
+    max_pending = 2 * max_workers
+
+    start = time.monotonic()
+    total = rendered = reused = 0
+    used_names = set()
+
+    # 进程池按需启动子进程，单个患者时基本没有额外开销
+    pool = ProcessPoolExecutor(max_workers=max_workers) if max_workers > 1 else None
+    try:
+        with tempfile.TemporaryDirectory(prefix="tmp_reports_") as tmp_dir, \
+                zipfile.ZipFile(out_file, "w", zipfile.ZIP_DEFLATED) as zf:
+            pending = set()
+
+            def write_done(futures):
+                nonlocal rendered
+                for future in futures:
+                    arcname, out_path = future.result()
+                    zf.write(out_path, arcname)
+                    os.remove(out_path)
+                    rendered += 1
+
+            for patient in patients:
+                total += 1
+                identifier = (
+                    patient.medical_record_number
+                    or patient.bed_number
+                    or patient.imaging_number
+                    or str(patient.id)
+                )
+                arcname = f"{identifier}-{patient.name}.{ext}"
+                if arcname in used_names:
+                    arcname = f"{identifier}-{patient.name}-{patient.id}.{ext}"
+                used_names.add(arcname)
+
+                cached = get_cached_patient_info_file(patient, fmt)
+                if cached:
+                    zf.write(cached[0], arcname)
+                    reused += 1
+                    continue
+
+                # 边查库边提交，子进程渲染与主进程读库重叠
+                job = (
+                    arcname, fmt, patient.name, patient.medical_record_number,
+                    build_patient_sections(patient), tmp_dir,
+                )
+                if pool is None:
+                    arcname, out_path = _render_patient_report_job(job)
+                    zf.write(out_path, arcname)
+                    os.remove(out_path)
+                    rendered += 1
+                else:
+                    pending.add(pool.submit(_render_patient_report_job, job))
+                    if len(pending) >= max_pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        write_done(done)
+
+            write_done(as_completed(pending))
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+
+    seconds = time.monotonic() - start
+    return {
+        "patients": total,
+        "rendered": rendered,
+        "reused": reused,
+        "seconds": seconds,
+        "patients_per_second": total / seconds if seconds > 0 else 0.0,
+    }
+
+
+# =======================
+#  批量导入患者（CSV / NDJSON）
+# =======================
+
+# 每个事务 bulk_create 多少行
+PATIENT_IMPORT_BATCH_SIZE = getattr(settings, "PATIENT_IMPORT_BATCH_SIZE", 1000)
+
+PATIENT_IMPORT_FORMATS = ("csv", "ndjson")
+
+# 由数据库生成的列，导入文件里有也直接忽略（例如从导出文件回导）
+PATIENT_IMPORT_IGNORED_COLUMNS = {"id", "created_at", "updated_at", "创建时间", "更新时间"}
+
+
+def guess_patient_import_format(filename):
+    name = filename.lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    return "ndjson" if name.endswith((".ndjson", ".jsonl", ".json")) else "csv"
+
+
+def iter_patient_import_rows(binary_stream, fmt, filename=""):
+    """
+    逐行读取导入文件，yield (行号, 行 dict 或 None, 解析错误或 None)。
+    - csv：首行为表头，utf-8（兼容 BOM，即 CSV 导出的文件）
+    - ndjson：每行一个 JSON 对象
+    - 文件名以 .gz 结尾时按 gzip 解压
+    """
+    if fmt not in PATIENT_IMPORT_FORMATS:
+        raise ValueError(f"不支持的导入格式：{fmt}")
+    if filename.lower().endswith(".gz"):
+        binary_stream = gzip.GzipFile(fileobj=binary_stream)
+    text = io.TextIOWrapper(binary_stream, encoding="utf-8-sig", newline="")
+
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+
+    for line_no, line in enumerate(text, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_no, None, f"JSON 解析失败：{e}"
+            continue
+        if not isinstance(row, dict):
+            yield line_no, None, "每行必须是一个 JSON 对象"
+            continue
+        yield line_no, row, None
+
+
+class PatientImportValidator:
+    """
+    用 PatientForm 的字段清洗校验导入行，并构造（未保存的）Patient 实例：
+    - 只实例化一次 PatientForm，每行替换 data / instance 后调用 full_clean，
+      字段 clean、clean_<field>（多选逗号拼接）、clean()、模型 full_clean 都照常执行
+    - 列名可以是字段名、表单标签，或 CSV 导出的中文表头
+    - 选项值可以是 code，也可以是中文标签（导出文件可以直接回导）；多选值按 split_codes 拆分
+    """
+
+    def __init__(self):
+        from .forms import PatientForm
+
+        self.form = PatientForm()
+        fields = self.form.fields
+
+        self.columns = {}
+        for name, label in FIELDS_FOR_EXPORT:
+            if name in fields:
+                self.columns[str(label)] = name
+        for name, field in fields.items():
+            if field.label:
+                self.columns.setdefault(str(field.label), name)
+            self.columns[name] = name
+
+        self.multi_fields = set()
+        self.label_to_code = {}
+        for name, field in fields.items():
+            if getattr(field.widget, "allow_multiple_selected", False):
+                self.multi_fields.add(name)
+            choices = getattr(field, "choices", None)
+            if choices:
+                self.label_to_code[name] = {str(label): str(code) for code, label in choices if code not in (None, "")}
+
+        self.ignored_columns = set()
+
+    def _code(self, name, value):
+        value = str(value).strip()
+        return self.label_to_code.get(name, {}).get(value, value)
+
+    def build_instance(self, row):
+        """返回 (Patient 实例, None) 或 (None, {字段: [错误信息, ...]})。"""
+        data = MultiValueDict()
+        for column, value in row.items():
+            name = self.columns.get(column)
+            if name is None:
+                if column not in PATIENT_IMPORT_IGNORED_COLUMNS:
+                    self.ignored_columns.add(column)
+                continue
+            if value is None:
+                continue
+            if name in self.multi_fields:
+                if isinstance(value, str):
+                    # 导出文件里翻译后的多选值用“，”连接
+                    value = value.replace(MULTI_LABEL_SEPARATOR, ",")
+                data.setlist(name, [self._code(name, code) for code in split_codes(value)])
+            elif name in self.label_to_code:
+                data[name] = self._code(name, value)
+            else:
+                data[name] = value if isinstance(value, str) else str(value)
+
+        form = self.form
+        form.data = data
+        form.is_bound = True
+        form.instance = Patient()
+        form.full_clean()
+        if form._errors:
+            return None, {field: list(messages) for field, messages in form._errors.items()}
+        return form.instance, None
+
+
+class PatientImportInterrupted(Exception):
+    """
+    读文件中途出错（gzip 损坏、CSV 格式错误、编码错误等）。
+    此前已提交的批次不会回滚，created / rows 记录出错前已写入和已读取的行数。
+    """
+
+    def __init__(self, error, created, rows):
+        super().__init__(str(error))
+        self.error = error
+        self.created = created
+        self.rows = rows
+
+
+def import_patients(rows, batch_size=None, dry_run=False):
+    """
+    批量导入患者。rows 为 iter_patient_import_rows 的输出。
+    校验通过的行攒够 batch_size 后在一个事务里 bulk_create；校验失败的行跳过并记录错误。
+    dry_run=True 时只校验不写库。
+    读文件出错时抛 PatientImportInterrupted（带上已提交的行数）。
+    返回统计 dict：rows / created / failed / errors[(行号, 字段, 信息)] / ignored_columns / seconds / rows_per_second
+    """
+    batch_size = batch_size or PATIENT_IMPORT_BATCH_SIZE
+    validator = PatientImportValidator()
+    start = time.monotonic()
+    total = created = failed = 0
+    errors = []
+    batch = []
+
+    def flush():
+        nonlocal created
+        if not batch:
+            return
+        if not dry_run:
+            with transaction.atomic():
+                Patient.objects.bulk_create(batch, batch_size=batch_size)
+        created += len(batch)
+        batch.clear()
+
+    try:
+        for line_no, row, parse_error in rows:
+            total += 1
+            if parse_error:
+                failed += 1
+                errors.append((line_no, "", parse_error))
+                continue
+
+            instance, row_errors = validator.build_instance(row)
+            if row_errors:
+                failed += 1
+                for field, messages in row_errors.items():
+                    for message in messages:
+                        errors.append((line_no, "" if field == "__all__" else field, message))
+                continue
+
+            batch.append(instance)
+            if len(batch) >= batch_size:
+                flush()
+    except (OSError, EOFError, csv.Error, ValueError) as e:
+        # gzip.BadGzipFile 是 OSError，截断的 .gz 是 EOFError，UnicodeDecodeError 是 ValueError；
+        # 没攒满的这一批丢弃
+        raise PatientImportInterrupted(e, created, total) from e
+    flush()
+
+    seconds = time.monotonic() - start
+    return {
+        "rows": total,
+        "created": created,
+        "failed": failed,
+        "errors": errors,
+        "ignored_columns": sorted(validator.ignored_columns),
+        "seconds": seconds,
+        "rows_per_second": total / seconds if seconds > 0 else 0.0,
+    }
@@ -1,4 +1,10 @@
 from epilepsy_portal.generic_views import SearchView
+from epilepsy_portal.search_cache import get_cache, get_visibility_key, make_search_key, search_flight
+
+from api.models import TransferTask
+from api.transfer_tasks import apply_task_document, record_task
+
+from django.conf import settings
 
 from django.middleware import csrf
 from django.urls import reverse
@@ -50,8 +56,17 @@ class TransferUtils(View):
         if task:
             if task.get("data") and task["data"]["status"] != "ACTIVE":
                 return task
-            tc = load_transfer_client(self.request.user)
-            task["data"] = tc.get_task(task["task_id"]).data
+            # Status comes from the TransferTask table, kept current by
+            # manage.py poll_transfer_tasks. Only a task the poller has not
+            # seen yet, or has given up on, is fetched here, once.
+            record = TransferTask.objects.filter(task_id=task["task_id"]).first()
+            if record is None:
+                record = record_task(self.request.user, task["task_id"], subject=self.kwargs["subject"])
+            if not record.data or record.status == TransferTask.UNKNOWN:
+                tc = load_transfer_client(self.request.user)
+                apply_task_document(record, tc.get_task(task["task_id"]).data)
+                record.save()
+            task["data"] = record.data
             self.set_task(task)
             return task
         return {}
@@ -171,3 +186,51 @@ class SliderFacetsMixin:
             facet["filter_high"] = facet_filter.get("to")
             processed.append(facet)
         return processed
+
+
+class CachedSearchMixin:
+    """
+    Cache the search page context for a short time, keyed by index, query,
+    filters, offset, sort, page size and the user's group set (see
+    search_cache.get_visibility_key). Identical searches running at the same
+    time in this process share one upstream call. Error contexts are never
+    cached.
+
+    Put this before SliderFacetsMixin so the processed facets are cached too.
+    """
+
+    def get_search_cache_key(self, index):
+        search_data = {
+            "q": self.query,
+            "filters": self.filters,
+            "offset": self.offset,
+            "sort": self.sort,
+            "limit": self.results_per_page,
+        }
+        return make_search_key(index, search_data, get_visibility_key(self.request.user))
+
+    def get_context_data(self, index):
+        ttl = getattr(settings, "SEARCH_CACHE_TTL", 60)
+        if not ttl:
+            self.search_cache_status = "off"
+            return super().get_context_data(index)
+
+        cache = get_cache()
+        key = self.get_search_cache_key(index)
+        context = cache.get(key)
+        if context is not None:
+            self.search_cache_status = "hit"
+            return context
+
+        def search():
+            context = super(CachedSearchMixin, self).get_context_data(index)
+            if "error" not in context:
+                cache.set(key, context, ttl)
+            return context
+
+        context, shared = search_flight.do(
+            key, search, timeout=getattr(settings, "SEARCH_COALESCE_TIMEOUT", 30)
+        )
+        self.search_cache_status = "coalesced" if shared else "miss"
+        log.debug(f"Search cache {self.search_cache_status} for {index}")
+        return context
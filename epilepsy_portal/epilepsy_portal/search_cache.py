@@ -0,0 +1,103 @@
+"""
+Result cache and request coalescing for Globus Search pages.
+
+Settings (all optional):
+    SEARCH_CACHE_ALIAS         cache used for search results, default "default"
+    SEARCH_CACHE_TTL           seconds to keep a rendered search context, default 60
+    SEARCH_GROUPS_CACHE_TTL    seconds to keep a user's Globus group set, default 600
+    SEARCH_COALESCE_TIMEOUT    seconds a request waits for an identical in-flight
+                               search before searching itself, default 30
+"""
+
+import hashlib
+import json
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+
+from globus_portal_framework.gclients import get_user_groups
+
+log = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key within this process: the
+    first caller runs the function, callers arriving while it runs wait for
+    and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, func, timeout=None):
+        """Returns (result, shared), shared is True if another call produced it."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if call.event.wait(timeout):
+                if call.error is not None:
+                    raise call.error
+                return call.result, True
+            # the leader is taking too long, don't queue behind it forever
+            return func(), False
+
+        try:
+            call.result = func()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+        return call.result, False
+
+
+search_flight = SingleFlight()
+
+
+def get_cache():
+    return caches[getattr(settings, "SEARCH_CACHE_ALIAS", "default")]
+
+
+def get_visibility_key(user):
+    """
+    Which search results a user can see. Users with the same Globus group set
+    share cached results; if the groups cannot be read (e.g. the groups scope
+    was not granted at login), results are cached per user instead.
+    """
+    if not user.is_authenticated:
+        return "public"
+
+    cache = get_cache()
+    key = f"search:groups:{user.pk}"
+    visibility = cache.get(key)
+    if visibility is None:
+        try:
+            group_ids = sorted(group["id"] for group in get_user_groups(user))
+            visibility = "groups:" + hashlib.sha256(",".join(group_ids).encode("utf-8")).hexdigest()
+        except Exception as error:
+            log.debug(f"Could not load groups for user {user.pk}, caching searches per user: {error}")
+            visibility = f"user:{user.pk}"
+        cache.set(key, visibility, getattr(settings, "SEARCH_GROUPS_CACHE_TTL", 600))
+    return visibility
+
+
+def make_search_key(index, search_data, visibility):
+    payload = json.dumps([index, search_data, visibility], sort_keys=True, default=str)
+    return "search:result:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
@@ -73,6 +73,7 @@ INSTALLED_APPS = [
     'rest_framework',
     'social_django',
     "epilepsy",
+    "api",
 ]
 
 MIDDLEWARE = [
@@ -170,6 +171,37 @@ STATIC_URL = '/static/'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Caches
+# "fragments" holds rendered HTML (patient list rows, patient detail panel).
+# Keys carry patient.updated_at, so edits invalidate them without explicit deletes.
+# With FRAGMENT_CACHE_DIR set it also holds serialized patient rows (get_patient_or_404),
+# dropped on save/delete (PATIENT_OBJECT_CACHE_TIMEOUT, default 300 seconds). The row
+# cache is off with the in-memory backend, where a delete cannot reach other workers.
+# Set FRAGMENT_CACHE_DIR to share the cache between worker processes (file based);
+# otherwise each process keeps its own in-memory copy.
+# Hit ratios: python manage.py fragment_cache_stats
+
+FRAGMENT_CACHE_DIR = os.environ.get('FRAGMENT_CACHE_DIR', '')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'epilepsy-default',
+    },
+    'fragments': {
+        'BACKEND': (
+            'epilepsy.fragment_cache.FragmentFileBasedCache' if FRAGMENT_CACHE_DIR
+            else 'epilepsy.fragment_cache.FragmentLocMemCache'
+        ),
+        'LOCATION': FRAGMENT_CACHE_DIR or 'epilepsy-fragments',
+        'TIMEOUT': 3600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 20000,
+            'STATS_DIR': os.path.join(FRAGMENT_CACHE_DIR, 'stats') if FRAGMENT_CACHE_DIR else '',
+        },
+    },
+}
+
 try:
     from .search import *
 except ImportError:
@@ -1,4 +1,4 @@
-from epilepsy_portal.mixins import SliderFacetsMixin
+from epilepsy_portal.mixins import CachedSearchMixin, SliderFacetsMixin
 from epilepsy_portal.generic_views import SearchView
 
 from django.conf import settings
@@ -16,8 +16,8 @@ def landing_page(request):
     return render(request, "globus-portal-framework/v2/landing-page.html", context)
 
 
-class CustomSearch(SliderFacetsMixin, SearchView):
-    """Search with Slider Facets enabled."""
+class CustomSearch(CachedSearchMixin, SliderFacetsMixin, SearchView):
+    """Search with Slider Facets enabled, results cached for a short time."""
     pass
 
 
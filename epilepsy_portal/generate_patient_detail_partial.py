@@ -106,9 +106,9 @@ def generate_detail_template(sections: "OrderedDict[str, list[str]]") -> str:
     lines.append('<div class="card">')
     lines.append('  <div class="card-body">')
     lines.append('    <h4 class="mb-3">{{ patient.name }}</h4>')
-    # ===== 文件预览（仅前三张图片） =====
+    # ===== 文件预览（分页加载缩略图） =====
     lines.append('    <hr class="my-3">')
-    lines.append('    <h5 class="mb-3">文件预览（仅显示前三张图片）</h5>')
+    lines.append('    <h5 class="mb-3">文件预览</h5>')
 
     lines.append('    <div class="row">')
 
@@ -117,19 +117,7 @@ def generate_detail_template(sections: "OrderedDict[str, list[str]]") -> str:
     lines.append('        <div class="border rounded p-2 h-100">')
     lines.append('          <div class="text-muted small mb-2">MRI</div>')
     lines.append('          <div class="row">')
-    lines.append('            {% for f in preview_mri %}')
-    lines.append('              <div class="col-4 mb-2">')
-    lines.append('                <div class="card">')
-    lines.append('                  <img class="card-img-top img-fluid" style="max-height:140px; object-fit:cover;" loading="lazy"')
-    lines.append('                       src="{% url \'epilepsy:patient_file_preview\' \'mri\' f.id %}"')
-    lines.append('                       data-preview-src="{% url \'epilepsy:patient_file_preview\' \'mri\' f.id %}"')
-    lines.append('                       alt="{{ f.file_name }}" title="点击放大">')
-    lines.append('                  <div class="card-body p-2">')
-    lines.append('                    <div class="small text-truncate" title="{{ f.file_name }}">{{ f.file_name }}</div>')
-    lines.append('                  </div>')
-    lines.append('                </div>')
-    lines.append('              </div>')
-    lines.append('            {% empty %}<div class="col-12 text-muted small">暂无可预览图片</div>{% endfor %}')
+    lines.append('            {% include "epilepsy/patient_gallery_items.html" with gallery=preview_mri %}')
     lines.append('          </div>')
     lines.append('        </div>')
     lines.append('      </div>')
@@ -139,19 +127,7 @@ def generate_detail_template(sections: "OrderedDict[str, list[str]]") -> str:
     lines.append('        <div class="border rounded p-2 h-100">')
     lines.append('          <div class="text-muted small mb-2">PET</div>')
     lines.append('          <div class="row">')
-    lines.append('            {% for f in preview_pet %}')
-    lines.append('              <div class="col-4 mb-2">')
-    lines.append('                <div class="card">')
-    lines.append('                  <img class="card-img-top img-fluid" style="max-height:140px; object-fit:cover;" loading="lazy"')
-    lines.append('                       src="{% url \'epilepsy:patient_file_preview\' \'pet\' f.id %}"')
-    lines.append('                       data-preview-src="{% url \'epilepsy:patient_file_preview\' \'pet\' f.id %}"')
-    lines.append('                       alt="{{ f.file_name }}" title="点击放大">')
-    lines.append('                  <div class="card-body p-2">')
-    lines.append('                    <div class="small text-truncate" title="{{ f.file_name }}">{{ f.file_name }}</div>')
-    lines.append('                  </div>')
-    lines.append('                </div>')
-    lines.append('              </div>')
-    lines.append('            {% empty %}<div class="col-12 text-muted small">暂无可预览图片</div>{% endfor %}')
+    lines.append('            {% include "epilepsy/patient_gallery_items.html" with gallery=preview_pet %}')
     lines.append('          </div>')
     lines.append('        </div>')
     lines.append('      </div>')
@@ -161,19 +137,7 @@ def generate_detail_template(sections: "OrderedDict[str, list[str]]") -> str:
     lines.append('        <div class="border rounded p-2 h-100">')
     lines.append('          <div class="text-muted small mb-2">EEG</div>')
     lines.append('          <div class="row">')
-    lines.append('            {% for f in preview_eeg %}')
-    lines.append('              <div class="col-4 mb-2">')
-    lines.append('                <div class="card">')
-    lines.append('                  <img class="card-img-top img-fluid" style="max-height:140px; object-fit:cover;" loading="lazy"')
-    lines.append('                       src="{% url \'epilepsy:patient_file_preview\' \'eeg\' f.id %}"')
-    lines.append('                       data-preview-src="{% url \'epilepsy:patient_file_preview\' \'eeg\' f.id %}"')
-    lines.append('                       alt="{{ f.file_name }}" title="点击放大">')
-    lines.append('                  <div class="card-body p-2">')
-    lines.append('                    <div class="small text-truncate" title="{{ f.file_name }}">{{ f.file_name }}</div>')
-    lines.append('                  </div>')
-    lines.append('                </div>')
-    lines.append('              </div>')
-    lines.append('            {% empty %}<div class="col-12 text-muted small">暂无可预览图片</div>{% endfor %}')
+    lines.append('            {% include "epilepsy/patient_gallery_items.html" with gallery=preview_eeg %}')
     lines.append('          </div>')
     lines.append('        </div>')
     lines.append('      </div>')
@@ -183,19 +147,7 @@ def generate_detail_template(sections: "OrderedDict[str, list[str]]") -> str:
     lines.append('        <div class="border rounded p-2 h-100">')
     lines.append('          <div class="text-muted small mb-2">sEEG</div>')
     lines.append('          <div class="row">')
-    lines.append('            {% for f in preview_seeg %}')
-    lines.append('              <div class="col-4 mb-2">')
-    lines.append('                <div class="card">')
-    lines.append('                  <img class="card-img-top img-fluid" style="max-height:140px; object-fit:cover;" loading="lazy"')
-    lines.append('                       src="{% url \'epilepsy:patient_file_preview\' \'seeg\' f.id %}"')
-    lines.append('                       data-preview-src="{% url \'epilepsy:patient_file_preview\' \'seeg\' f.id %}"')
-    lines.append('                       alt="{{ f.file_name }}" title="点击放大">')
-    lines.append('                  <div class="card-body p-2">')
-    lines.append('                    <div class="small text-truncate" title="{{ f.file_name }}">{{ f.file_name }}</div>')
-    lines.append('                  </div>')
-    lines.append('                </div>')
-    lines.append('              </div>')
-    lines.append('            {% empty %}<div class="col-12 text-muted small">暂无可预览图片</div>{% endfor %}')
+    lines.append('            {% include "epilepsy/patient_gallery_items.html" with gallery=preview_seeg %}')
     lines.append('          </div>')
     lines.append('        </div>')
     lines.append('      </div>')
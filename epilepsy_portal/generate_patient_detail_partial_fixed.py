@@ -144,9 +144,9 @@ def generate_detail_template(sections: "OrderedDict[str, list[str]]") -> str:
     lines.append('  <div class="card-body">')
     lines.append('    <h4 class="mb-3">{{ patient.name }}</h4>')
 
-    # ===== 文件预览（仅前三张图片） =====
+    # ===== 文件预览（分页加载缩略图） =====
     lines.append('    <hr class="my-3">')
-    lines.append('    <h5 class="mb-3">文件预览（仅显示前三张图片）</h5>')
+    lines.append('    <h5 class="mb-3">文件预览</h5>')
     lines.append('    <div class="row">')
 
     def add_preview_block(title: str, var: str, ftype: str):
@@ -154,19 +154,7 @@ def generate_detail_template(sections: "OrderedDict[str, list[str]]") -> str:
         lines.append('        <div class="border rounded p-2 h-100">')
         lines.append(f'          <div class="text-muted small mb-2">{title}</div>')
         lines.append('          <div class="row">')
-        lines.append(f'            {{% for f in {var} %}}')
-        lines.append('              <div class="col-4 mb-2">')
-        lines.append('                <div class="card">')
-        lines.append('                  <img class="card-img-top img-fluid" style="max-height:140px; object-fit:cover;" loading="lazy"')
-        lines.append(f'                       src="{{% url \'epilepsy:patient_file_preview\' \'{ftype}\' f.id %}}"')
-        lines.append(f'                       data-preview-src="{{% url \'epilepsy:patient_file_preview\' \'{ftype}\' f.id %}}"')
-        lines.append('                       alt="{{ f.file_name }}" title="点击放大">')
-        lines.append('                  <div class="card-body p-2">')
-        lines.append('                    <div class="small text-truncate" title="{{ f.file_name }}">{{ f.file_name }}</div>')
-        lines.append('                  </div>')
-        lines.append('                </div>')
-        lines.append('              </div>')
-        lines.append(f'            {{% empty %}}<div class="col-12 text-muted small">暂无可预览图片</div>{{% endfor %}}')
+        lines.append(f'            {{% include "epilepsy/patient_gallery_items.html" with gallery={var} %}}')
         lines.append('          </div>')
         lines.append('        </div>')
         lines.append('      </div>')